@@ -7,6 +7,7 @@ from dal import autocomplete
 # from employees.models import Employee
 from common.mixins import CrispyFormMixin
 from clients.models import Client
+from dicts.forms import DictChoiceField
 from .models import Budget 
 
 
@@ -17,6 +18,7 @@ class BudgetForm(CrispyFormMixin, forms.ModelForm):
         fields = [
             'name', 'description', 'value', 'currency', 'is_active'
         ]
+        field_classes = {'currency': DictChoiceField}
 
     def __init__(self, *args, **kwargs):
         # super(ProjectForm, self).__init__(*args, **kwargs)  
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+from utils.normalize import make_search_key
+
+
+def fill_search_key(apps, schema_editor):
+    Budget = apps.get_model('budgets', 'Budget')
+    rows = list(Budget.objects.all())
+    for row in rows:
+        row.search_key = make_search_key(row.name)
+    Budget.objects.bulk_update(rows, ['search_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0002_remove_budget_valid_from_remove_budget_valid_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='search_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_search_key, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,29 @@
 from django.db import models
 from django.urls import reverse, reverse_lazy
-from common.models import TrackableModel
+from common.models import SearchKeyModel, TrackableModel
 from dicts import models as dicts
 
 # Create your models here.
-class Budget(TrackableModel):
+class BudgetQuerySet(models.QuerySet):
+    def for_list(self):
+        # The currency is resolved from the dictionary cache
+        return self
+
+
+class Budget(TrackableModel, SearchKeyModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     value = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.ForeignKey(dicts.Currency, on_delete=models.PROTECT)
     is_active = models.BooleanField(default=True)    
+
+    objects = BudgetQuerySet.as_manager()
     
     def __str__(self):
         return self.name
+
+    def get_search_key_parts(self):
+        return [self.name]
     
     def get_absolute_url(self): return reverse("budgets:budget-detail", kwargs={'pk': self.pk})
     def get_update_url(self): return reverse("budgets:budget-update", kwargs={'pk': self.pk})
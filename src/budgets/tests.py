@@ -1,3 +1,13 @@
 from django.test import TestCase
 
-# Create your tests here.
+from common.testing import ListQueryCountMixin
+from .models import Budget
+
+
+class ListQueryCountTests(ListQueryCountMixin, TestCase):
+    def add_budgets(self, count):
+        for _ in range(count):
+            Budget.objects.create(name=f'Budget {Budget.objects.count()}', value=1000, currency=self.currency)
+
+    def test_budget_list(self):
+        self.assertConstantQueries(Budget.list_active_budgets_url(), self.add_budgets)
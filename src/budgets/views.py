@@ -8,7 +8,8 @@ from django.shortcuts import get_object_or_404, redirect, render
 from dal import autocomplete
 
 
-from common.mixins import BreadcrumbsAndButtonsMixin
+from common.autocomplete import SearchKeyAutocomplete
+from common.mixins import BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin
 from common.helpers import Buttons as Btn
 
 from .models import Budget
@@ -16,9 +17,19 @@ from .forms import BudgetForm
 
 
 
-class BudgetList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.ListView):
+class BudgetList(BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, PermissionRequiredMixin, generic.ListView):
     permission_required = 'budgets.view_budget'
     model = Budget
+    rows_template_name = 'budgets/budget_list_rows.html'
+    sort_fields = {'name': 'name', 'value': 'value'}
+    default_sort = 'name'
+    export_fields = [
+        ('Name', 'name'),
+        ('Value', 'value'),
+        ('Currency', 'currency__code'),
+        ('Active', 'is_active'),
+        ('Description', 'description'),
+    ]
 
     def set_breadcrumbs(self):
         self.breadcrumbs.add(**Budget.get_cls_breadcrumb())
@@ -31,11 +42,12 @@ class BudgetList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.Li
             self.top_buttons.append(Btn.Link('Only active', Budget.list_active_budgets_url(), css_class= 'outline-primary', icon='eye-off'))
         if self.request.user.has_perm('projects.add_project'):
             self.top_buttons.append(Btn.Link('Add budget', Budget.get_create_url(), css_class= 'outline-success', icon='plus'))
+        self.top_buttons.extend(self.get_export_buttons())
 
     def get_queryset(self):
         if self.kwargs.get('all', False):
-            return self.model.objects.all()
-        return self.model.objects.filter(is_active=True)
+            return self.model.objects.for_list()
+        return self.model.objects.for_list().filter(is_active=True)
     
     
     def get_context_data(self, **kwargs):
@@ -70,9 +82,8 @@ class BudegetCreate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, Success
         form.current_user = self.request.user.employee
         return super().form_valid(form)
     
-class BudgetAutocomplete(LoginRequiredMixin, autocomplete.Select2QuerySetView):
+class BudgetAutocomplete(SearchKeyAutocomplete):
+    model = Budget
+
     def get_queryset(self):
-        qs = Budget.objects.all().filter(is_active=True)
-        if self.q:
-            qs = qs.filter(models.Q(name__icontains=self.q))
-        return qs
\ No newline at end of file
+        return Budget.objects.filter(is_active=True)
\ No newline at end of file
@@ -1,7 +1,15 @@
 from django.contrib import admin
+from dicts.tree import get_dimension_tree
 from .models import Client, Contract, ContractItem, SalesInvoice
 
+class ContractItemAdmin(admin.ModelAdmin):
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_manytomany(db_field, request, **kwargs)
+        if db_field.name == 'dimension':
+            formfield.choices = get_dimension_tree().get_all_indented_choices()
+        return formfield
+
 admin.site.register(Client)
 admin.site.register(Contract)
-admin.site.register(ContractItem)
+admin.site.register(ContractItem, ContractItemAdmin)
 admin.site.register(SalesInvoice)
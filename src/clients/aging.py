@@ -0,0 +1,136 @@
+"""
+Receivables aging: the amount of sales invoices outstanding on a date per client, contract and
+currency, split by days past due into the BUCKETS.
+
+An invoice is outstanding on as_of when it was issued by then and not paid by then (unpaid, or
+paid_date after as_of), so reports for past dates are exact as long as paid dates are recorded.
+Like InvoiceQuerySet.overdue(), an invoice due on as_of counts as overdue. The report is a single
+grouped query; nightly copies are kept in AgingSnapshot (see the snapshot_aging command) so aging
+trends and past days are read instead of recomputed. Today is always computed live, invoices are
+still issued and paid after its snapshot.
+"""
+import datetime
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+
+# (field, label, first day past due, last day past due)
+BUCKETS = [
+    ('current', 'Current', None, -1),
+    ('days_1_30', '1-30', 0, 30),
+    ('days_31_60', '31-60', 31, 60),
+    ('days_61_90', '61-90', 61, 90),
+    ('days_over_90', '90+', 91, None),
+]
+BUCKET_FIELDS = [field for field, label, first, last in BUCKETS]
+AMOUNT_FIELDS = BUCKET_FIELDS + ['total']
+
+
+def get_model(name):
+    return apps.get_model('clients', name)
+
+
+def bucket_sum(as_of, first, last):
+    # Days past due between first and last means a due date between as_of - last and as_of - first
+    condition = Q()
+    if first is not None:
+        condition &= Q(due_date__lte=as_of - datetime.timedelta(days=first))
+    if last is not None:
+        condition &= Q(due_date__gte=as_of - datetime.timedelta(days=last))
+    return Sum(Case(When(condition, then=F('value')), default=Value(0),
+                    output_field=DecimalField(max_digits=14, decimal_places=2)))
+
+
+def outstanding(as_of):
+    return (get_model('SalesInvoice').objects
+            .filter(date__lte=as_of)
+            .filter(Q(is_paid=False) | Q(paid_date__gt=as_of)))
+
+
+def report(as_of):
+    """
+    Aging rows outstanding on as_of, one dictionary per client, contract and currency (its id under
+    'currency'), ordered by client, contract and currency.
+    """
+    buckets = {field: bucket_sum(as_of, first, last) for field, label, first, last in BUCKETS}
+    return (outstanding(as_of)
+            .values('currency',
+                    client_id=F('contract_item__contract__client_id'),
+                    client_name=F('contract_item__contract__client__name'),
+                    contract_id=F('contract_item__contract_id'),
+                    contract_number=F('contract_item__contract__number'),
+                    contract_name=F('contract_item__contract__name'),
+                    currency_code=F('currency__code'))
+            .annotate(**buckets, total=Sum('value'))
+            .order_by('client_name', 'contract_number', 'currency_code'))
+
+
+def snapshot_rows(as_of):
+    """
+    Stored aging rows of as_of in the shape of report().
+    """
+    return (get_model('AgingSnapshot').objects
+            .filter(as_of=as_of)
+            .values('client_id', 'contract_id', 'currency', *AMOUNT_FIELDS,
+                    client_name=F('client__name'),
+                    contract_number=F('contract__number'),
+                    contract_name=F('contract__name'),
+                    currency_code=F('currency__code'))
+            .order_by('client_name', 'contract_number', 'currency_code'))
+
+
+def get_rows(as_of):
+    """
+    (rows, from_snapshot) for as_of, read from the snapshot of that day when there is one and the day is over.
+    """
+    AgingSnapshot = get_model('AgingSnapshot')
+    if as_of < datetime.date.today() and AgingSnapshot.objects.filter(as_of=as_of).exists():
+        return snapshot_rows(as_of), True
+    return report(as_of), False
+
+
+def get_totals(rows):
+    """
+    Bucket totals per currency code of aging rows.
+    """
+    totals = {}
+    for row in rows:
+        currency_totals = totals.setdefault(row['currency_code'], dict.fromkeys(AMOUNT_FIELDS, 0))
+        for field in AMOUNT_FIELDS:
+            currency_totals[field] += row[field]
+    return dict(sorted(totals.items()))
+
+
+def get_trend(limit=12):
+    """
+    Bucket totals per currency of the latest `limit` snapshots: [(as_of, {currency_code: totals})], newest first.
+    """
+    AgingSnapshot = get_model('AgingSnapshot')
+    dates = list(AgingSnapshot.objects.values_list('as_of', flat=True).distinct().order_by('-as_of')[:limit])
+    rows = (AgingSnapshot.objects
+            .filter(as_of__in=dates)
+            .values('as_of', currency_code=F('currency__code'))
+            .annotate(**{f'sum_{field}': Sum(field) for field in AMOUNT_FIELDS})
+            .order_by('-as_of', 'currency_code'))
+    trend = {as_of: {} for as_of in dates}
+    for row in rows:
+        trend[row['as_of']][row['currency_code']] = {field: row[f'sum_{field}'] for field in AMOUNT_FIELDS}
+    return list(trend.items())
+
+
+def snapshot(as_of=None):
+    """
+    Store the aging rows of as_of, replacing an earlier snapshot of the same day. Returns the number of rows.
+    """
+    AgingSnapshot = get_model('AgingSnapshot')
+    as_of = as_of or datetime.date.today()
+    snapshots = [
+        AgingSnapshot(as_of=as_of, client_id=row['client_id'], contract_id=row['contract_id'],
+                      currency_id=row['currency'], **{field: row[field] for field in AMOUNT_FIELDS})
+        for row in report(as_of)
+    ]
+    with transaction.atomic():
+        AgingSnapshot.objects.filter(as_of=as_of).delete()
+        AgingSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
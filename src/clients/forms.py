@@ -9,7 +9,9 @@ from .models import Client, Contract, ContractItem, SalesInvoice
 # from employees.models import Employee
 
 from common.mixins import CrispyFormMixin
-from dicts.models import Currency, Dimension
+from dicts.forms import DictChoiceField
+from dicts.models import Currency
+from dicts.tree import get_dimension_tree
 
 
 class ClientForm(forms.ModelForm):
@@ -81,12 +83,12 @@ class ContractForm(CrispyFormMixin, forms.ModelForm):
     
 
 class ContractItemForm(CrispyFormMixin, forms.ModelForm):
-    dimension_fields = []
     contract = Contract()
 
     class Meta:
         model = ContractItem
         fields = ['name', 'value', 'currency']
+        field_classes = {'currency': DictChoiceField}
 
     def __init__(self, *args, **kwargs):
         # Retrieve the instance if editing an existing ContractItem
@@ -94,25 +96,26 @@ class ContractItemForm(CrispyFormMixin, forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         self.contract = self.initial.pop('contract', None)
-        dimension_category = {}
+        self.dimension_fields = []
+        selected_by_top_level = {}
         if instance:
-            dimension_category = instance.get_dimension_category()
+            selected_by_top_level = {top_level.pk: dimension_id for top_level, dimension_id in instance.get_dimension_category().items()}
 
         self.helper.layout = Layout('name', 'value', 'currency',)
-        # Get top-level dimensions (dimensions without a parent)
-        top_level_dimensions = Dimension.objects.filter(parent__isnull=True)
+        # The whole dimension tree is loaded once and cached, see dicts.tree
+        dimension_tree = get_dimension_tree()
 
         # Dynamically create a dropdown for each top-level dimension
-        for dimension in top_level_dimensions:
+        for dimension in dimension_tree.top_level():
             field_name = dimension.name.lower()
             self.dimension_fields.append(field_name)
 
             self.fields[field_name] = forms.ChoiceField(
-                choices=self.get_indented_category_choices(dimension),
+                choices=dimension_tree.get_indented_choices(dimension.id),
                 required=False,
                 label=dimension.name,
                 widget=forms.Select,
-                initial=dimension_category.get(dimension, None)
+                initial=selected_by_top_level.get(dimension.id, None)
             )
 
             # Add the field to the crispy layout
@@ -126,23 +129,6 @@ class ContractItemForm(CrispyFormMixin, forms.ModelForm):
             )
         )
 
-    def get_indented_category_choices(self, parent_dimension):
-        """
-        Recursively retrieve dimensions in a parent-child sorted order.
-        """
-        def get_children_sorted(dimension, level=0):
-            children = Dimension.objects.filter(parent=dimension).order_by('name')
-            result = []
-            for child in children:
-                element = (child.id, f"{'- ' * (level * 1)}{child.name}")
-                result.append(element)
-                result.extend(get_children_sorted(child, level + 1))
-            return result
-
-        # Initialize the result list
-        result = get_children_sorted(parent_dimension)
-        return [(None, '---------')] + result  # Add a blank choice at the top
-
     def save(self, current_user, commit=True):
         # Custom save logic to handle ManyToMany relationship for dimensions
         contract_item = super().save(commit=False)
@@ -152,13 +138,9 @@ class ContractItemForm(CrispyFormMixin, forms.ModelForm):
         if commit:
             contract_item.save(current_user=current_user)
 
-        # Clear the existing dimensions and add the selected ones
-        contract_item.dimension.clear()
-        for field_name in self.dimension_fields:
-            selected_dimension_id = self.cleaned_data.get(field_name)
-            if selected_dimension_id:
-                selected_dimension = Dimension.objects.get(id=selected_dimension_id)
-                contract_item.dimension.add(selected_dimension)
+        # Replace the existing dimensions with the selected ones
+        selected_dimension_ids = [self.cleaned_data[field_name] for field_name in self.dimension_fields if self.cleaned_data.get(field_name)]
+        contract_item.dimension.set(selected_dimension_ids)
 
         return contract_item
 
@@ -167,6 +149,7 @@ class SalesInvoiceForm(CrispyFormMixin, forms.ModelForm):
     class Meta:
         model = SalesInvoice
         fields = ['number', 'date', 'due_date', 'value', 'currency', 'is_paid', 'paid_date', 'contract_item', 'file']
+        field_classes = {'currency': DictChoiceField}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -242,3 +225,64 @@ class SalesInvoiceSettleForm(CrispyFormMixin, forms.ModelForm):
         if commit:
             invoice.save(current_user=current_user)
         return invoice
+
+
+class SalesInvoiceImportForm(CrispyFormMixin, forms.Form):
+    csv_file = forms.FileField(label='CSV file', help_text='Columns: number, date, due_date, value, currency, '
+                               'contract_item, and optionally is_paid, paid_date, file.')
+    attachments = forms.FileField(required=False, help_text='Zip archive with the PDFs named in the file column.')
+    dry_run = forms.BooleanField(required=False, label='Only validate', initial=False)
+
+    def __init__(self, *args, **kwargs):
+        self.contract = kwargs.pop('contract')
+        super().__init__(*args, **kwargs)
+        self.fields['csv_file'].widget.attrs['accept'] = '.csv,text/csv'
+        self.fields['attachments'].widget.attrs['accept'] = '.zip,application/zip'
+        self.helper.layout = Layout(
+            'csv_file',
+            'attachments',
+            'dry_run',
+            FormActions(
+                Submit('submit', 'Import', css_class='btn btn-primary btn-sm'),
+                HTML(f'<a class="btn btn-outline-primary btn-sm" href="{self.contract.get_absolute_url()}">Cancel</a>')
+            ),
+        )
+
+
+class SalesInvoiceBulkForm(forms.Form):
+    """
+    Action applied at once to the invoices selected on the invoice list of a contract.
+    """
+    SETTLE = 'settle'
+    REASSIGN = 'reassign'
+    DELETE = 'delete'
+    ACTIONS = [(SETTLE, 'Settle'), (REASSIGN, 'Move to contract item'), (DELETE, 'Delete')]
+
+    action = forms.ChoiceField(choices=ACTIONS)
+    ids = forms.Field(widget=forms.MultipleHiddenInput, required=False)
+    paid_date = forms.DateField(required=False)
+    contract_item = forms.ModelChoiceField(queryset=ContractItem.objects.none(), required=False)
+
+    def __init__(self, *args, **kwargs):
+        self.contract = kwargs.pop('contract')
+        super().__init__(*args, **kwargs)
+        self.fields['contract_item'].queryset = ContractItem.objects.filter(contract=self.contract)
+        self.fields['paid_date'].widget.input_type = 'date'
+
+    def clean_ids(self):
+        try:
+            ids = {int(value) for value in self.cleaned_data['ids'] or []}
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Invalid invoice selection.')
+        if not ids:
+            raise forms.ValidationError('Select at least one invoice.')
+        return sorted(ids)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == self.SETTLE and not cleaned_data.get('paid_date'):
+            self.add_error('paid_date', 'Paid date is required to settle invoices.')
+        if action == self.REASSIGN and not cleaned_data.get('contract_item'):
+            self.add_error('contract_item', 'Choose the contract item to move the invoices to.')
+        return cleaned_data
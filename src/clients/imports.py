@@ -0,0 +1,221 @@
+"""
+Bulk import of sales invoices from a CSV file, with the invoice PDFs in a folder or a zip archive.
+
+Rows are validated together: the referenced contract items are read with one query, currencies
+come from the dictionary cache and the invoices that already exist with one more query. Valid
+rows are written with bulk_create() in a single transaction. An invoice is identified by its
+number and contract item, so importing the same file twice creates nothing the second time.
+
+CSV columns: number, date, due_date, value, currency (code), contract_item (id), and optionally
+is_paid, paid_date and file (name of the PDF in the folder or archive).
+"""
+import csv
+import io
+import os
+import zipfile
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from common import search
+from common.cache import bump_model_generation
+from dicts.models import Currency
+from . import statistics
+from .models import ContractItem, SalesInvoice
+
+REQUIRED_COLUMNS = ['number', 'date', 'due_date', 'value', 'currency', 'contract_item']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class InvalidImportFile(Exception):
+    """
+    The file as a whole cannot be imported, e.g. it is not a CSV or a required column is missing.
+    """
+
+
+class DirectoryFiles:
+    def __init__(self, path):
+        self.path = path
+
+    def __contains__(self, name):
+        return os.path.isfile(os.path.join(self.path, os.path.basename(name)))
+
+    def read(self, name):
+        with open(os.path.join(self.path, os.path.basename(name)), 'rb') as file:
+            return file.read()
+
+
+class ZipFiles:
+    """
+    PDFs from a zip archive, matched by file name regardless of the folders inside the archive.
+    """
+    def __init__(self, file):
+        try:
+            self.archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            raise InvalidImportFile("The attachments are not a valid zip archive.")
+        self.names = {os.path.basename(info.filename): info.filename
+                      for info in self.archive.infolist() if not info.is_dir()}
+
+    def __contains__(self, name):
+        return os.path.basename(name) in self.names
+
+    def read(self, name):
+        return self.archive.read(self.names[os.path.basename(name)])
+
+
+def open_files(source):
+    """
+    Attachment source for a folder path, a path to a zip archive or an uploaded zip file.
+    """
+    if source is None:
+        return None
+    if isinstance(source, str) and os.path.isdir(source):
+        return DirectoryFiles(source)
+    return ZipFiles(source)
+
+
+@dataclass
+class RowError:
+    line: int
+    number: str
+    message: str
+
+    def __str__(self):
+        return f"Line {self.line} ({self.number or 'no number'}): {self.message}"
+
+
+@dataclass
+class ImportResult:
+    created: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+class SalesInvoiceImporter:
+    batch_size = 500
+
+    def __init__(self, current_user=None, contract=None, files=None):
+        """
+        When contract is given, rows may only reference items of that contract.
+        """
+        self.current_user = current_user
+        self.contract = contract
+        self.files = files
+
+    def read_rows(self, csv_file):
+        if isinstance(csv_file, bytes):
+            csv_file = csv_file.decode('utf-8-sig')
+        if isinstance(csv_file, str):
+            csv_file = io.StringIO(csv_file)
+        sample = csv_file.read(4096)
+        csv_file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(csv_file, dialect=dialect)
+        columns = [column.strip().lower() for column in reader.fieldnames or []]
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise InvalidImportFile(f"Missing columns: {', '.join(missing)}.")
+        reader.fieldnames = columns
+        # Line 1 is the header
+        return [(line, {key: (value or '').strip() for key, value in row.items() if key})
+                for line, row in enumerate(reader, start=2)]
+
+    def get_contract_items(self, rows):
+        ids = {row['contract_item'] for line, row in rows if row['contract_item'].isdigit()}
+        queryset = ContractItem.objects.filter(pk__in=ids).select_related('contract')
+        if self.contract is not None:
+            queryset = queryset.filter(contract=self.contract)
+        return {str(item.pk): item for item in queryset}
+
+    def get_existing(self, rows, contract_items):
+        numbers = {row['number'] for line, row in rows}
+        return set(SalesInvoice.objects.filter(number__in=numbers, contract_item__in=contract_items.values())
+                   .values_list('number', 'contract_item_id'))
+
+    def parse(self, field_name, value):
+        return SalesInvoice._meta.get_field(field_name).to_python(value)
+
+    def build_invoice(self, row, contract_items, currencies):
+        """
+        Unsaved SalesInvoice for a CSV row; raises ValidationError with a message for the user.
+        """
+        if not row['number']:
+            raise ValidationError("Invoice number is missing.")
+        contract_item = contract_items.get(row['contract_item'])
+        if contract_item is None:
+            raise ValidationError(f"Unknown contract item \"{row['contract_item']}\".")
+        currency = currencies.get(row['currency'].upper())
+        if currency is None:
+            raise ValidationError(f"Unknown currency \"{row['currency']}\".")
+
+        invoice = SalesInvoice(number=row['number'], contract_item=contract_item, currency=currency,
+                               created_by=self.current_user, updated_by=self.current_user)
+        for field_name in ('date', 'due_date', 'value'):
+            if not row[field_name]:
+                raise ValidationError(f"{SalesInvoice._meta.get_field(field_name).verbose_name.capitalize()} is missing.")
+            setattr(invoice, field_name, self.parse(field_name, row[field_name]))
+        invoice.is_paid = row.get('is_paid', '').lower() in TRUE_VALUES
+        invoice.paid_date = self.parse('paid_date', row.get('paid_date') or None) if invoice.is_paid else None
+        if invoice.is_paid and not invoice.paid_date:
+            raise ValidationError("Paid date is required if the invoice is marked as paid.")
+        invoice.full_clean(exclude=['contract_item', 'currency', 'file', 'created_by', 'updated_by'],
+                           validate_unique=False)
+
+        file_name = row.get('file')
+        if file_name:
+            if self.files is None or file_name not in self.files:
+                raise ValidationError(f"File \"{file_name}\" not found in the attachments.")
+            # Read when the batch is written, so only one batch of PDFs is held in memory
+            invoice.import_file_name = file_name
+        return invoice
+
+    def attach_files(self, invoices):
+        for invoice in invoices:
+            file_name = getattr(invoice, 'import_file_name', None)
+            if file_name:
+                invoice.file = ContentFile(self.files.read(file_name), name=os.path.basename(file_name))
+
+    def run(self, csv_file, dry_run=False):
+        rows = self.read_rows(csv_file)
+        contract_items = self.get_contract_items(rows)
+        currencies = Currency.get_by_code()
+        existing = self.get_existing(rows, contract_items)
+
+        result = ImportResult()
+        seen = set()
+        for line, row in rows:
+            key = (row['number'], contract_items[row['contract_item']].pk) if row['contract_item'] in contract_items else None
+            if key in existing:
+                result.skipped.append(row['number'])
+                continue
+            if key is not None and key in seen:
+                result.errors.append(RowError(line, row['number'], "Duplicated in the file."))
+                continue
+            try:
+                invoice = self.build_invoice(row, contract_items, currencies)
+            except ValidationError as error:
+                result.errors.append(RowError(line, row['number'], ' '.join(error.messages)))
+                continue
+            seen.add(key)
+            result.created.append(invoice)
+
+        if result.created and not dry_run:
+            with transaction.atomic():
+                for start in range(0, len(result.created), self.batch_size):
+                    batch = result.created[start:start + self.batch_size]
+                    self.attach_files(batch)
+                    SalesInvoice.objects.bulk_create(batch)
+                    for invoice in batch:
+                        # Keep the stored name only, dropping the file content
+                        invoice.file = invoice.file.name
+                    # bulk_create() bypasses save(), which keeps the search index up to date
+                    search.index_queryset(SalesInvoice.objects.filter(pk__in=[invoice.pk for invoice in batch]))
+                statistics.refresh_on_commit({invoice.contract_item.contract.client_id for invoice in result.created})
+                bump_model_generation(SalesInvoice)
+        return result
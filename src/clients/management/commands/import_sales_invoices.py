@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.imports import InvalidImportFile, SalesInvoiceImporter, open_files
+from clients.models import Contract
+from employees.models import Employee
+
+
+class Command(BaseCommand):
+    help = "Import sales invoices from a CSV file, with their PDFs in a folder or a zip archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="CSV with the columns number, date, due_date, value, currency, "
+                                             "contract_item and optionally is_paid, paid_date, file.")
+        parser.add_argument('--files', help="Folder or zip archive with the PDFs named in the file column.")
+        parser.add_argument('--contract', help="Slug of the contract the invoices must belong to.")
+        parser.add_argument('--user', help="Slug of the employee recorded as the author.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without writing anything.")
+
+    def handle(self, *args, **options):
+        contract = None
+        if options['contract']:
+            contract = Contract.objects.filter(slug=options['contract']).first()
+            if contract is None:
+                raise CommandError(f"Contract \"{options['contract']}\" does not exist.")
+        current_user = None
+        if options['user']:
+            current_user = Employee.objects.filter(slug=options['user']).first()
+            if current_user is None:
+                raise CommandError(f"Employee \"{options['user']}\" does not exist.")
+
+        try:
+            with open(options['csv_file'], encoding='utf-8-sig', newline='') as csv_file:
+                importer = SalesInvoiceImporter(current_user=current_user, contract=contract,
+                                                files=open_files(options['files']))
+                result = importer.run(csv_file, dry_run=options['dry_run'])
+        except (OSError, InvalidImportFile) as error:
+            raise CommandError(error)
+
+        for error in result.errors:
+            self.stderr.write(str(error))
+        verb = "to create" if options['dry_run'] else "created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.created)} invoices {verb}, {len(result.skipped)} already imported, {len(result.errors)} errors."
+        ))
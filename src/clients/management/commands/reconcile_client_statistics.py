@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clients import statistics
+
+
+class Command(BaseCommand):
+    help = ("Recompute the denormalized counters and receivables of every client from their contracts, "
+            "contract items and sales invoices, e.g. after writes that bypassed the models.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clients, corrected = statistics.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"{clients} clients reconciled, {corrected} had wrong counters."))
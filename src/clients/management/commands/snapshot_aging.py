@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients import aging
+
+
+class Command(BaseCommand):
+    help = "Store the receivables aging of a day, today by default, for aging trends. Run nightly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Day to snapshot, YYYY-MM-DD. Replaces an earlier snapshot of that day.")
+
+    def handle(self, *args, **options):
+        as_of = datetime.date.today()
+        if options['date']:
+            try:
+                as_of = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        count = aging.snapshot(as_of)
+        self.stdout.write(self.style.SUCCESS(f"Aging of {as_of} stored, {count} rows."))
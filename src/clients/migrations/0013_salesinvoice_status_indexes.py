@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-18 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0012_salesinvoice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(fields=['is_paid', 'due_date'], name='salesinvoice_paid_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(fields=['contract_item', 'date'], name='salesinvoice_item_date_idx'),
+        ),
+    ]
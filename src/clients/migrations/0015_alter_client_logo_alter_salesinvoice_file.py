@@ -0,0 +1,24 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:06
+
+import common.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0014_client_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='logo',
+            field=models.ImageField(blank=True, max_length=255, storage=common.storage.get_blob_storage, upload_to='ClientLogo/'),
+        ),
+        migrations.AlterField(
+            model_name='salesinvoice',
+            name='file',
+            field=models.FileField(max_length=255, storage=common.storage.get_blob_storage, upload_to='SalesInvoice/'),
+        ),
+    ]
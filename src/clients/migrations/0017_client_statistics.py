@@ -0,0 +1,41 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dicts', '0010_dimension_path_depth_root'),
+        ('clients', '0016_client_search_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientStatistics',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='clients.client')),
+                ('active_contracts', models.PositiveIntegerField(default=0)),
+                ('contract_items', models.PositiveIntegerField(default=0)),
+                ('invoices', models.PositiveIntegerField(default=0)),
+                ('as_of', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ClientReceivables',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_count', models.PositiveIntegerField(default=0)),
+                ('open_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('overdue_count', models.PositiveIntegerField(default=0)),
+                ('overdue_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dicts.currency')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='clientreceivables',
+            constraint=models.UniqueConstraint(fields=('client', 'currency'), name='clientreceivables_currency_unique'),
+        ),
+    ]
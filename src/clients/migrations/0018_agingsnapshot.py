@@ -0,0 +1,35 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dicts', '0010_dimension_path_depth_root'),
+        ('clients', '0017_client_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('current', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_over_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.client')),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.contract')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='dicts.currency')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='agingsnapshot',
+            constraint=models.UniqueConstraint(fields=('as_of', 'contract', 'currency'), name='agingsnapshot_contract_unique'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:05
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0018_agingsnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='clientreceivables',
+            name='clientreceivables_currency_unique',
+        ),
+        migrations.RemoveField(
+            model_name='clientreceivables',
+            name='overdue_count',
+        ),
+        migrations.RemoveField(
+            model_name='clientreceivables',
+            name='overdue_value',
+        ),
+        migrations.RemoveField(
+            model_name='clientstatistics',
+            name='as_of',
+        ),
+        migrations.AddField(
+            model_name='clientreceivables',
+            name='due_date',
+            # Replaced by 0020, which recomputes the receivables per due date
+            field=models.DateField(default=datetime.date(2000, 1, 1)),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='clientreceivables',
+            constraint=models.UniqueConstraint(fields=('client', 'currency', 'due_date'), name='clientreceivables_due_date_unique'),
+        ),
+    ]
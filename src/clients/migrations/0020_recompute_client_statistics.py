@@ -0,0 +1,48 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:05
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def recompute(apps, schema_editor):
+    """
+    Counters of every client, with the receivables per due date (clients.statistics.compute).
+    """
+    Client = apps.get_model('clients', 'Client')
+    ClientStatistics = apps.get_model('clients', 'ClientStatistics')
+    ClientReceivables = apps.get_model('clients', 'ClientReceivables')
+    statistics = {client_id: ClientStatistics(client_id=client_id) for client_id in Client.objects.values_list('pk', flat=True)}
+    contracts = (apps.get_model('clients', 'Contract').objects.filter(is_active=True)
+                 .values('client_id').annotate(count=Count('pk')).order_by())
+    for row in contracts:
+        statistics[row['client_id']].active_contracts = row['count']
+    items = apps.get_model('clients', 'ContractItem').objects.values('contract__client_id').annotate(count=Count('pk')).order_by()
+    for row in items:
+        statistics[row['contract__client_id']].contract_items = row['count']
+    unpaid = Q(is_paid=False)
+    invoices = (apps.get_model('clients', 'SalesInvoice').objects
+                .values('contract_item__contract__client_id', 'currency_id', 'due_date')
+                .annotate(count=Count('pk'), open_count=Count('pk', filter=unpaid), open_value=Sum('value', filter=unpaid))
+                .order_by())
+    receivables = []
+    for row in invoices:
+        client_id = row['contract_item__contract__client_id']
+        statistics[client_id].invoices += row['count']
+        if row['open_count']:
+            receivables.append(ClientReceivables(client_id=client_id, currency_id=row['currency_id'], due_date=row['due_date'],
+                                                 open_count=row['open_count'], open_value=row['open_value']))
+    ClientStatistics.objects.all().delete()
+    ClientReceivables.objects.all().delete()
+    ClientStatistics.objects.bulk_create(statistics.values(), batch_size=500)
+    ClientReceivables.objects.bulk_create(receivables, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0019_clientreceivables_due_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute, migrations.RunPython.noop),
+    ]
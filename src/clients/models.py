@@ -1,19 +1,33 @@
 from collections import defaultdict
+from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, Sum
 from django.urls import reverse
 
 # from common.models import TrackableModel
 # from dicts.models import Currency, Dimension
 from common import models as common
+from common.storage import get_blob_storage
 from dicts import models as dicts
+from . import statistics
 # from employees.models import Employee
 
-class Client(common.TrackableModel):
+class ClientQuerySet(models.QuerySet):
+    def for_list(self):
+        # The client list renders only columns of the client itself
+        return self
+
+
+class Client(common.TrackableModel, common.ImageRenditionsModel, common.SearchKeyModel):
     slug = models.SlugField(max_length=100, unique=True)
     name = models.CharField(max_length=100)
-    logo = models.ImageField(upload_to='ClientLogo/', blank=True)
+    logo = models.ImageField(upload_to='ClientLogo/', blank=True, max_length=255, storage=get_blob_storage)
     is_active = models.BooleanField(default=True)
+
+    objects = ClientQuerySet.as_manager()
+
+    rendition_source_field = 'logo'
     
     def __str__(self):
         return self.name
@@ -27,6 +41,9 @@ class Client(common.TrackableModel):
     @classmethod
     def get_create_url(self): return reverse('clients:client-create')
 
+    @classmethod
+    def get_aging_report_url(self): return reverse('clients:aging-report')
+
     @classmethod
     def get_cls_breadcrumb(cls):
         return {'text': 'Clients', 'url': cls.get_list_url()}
@@ -37,19 +54,180 @@ class Client(common.TrackableModel):
     
 
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        result = super().save(*args, **kwargs)
+        if adding:
+            # A new client has nothing to count yet
+            ClientStatistics.objects.create(client=self)
+        return result
+
     def deactivate(self): self.is_active = False; self.save()
     def activate(self): self.is_active = True; self.save()
 
+    search_permission = 'clients.view_client'
+    search_dependents = [('clients.Contract', 'client'),
+                         ('clients.SalesInvoice', 'contract_item__contract__client'),
+                         ('projects.Project', 'client')]
+    search_dependent_fields = ('name', 'slug')
+
+    def get_search_document(self):
+        return {'title': self.name, 'body': self.slug}
+
+    def get_search_key_parts(self):
+        return [self.name]
+
     def get_absolute_url(self): return reverse('clients:client-detail', kwargs={'slug': self.slug})
     def get_update_url(self):   return reverse('clients:client-update', kwargs={'slug': self.slug})
     def get_deactivate_url(self): return reverse('clients:client-deactivate', kwargs={'slug': self.slug})
     def get_activate_url(self): return reverse('clients:client-activate', kwargs={'slug': self.slug})
 
+    def get_statistics(self):
+        """
+        ClientStatistics with the open receivables per currency attached as `receivables`, see clients.statistics.
+        """
+        return statistics.get([self.pk])[self.pk]
+
     def get_contract_list_url(self): return reverse('clients:contract-list', kwargs={'slug': self.slug})
     def get_contract_list_all_url(self): return reverse('clients:contract-list-all', kwargs={'slug': self.slug})
     def get_create_contract_url(self): return reverse('clients:contract-create', kwargs={'slug': self.slug})
 
-class Contract(common.TrackableModel):
+class ClientStatisticsModel(models.Model):
+    """
+    Adds the difference a save or delete makes to the ClientStatistics of the owning client in its
+    transaction, see clients.statistics. statistics_fields lists the fields the counters depend on,
+    add_statistics_changes() turns their values before and after the write into changes.
+    """
+    statistics_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._statistics_values = instance.get_statistics_values()
+        return instance
+
+    def get_statistics_values(self):
+        attnames = [self._meta.get_field(name).attname for name in self.statistics_fields]
+        if any(attname not in self.__dict__ for attname in attnames):
+            # Deferred, unknown without a query
+            return None
+        return {name: self.__dict__[attname] for name, attname in zip(self.statistics_fields, attnames)}
+
+    def add_statistics_changes(self, changes, previous, current):
+        """
+        Add to changes what replacing the values previous with current does to the counters; previous
+        is None for a new row, current for a deleted one.
+        """
+        raise NotImplementedError
+
+    def get_client_id(self):
+        raise NotImplementedError
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        previous = getattr(self, '_statistics_values', None)
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            current = self.get_statistics_values()
+            changes = statistics.Changes()
+            if not adding and previous is None:
+                # Not loaded from the database: what it replaced is unknown
+                changes.refresh.add(self.get_client_id())
+            elif previous != current:
+                self.add_statistics_changes(changes, previous, current)
+            statistics.apply(changes)
+        self._statistics_values = current
+        return result
+
+    def delete(self, *args, **kwargs):
+        changes = statistics.Changes()
+        previous = getattr(self, '_statistics_values', None) or self.get_statistics_values()
+        if previous is None:
+            changes.refresh.add(self.get_client_id())
+        else:
+            self.add_statistics_changes(changes, previous, None)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            statistics.apply(changes)
+        return result
+
+
+class ClientStatistics(models.Model):
+    """
+    Counters of one client maintained by clients.statistics.
+    """
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True)
+    active_contracts = models.PositiveIntegerField(default=0)
+    contract_items = models.PositiveIntegerField(default=0)
+    invoices = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.client_id)
+
+
+class ClientReceivables(models.Model):
+    """
+    Unpaid invoices of one client in one currency due on one day, maintained by clients.statistics.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    currency = models.ForeignKey(dicts.Currency, on_delete=models.CASCADE)
+    due_date = models.DateField()
+    open_count = models.PositiveIntegerField(default=0)
+    open_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'currency', 'due_date'], name='clientreceivables_due_date_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.client_id} {self.currency_id} {self.due_date}'
+
+
+class ContractQuerySet(models.QuerySet):
+    def for_list(self):
+        return self.select_related('client', 'owner__user')
+
+    def get_financials(self):
+        """
+        Returns a dictionary keyed by contract id with per currency totals for every contract in the queryset:
+        {contract_id: {currency_code: {'value', 'invoiced', 'paid', 'outstanding', 'remaining'}}}.
+        Computed in the database with two grouped queries regardless of the number of contracts.
+        """
+        def empty_totals():
+            return {'value': Decimal(0), 'invoiced': Decimal(0), 'paid': Decimal(0), 'outstanding': Decimal(0), 'remaining': Decimal(0)}
+
+        financials = defaultdict(lambda: defaultdict(empty_totals))
+        contract_values = (ContractItem.objects
+                           .filter(contract__in=self)
+                           .values('contract_id', 'currency__code')
+                           .annotate(total=Sum('value'))
+                           .order_by())
+        for row in contract_values:
+            financials[row['contract_id']][row['currency__code']]['value'] = row['total']
+
+        invoice_values = (SalesInvoice.objects
+                          .filter(contract_item__contract__in=self)
+                          .values('contract_item__contract_id', 'currency__code')
+                          .annotate(invoiced=Sum('value'), paid=Sum('value', filter=Q(is_paid=True)))
+                          .order_by())
+        for row in invoice_values:
+            totals = financials[row['contract_item__contract_id']][row['currency__code']]
+            totals['invoiced'] = row['invoiced']
+            totals['paid'] = row['paid'] or Decimal(0)
+
+        for contract_totals in financials.values():
+            for totals in contract_totals.values():
+                totals['outstanding'] = totals['invoiced'] - totals['paid']
+                totals['remaining'] = totals['value'] - totals['invoiced']
+        return {contract_id: {code: dict(totals) for code, totals in contract_totals.items()}
+                for contract_id, contract_totals in financials.items()}
+
+
+class Contract(ClientStatisticsModel, common.TrackableModel):
     slug = models.SlugField(max_length=100, unique=True)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     number = models.CharField(max_length=100)
@@ -60,6 +238,8 @@ class Contract(common.TrackableModel):
     is_active = models.BooleanField(default=True)
     owner = models.ForeignKey('employees.Employee', on_delete=models.CASCADE, related_name='contracts', null=True, blank=True)
 
+    objects = ContractQuerySet.as_manager()
+
     def __str__(self):
         return self.number + ' - ' + self.name
 
@@ -75,38 +255,52 @@ class Contract(common.TrackableModel):
         Returns a dictionary where the keys are currency codes and the values are
         the total sum of `ContractItem` values for each currency.
         """
-        totals = defaultdict(lambda: 0)
+        totals = self.contractitem_set.values('currency__code').annotate(total=Sum('value')).order_by()
+        return {row['currency__code']: row['total'] for row in totals}
+    
+    def get_total_invoices_by_currency(self):
+        """
+        Returns a dictionary where the keys are currency codes and the values are
+        the total sum of `SalesInvoice` values issued under this contract for each currency.
+        """
+        totals = (SalesInvoice.objects
+                  .filter(contract_item__contract=self)
+                  .values('currency__code')
+                  .annotate(total=Sum('value'))
+                  .order_by())
+        return {row['currency__code']: row['total'] for row in totals}
 
-        # Get all related ContractItems
-        contract_items = self.contractitem_set.all()
+    def get_financials(self):
+        """
+        Returns contract value, invoiced, paid, outstanding and remaining totals per currency,
+        see ContractQuerySet.get_financials.
+        """
+        return Contract.objects.filter(pk=self.pk).get_financials().get(self.pk, {})
 
-        # Aggregate the values by currency
-        for item in contract_items:
-            currency_code = item.currency.code  
-            totals[currency_code] += item.value
+    def deactivate(self): self.is_active = False; self.save()
+    def activate(self): self.is_active = True; self.save()
 
-        return dict(totals)
-    
-    def get_total_invoices_by_currency(self):
-        # """
-        # Returns a dictionary where the keys are currency codes and the values are
-        # the total sum of `ContractItem` values for each currency.
-        # """
-        # totals = defaultdict(lambda: 0)
+    def get_client_id(self):
+        return self.client_id
 
-        # # Get all related ContractItems
-        # contract_items = self.contractitem_set.all()
+    statistics_fields = ('client', 'is_active')
 
-        # # Aggregate the values by currency
-        # for item in contract_items:
-        #     currency_code = item.currency.code  # Assuming `Currency` model has a `code` field
-        #     totals[currency_code] += item.value
+    def add_statistics_changes(self, changes, previous, current):
+        if current is None or (previous is not None and previous['client'] != current['client']):
+            # Its contract items and invoices go (CASCADE) or move along
+            changes.refresh.update(values['client'] for values in (previous, current) if values)
+            return
+        for values, count in ((previous, -1), (current, 1)):
+            if values and values['is_active']:
+                changes.add(values['client'], 'active_contracts', count)
 
-        # return dict(totals)
-        pass
+    search_permission = 'clients.view_contract'
+    search_select_related = ('client',)
+    search_dependents = [('clients.SalesInvoice', 'contract_item__contract')]
+    search_dependent_fields = ('number', 'name', 'client')
 
-    def deactivate(self): self.is_active = False; self.save()
-    def activate(self): self.is_active = True; self.save()
+    def get_search_document(self):
+        return {'title': f"{self.number} {self.name}", 'body': f"{self.client.name}\n{self.comments}"}
 
     def get_absolute_url(self): return reverse('clients:contract-detail', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
     def get_update_url(self):   return reverse('clients:contract-update', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
@@ -116,17 +310,29 @@ class Contract(common.TrackableModel):
 
     def get_create_contract_item_url(self): return reverse('clients:contract-item-create', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
     def get_create_invoice_url(self): return reverse('clients:sales-invoice-create', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
+    def get_import_invoices_url(self): return reverse('clients:sales-invoice-import', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
+    def get_bulk_invoices_url(self): return reverse('clients:sales-invoice-bulk', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
     def get_contract_item_list_url(self): return reverse('clients:contract-item-list', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
     def get_contract_invoice_list_url(self): return reverse('clients:sales-invoice-list-contract', kwargs={'client_slug': self.client.slug, 'slug': self.slug})
 
 
-class ContractItem(common.TrackableModel):
+class ContractItemQuerySet(models.QuerySet):
+    def for_list(self):
+        return self.select_related('contract__client').prefetch_related('dimension')
+
+
+class ContractItem(ClientStatisticsModel, common.TrackableModel):
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     value = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.ForeignKey(dicts.Currency, on_delete=models.PROTECT)
     dimension = models.ManyToManyField(dicts.Dimension, blank=True)
 
+    objects = ContractItemQuerySet.as_manager()
+
+    search_dependents = [('clients.SalesInvoice', 'contract_item')]
+    search_dependent_fields = ('name', 'contract')
+
     def __str__(self):
         return self.name
     
@@ -140,11 +346,28 @@ class ContractItem(common.TrackableModel):
     def get_dimension_category(self):
         return {
                 dimension.get_top_level_dimension(): dimension.id 
-                for dimension in self.dimension.all()
+                for dimension in self.dimension.select_related('root')
             }
     def print_dimensions(self):
         return ' | '.join([dimension.name for dimension in self.dimension.all()])
 
+    def get_client_id(self):
+        return Contract.objects.filter(pk=self.contract_id).values_list('client_id', flat=True).first()
+
+    statistics_fields = ('contract',)
+
+    def add_statistics_changes(self, changes, previous, current):
+        contract_ids = [values['contract'] for values in (previous, current) if values]
+        clients = dict(Contract.objects.filter(pk__in=contract_ids).values_list('pk', 'client_id'))
+        if previous and current:
+            if clients.get(previous['contract']) != clients.get(current['contract']):
+                # Its invoices move along
+                changes.refresh.update(clients.values())
+            return
+        for values, count in ((previous, -1), (current, 1)):
+            if values:
+                changes.add(clients.get(values['contract']), 'contract_items', count)
+
     def get_update_url(self):   
         return reverse('clients:contract-item-update', kwargs={'client_slug': self.contract.client.slug, 'slug': self.contract.slug, 'pk': self.id})
     def get_delete_url(self):   
@@ -154,9 +377,47 @@ class ContractItem(common.TrackableModel):
     def get_invoice_list_url(self): 
         return reverse('clients:sales-invoice-list-contractitem', kwargs={'client_slug': self.contract.client.slug, 'slug': self.contract.slug, 'pk': self.id})
     
-class SalesInvoice(common.TrackableModel, common.InvoiceModel):
+class SalesInvoiceQuerySet(common.TrackableQuerySet, common.InvoiceQuerySet):
+    def for_list(self):
+        return self.select_related('contract_item__contract__client')
+
+    def settle(self, ids, paid_date, current_user=None):
+        # Invoices paid already keep their original paid date
+        return self.unpaid().update_tracked(ids, current_user, is_paid=True, paid_date=paid_date)
+
+    def reassign(self, ids, contract_item, current_user=None):
+        return self.update_tracked(ids, current_user, contract_item=contract_item)
+
+    def get_client_ids(self, ids):
+        return set(self.filter(pk__in=list(ids)).values_list('contract_item__contract__client_id', flat=True).distinct())
+
+    def update_tracked(self, ids, current_user=None, **values):
+        with transaction.atomic(using=self.db):
+            client_ids = self.get_client_ids(ids)
+            updated = super().update_tracked(ids, current_user, **values)
+            # Read again from all invoices, the rows may have left this queryset (settled) or moved (reassigned)
+            statistics.refresh_on_commit(client_ids | self.model._default_manager.get_client_ids(ids))
+        return updated
+
+    def delete_tracked(self, ids):
+        with transaction.atomic(using=self.db):
+            client_ids = self.get_client_ids(ids)
+            deleted = super().delete_tracked(ids)
+            statistics.refresh_on_commit(client_ids)
+        return deleted
+
+
+class SalesInvoice(ClientStatisticsModel, common.TrackableModel, common.InvoiceModel):
     contract_item = models.ForeignKey(ContractItem, on_delete=models.PROTECT)
-    file = models.FileField(upload_to='SalesInvoice/')
+    file = models.FileField(upload_to='SalesInvoice/', max_length=255, storage=get_blob_storage)
+
+    objects = SalesInvoiceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_paid', 'due_date'], name='salesinvoice_paid_due_idx'),
+            models.Index(fields=['contract_item', 'date'], name='salesinvoice_item_date_idx'),
+        ]
 
     def __str__(self):
         return self.number
@@ -168,6 +429,29 @@ class SalesInvoice(common.TrackableModel, common.InvoiceModel):
     def get_breadcrumb(self):
         return {'text': self.number}    
 
+    def get_client_id(self):
+        return ContractItem.objects.filter(pk=self.contract_item_id).values_list('contract__client_id', flat=True).first()
+
+    statistics_fields = ('contract_item', 'currency', 'due_date', 'value', 'is_paid')
+
+    def add_statistics_changes(self, changes, previous, current):
+        item_ids = [values['contract_item'] for values in (previous, current) if values]
+        clients = dict(ContractItem.objects.filter(pk__in=item_ids).values_list('pk', 'contract__client_id'))
+        for values, count in ((previous, -1), (current, 1)):
+            if values:
+                client_id = clients.get(values['contract_item'])
+                changes.add(client_id, 'invoices', count)
+                if not values['is_paid']:
+                    changes.add_receivable(client_id, values['currency'], values['due_date'], values['value'], count)
+
+    search_permission = 'clients.view_salesinvoice'
+    search_select_related = ('contract_item__contract__client',)
+
+    def get_search_document(self):
+        contract = self.contract_item.contract
+        return {'title': self.number,
+                'body': f"{contract.number} {contract.name}\n{self.contract_item.name}\n{contract.client.name}"}
+
     def get_absolute_url(self):
         return reverse("clients:sales-invoice-view", kwargs={"pk": self.pk})
     def get_update_url(self):   
@@ -177,3 +461,27 @@ class SalesInvoice(common.TrackableModel, common.InvoiceModel):
     def get_delete_url(self):   
         return reverse('clients:sales-invoice-delete', kwargs={'pk': self.pk})
     
+
+
+class AgingSnapshot(models.Model):
+    """
+    Receivables aging of one contract in one currency as it was on as_of, see clients.aging.
+    """
+    as_of = models.DateField()
+    client = models.ForeignKey(Client, on_delete=models.CASCADE)
+    contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    currency = models.ForeignKey(dicts.Currency, on_delete=models.PROTECT)
+    current = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_1_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_over_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['as_of', 'contract', 'currency'], name='agingsnapshot_contract_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.as_of} {self.contract_id} {self.currency_id}'
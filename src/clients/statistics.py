@@ -0,0 +1,226 @@
+"""
+Denormalized per client counters: active contracts, contract items, invoices and the open
+receivables per currency and due date.
+
+Saving or deleting a contract, contract item or sales invoice applies the difference it makes to
+the counters with F() expressions in the same transaction (see ClientStatisticsModel), so a write
+costs a few single row updates whatever the number of invoices of the client. Writes that move
+rows between clients together with their dependents, and set-based writes (SalesInvoiceQuerySet,
+imports), recompute the counters of the affected clients after commit instead.
+
+Receivables are stored per due date, so the overdue part for any day is summed from the buckets
+of the listed clients: list and detail pages read the counters with two queries and never write. The reconcile_client_statistics command rebuilds the counters of every client.
+"""
+import collections
+import datetime
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+
+BATCH_SIZE = 500
+
+COUNTER_FIELDS = ['active_contracts', 'contract_items', 'invoices']
+
+# Open receivables of a client in one currency on a day, read by get()
+Receivables = collections.namedtuple('Receivables', 'currency_id open_count open_value overdue_count overdue_value')
+
+
+def get_model(name):
+    return apps.get_model('clients', name)
+
+
+def compute(client_ids):
+    """
+    (statistics, receivables) of the clients, unsaved ClientStatistics and ClientReceivables rows
+    computed with three grouped queries.
+    """
+    ClientStatistics, ClientReceivables = get_model('ClientStatistics'), get_model('ClientReceivables')
+    statistics = {client_id: ClientStatistics(client_id=client_id) for client_id in client_ids}
+
+    contracts = (get_model('Contract').objects
+                 .filter(client_id__in=client_ids, is_active=True)
+                 .values('client_id')
+                 .annotate(count=Count('pk'))
+                 .order_by())
+    for row in contracts:
+        statistics[row['client_id']].active_contracts = row['count']
+
+    items = (get_model('ContractItem').objects
+             .filter(contract__client_id__in=client_ids)
+             .values('contract__client_id')
+             .annotate(count=Count('pk'))
+             .order_by())
+    for row in items:
+        statistics[row['contract__client_id']].contract_items = row['count']
+
+    unpaid = Q(is_paid=False)
+    invoices = (get_model('SalesInvoice').objects
+                .filter(contract_item__contract__client_id__in=client_ids)
+                .values('contract_item__contract__client_id', 'currency_id', 'due_date')
+                .annotate(count=Count('pk'), open_count=Count('pk', filter=unpaid), open_value=Sum('value', filter=unpaid))
+                .order_by())
+    receivables = []
+    for row in invoices:
+        client_id = row['contract_item__contract__client_id']
+        statistics[client_id].invoices += row['count']
+        if row['open_count']:
+            receivables.append(ClientReceivables(
+                client_id=client_id, currency_id=row['currency_id'], due_date=row['due_date'],
+                open_count=row['open_count'], open_value=row['open_value'],
+            ))
+    return statistics, receivables
+
+
+def refresh(client_ids):
+    """
+    Recompute and store the counters of the clients, returns the ClientStatistics by client id with
+    their ClientReceivables attached as `buckets`.
+    """
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if not client_ids:
+        return {}
+    ClientStatistics, ClientReceivables = get_model('ClientStatistics'), get_model('ClientReceivables')
+    statistics, receivables = compute(client_ids)
+    with transaction.atomic():
+        ClientStatistics.objects.bulk_create(statistics.values(), update_conflicts=True,
+                                             unique_fields=['client'], update_fields=COUNTER_FIELDS)
+        ClientReceivables.objects.filter(client_id__in=client_ids).delete()
+        ClientReceivables.objects.bulk_create(receivables)
+    for client_statistics in statistics.values():
+        client_statistics.buckets = []
+    for bucket in receivables:
+        statistics[bucket.client_id].buckets.append(bucket)
+    return statistics
+
+
+def refresh_on_commit(client_ids):
+    """
+    refresh() the clients after the surrounding transaction commits, when it reads every row of
+    them as written.
+    """
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if client_ids:
+        transaction.on_commit(lambda: refresh(client_ids))
+
+
+class Changes:
+    """
+    Differences a write makes to the counters, collected by ClientStatisticsModel and stored by apply().
+    """
+    def __init__(self):
+        self.counters = collections.defaultdict(collections.Counter)
+        # (client id, currency id, due date) -> [count, value]
+        self.receivables = collections.defaultdict(lambda: [0, Decimal(0)])
+        # Clients to recompute after commit, see refresh_on_commit()
+        self.refresh = set()
+
+    def add(self, client_id, field, count):
+        if client_id is not None:
+            self.counters[client_id][field] += count
+
+    def add_receivable(self, client_id, currency_id, due_date, value, count):
+        if client_id is not None:
+            bucket = self.receivables[client_id, currency_id, due_date]
+            bucket[0] += count
+            bucket[1] += Decimal(value) * count
+
+
+def apply(changes):
+    """
+    Store changes with F() expressions, which add to the counters concurrent writes leave behind.
+    """
+    ClientStatistics, ClientReceivables = get_model('ClientStatistics'), get_model('ClientReceivables')
+    with transaction.atomic():
+        for client_id, counters in changes.counters.items():
+            values = {field: Greatest(F(field) + count, 0) for field, count in counters.items() if count}
+            if values:
+                ClientStatistics.objects.filter(client_id=client_id).update(**values)
+        emptied = set()
+        for (client_id, currency_id, due_date), (count, value) in changes.receivables.items():
+            if not count and not value:
+                continue
+            bucket = ClientReceivables.objects.filter(client_id=client_id, currency_id=currency_id, due_date=due_date)
+            values = {'open_count': Greatest(F('open_count') + count, 0), 'open_value': F('open_value') + value}
+            if bucket.update(**values):
+                if count < 0:
+                    emptied.add(client_id)
+            elif count > 0:
+                try:
+                    with transaction.atomic():
+                        ClientReceivables.objects.create(client_id=client_id, currency_id=currency_id, due_date=due_date,
+                                                         open_count=count, open_value=value)
+                except IntegrityError:
+                    # Created by a concurrent write since the update
+                    bucket.update(**values)
+        if emptied:
+            ClientReceivables.objects.filter(client_id__in=emptied, open_count=0).delete()
+    refresh_on_commit(changes.refresh)
+
+
+def get(client_ids, as_of=None):
+    """
+    ClientStatistics by client id, their open Receivables per currency on as_of attached as
+    `receivables`. Two queries; clients without stored counters are computed without storing them.
+    """
+    client_ids = set(client_ids)
+    as_of = as_of or datetime.date.today()
+    ClientStatistics, ClientReceivables = get_model('ClientStatistics'), get_model('ClientReceivables')
+    statistics = ClientStatistics.objects.filter(client_id__in=client_ids).in_bulk()
+    buckets = ClientReceivables.objects.filter(client_id__in=statistics.keys())
+    missing = client_ids - statistics.keys()
+    if missing:
+        computed, receivables = compute(missing)
+        statistics.update(computed)
+        buckets = list(buckets) + receivables
+    summed = collections.defaultdict(lambda: [0, Decimal(0), 0, Decimal(0)])
+    for bucket in buckets:
+        row = summed[bucket.client_id, bucket.currency_id]
+        row[0] += bucket.open_count
+        row[1] += bucket.open_value
+        if bucket.due_date <= as_of:
+            row[2] += bucket.open_count
+            row[3] += bucket.open_value
+    for client_statistics in statistics.values():
+        client_statistics.receivables = []
+    for (client_id, currency_id), row in sorted(summed.items()):
+        statistics[client_id].receivables.append(Receivables(currency_id, *row))
+    return statistics
+
+
+def snapshot(client_ids):
+    """
+    Stored counters of the clients, comparable with those of freshly computed rows.
+    """
+    ClientStatistics, ClientReceivables = get_model('ClientStatistics'), get_model('ClientReceivables')
+    stored = {client_id: None for client_id in client_ids}
+    for row in ClientStatistics.objects.filter(client_id__in=client_ids).values_list('client_id', 'active_contracts', 'contract_items', 'invoices'):
+        stored[row[0]] = (row[1:], set())
+    receivables = ClientReceivables.objects.filter(client_id__in=client_ids).values_list(
+        'client_id', 'currency_id', 'due_date', 'open_count', 'open_value')
+    for row in receivables:
+        if stored[row[0]] is not None:
+            stored[row[0]][1].add(row[1:])
+    return stored
+
+
+def reconcile(batch_size=BATCH_SIZE):
+    """
+    Recompute the counters of every client, returns the number of clients and of clients whose
+    stored counters were wrong.
+    """
+    client_ids = list(get_model('Client').objects.order_by('pk').values_list('pk', flat=True))
+    corrected = 0
+    for start in range(0, len(client_ids), batch_size):
+        batch = client_ids[start:start + batch_size]
+        stored = snapshot(batch)
+        for client_id, client_statistics in refresh(batch).items():
+            computed = (
+                (client_statistics.active_contracts, client_statistics.contract_items, client_statistics.invoices),
+                {(row.currency_id, row.due_date, row.open_count, row.open_value) for row in client_statistics.buckets},
+            )
+            if stored[client_id] != computed:
+                corrected += 1
+    return len(client_ids), corrected
@@ -1,3 +1,419 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from common.autocomplete import filter_by_search_key
+from common.models import SearchKeyWord, TrackableQuerySet
+from common.testing import ListQueryCountMixin
+from dicts.models import Currency, Dimension
+from employees.models import Employee
+from . import aging, statistics
+from .imports import SalesInvoiceImporter, ZipFiles
+from .models import Client, Contract, ContractItem, SalesInvoice
+
+
+class ListQueryCountTests(ListQueryCountMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.today = datetime.date.today()
+        cls.acme = Client.objects.create(slug='acme', name='Acme')
+        cls.contract = Contract.objects.create(slug='main', client=cls.acme, number='K/1', name='Main',
+                                               start_date=cls.today, end_date=cls.today, owner=cls.employee)
+        department = Dimension.objects.create(name='Department')
+        cls.dimension = Dimension.objects.create(name='IT', parent=department)
+
+    def add_clients(self, count):
+        for _ in range(count):
+            number = Client.objects.count()
+            Client.objects.create(slug=f'client-{number}', name=f'Client {number}')
+
+    def add_contracts(self, count):
+        for _ in range(count):
+            number = Contract.objects.count()
+            Contract.objects.create(slug=f'contract-{number}', client=self.acme, number=f'K/{number}', name='Contract',
+                                    start_date=self.today, end_date=self.today, owner=self.employee)
+
+    def add_items(self, count):
+        for _ in range(count):
+            item = ContractItem.objects.create(contract=self.contract, name=f'Item {ContractItem.objects.count()}',
+                                               value=100, currency=self.currency)
+            item.dimension.add(self.dimension)
+
+    def add_invoices(self, count):
+        self.add_items(count)
+        for item in ContractItem.objects.filter(contract=self.contract, salesinvoice__isnull=True):
+            SalesInvoice.objects.create(contract_item=item, number=f'FV/{item.pk}', date=self.today,
+                                        due_date=self.today, value=50, currency=self.currency,
+                                        file='SalesInvoice/invoice.pdf')
+
+    def test_client_list(self):
+        self.assertConstantQueries(Client.get_list_url(), self.add_clients)
+
+    def test_contract_list(self):
+        self.assertConstantQueries(self.acme.get_contract_list_url(), self.add_contracts)
+
+    def test_contract_item_list(self):
+        self.assertConstantQueries(self.contract.get_contract_item_list_url(), self.add_items)
+
+    def test_sales_invoice_list(self):
+        self.assertConstantQueries(self.contract.get_contract_invoice_list_url(), self.add_invoices)
+
+
+class SalesInvoiceImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Currency.objects.create(code='EUR', name='Euro', default=True)
+        cls.acme = Client.objects.create(slug='acme', name='Acme')
+        cls.contract = Contract.objects.create(slug='main', client=cls.acme, number='K/1', name='Main',
+                                               start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        cls.item = ContractItem.objects.create(contract=cls.contract, name='Support', value=100,
+                                               currency=Currency.get_default())
+        other = Contract.objects.create(slug='other', client=cls.acme, number='K/2', name='Other',
+                                        start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        cls.other_item = ContractItem.objects.create(contract=other, name='Other', value=100,
+                                                     currency=Currency.get_default())
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_csv(self, *rows):
+        header = 'number,date,due_date,value,currency,contract_item,is_paid,paid_date,file'
+        return '\n'.join([header, *rows]) + '\n'
+
+    def test_import_is_idempotent(self):
+        data = self.make_csv(
+            f'FV/1,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},,,',
+            f'FV/2,2024-02-29,2024-03-14,100.00,eur,{self.item.pk},yes,2024-03-01,',
+        )
+        result = SalesInvoiceImporter(contract=self.contract).run(data)
+        self.assertEqual((len(result.created), len(result.skipped), result.errors), (2, 0, []))
+        self.assertTrue(SalesInvoice.objects.get(number='FV/2').is_paid)
+
+        result = SalesInvoiceImporter(contract=self.contract).run(data)
+        self.assertEqual((len(result.created), len(result.skipped)), (0, 2))
+        self.assertEqual(SalesInvoice.objects.count(), 2)
+
+    def test_row_errors_do_not_block_valid_rows(self):
+        data = self.make_csv(
+            f'FV/1,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},,,',
+            f'FV/2,2024-13-31,2024-02-14,100.00,EUR,{self.item.pk},,,',
+            f'FV/3,2024-01-31,2024-02-14,100.00,USD,{self.item.pk},,,',
+            f'FV/4,2024-01-31,2024-02-14,100.00,EUR,{self.other_item.pk},,,',
+            f'FV/5,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},yes,,',
+            f'FV/1,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},,,',
+        )
+        result = SalesInvoiceImporter(contract=self.contract).run(data)
+        self.assertEqual([invoice.number for invoice in result.created], ['FV/1'])
+        self.assertEqual([error.line for error in result.errors], [3, 4, 5, 6, 7])
+        self.assertEqual(list(SalesInvoice.objects.values_list('number', flat=True)), ['FV/1'])
+
+    def test_attachments_from_zip(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('january/FV-1.pdf', b'%PDF-1.4')
+        data = self.make_csv(
+            f'FV/1,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},,,FV-1.pdf',
+            f'FV/2,2024-01-31,2024-02-14,100.00,EUR,{self.item.pk},,,FV-2.pdf',
+        )
+        result = SalesInvoiceImporter(files=ZipFiles(archive)).run(data)
+        self.assertEqual(len(result.errors), 1)
+        with SalesInvoice.objects.get(number='FV/1').file.open('rb') as file:
+            self.assertEqual(file.read(), b'%PDF-1.4')
+
+
+    def test_unknown_contract(self):
+        user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/clients/acme/contract/missing/invoice/import').status_code, 404)
+
+class SalesInvoiceBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        acme = Client.objects.create(slug='acme', name='Acme')
+        cls.contract = Contract.objects.create(slug='main', client=acme, number='K/1', name='Main',
+                                               start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        cls.item = ContractItem.objects.create(contract=cls.contract, name='Support', value=100, currency=currency)
+        SalesInvoice.objects.bulk_create(
+            SalesInvoice(contract_item=cls.item, number=f'FV/{number}', date=datetime.date(2024, 1, 31),
+                         due_date=datetime.date(2024, 2, 14), value=100, currency=currency)
+            for number in range(7)
+        )
+        cls.ids = list(SalesInvoice.objects.values_list('pk', flat=True))
+
+    def test_settle_updates_in_chunks(self):
+        invoices = SalesInvoice.objects.filter(contract_item__contract=self.contract)
+        with mock.patch.object(TrackableQuerySet, 'chunk_size', 3), CaptureQueriesContext(connection) as context:
+            settled = invoices.settle(self.ids, datetime.date(2024, 3, 1))
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual((settled, len(updates)), (7, 3))
+        self.assertEqual(SalesInvoice.objects.filter(is_paid=True, paid_date=datetime.date(2024, 3, 1)).count(), 7)
+        # Already settled invoices are left alone
+        self.assertEqual(invoices.settle(self.ids, datetime.date(2024, 4, 1)), 0)
+
+    def test_delete_in_chunks(self):
+        with mock.patch.object(TrackableQuerySet, 'chunk_size', 2):
+            self.assertEqual(SalesInvoice.objects.delete_tracked(self.ids[:5]), 5)
+        self.assertEqual(SalesInvoice.objects.count(), 2)
+
+
+
+class InvoiceStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password')
+        Employee.objects.create(user=cls.user, slug='admin')
+        currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        cls.acme = Client.objects.create(slug='acme', name='Acme')
+        cls.contract = Contract.objects.create(slug='main', client=cls.acme, number='K/1', name='Main',
+                                               start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        item = ContractItem.objects.create(contract=cls.contract, name='Support', value=100, currency=currency)
+        cls.today = datetime.date.today()
+        days = datetime.timedelta
+        invoices = [
+            # (number, due date, paid)
+            ('FV/paid', cls.today - days(10), True),
+            ('FV/future', cls.today + days(1), False),
+            ('FV/today', cls.today, False),
+            ('FV/late', cls.today - days(1), False),
+        ]
+        SalesInvoice.objects.bulk_create(
+            SalesInvoice(contract_item=item, number=number, date=datetime.date(2024, 1, 1), due_date=due_date,
+                         is_paid=is_paid, value=10, currency=currency)
+            for number, due_date, is_paid in invoices
+        )
+
+    def numbers(self, queryset):
+        return sorted(queryset.values_list('number', flat=True))
+
+    def test_with_status(self):
+        statuses = {invoice.number: invoice.status for invoice in SalesInvoice.objects.with_status()}
+        self.assertEqual(statuses, {'FV/paid': 'Paid', 'FV/future': 'Unpaid', 'FV/today': 'Overdue', 'FV/late': 'Overdue'})
+        # The property computes the same status without the annotation
+        self.assertEqual({invoice.number: invoice.status for invoice in SalesInvoice.objects.all()}, statuses)
+        # Earlier, only the invoice already due then was overdue
+        statuses = {invoice.number: invoice.status
+                    for invoice in SalesInvoice.objects.with_status(self.today - datetime.timedelta(days=1))}
+        self.assertEqual(statuses['FV/today'], 'Unpaid')
+        self.assertEqual(statuses['FV/late'], 'Overdue')
+
+    def test_filters(self):
+        invoices = SalesInvoice.objects.all()
+        self.assertEqual(self.numbers(invoices.unpaid()), ['FV/future', 'FV/late', 'FV/today'])
+        self.assertEqual(self.numbers(invoices.unsettled()), self.numbers(invoices.unpaid()))
+        self.assertEqual(self.numbers(invoices.with_status_value('Paid')), ['FV/paid'])
+        self.assertEqual(self.numbers(invoices.with_status_value('Unpaid')), ['FV/future'])
+        self.assertEqual(self.numbers(invoices.with_status_value('Overdue')), ['FV/late', 'FV/today'])
+
+    def test_list_status_filter(self):
+        self.client.force_login(self.user)
+        url = self.contract.get_contract_invoice_list_url()
+        for status, expected in [('Overdue', ['FV/late', 'FV/today']), ('Paid', ['FV/paid']),
+                                 ('unknown', ['FV/future', 'FV/late', 'FV/paid', 'FV/today'])]:
+            response = self.client.get(url, {'status': status})
+            self.assertEqual(sorted(invoice.number for invoice in response.context['object_list']), expected)
+
+class ClientAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@example.com', 'user@example.com', 'password')
+        for slug, name in [('lodz', 'Łódź Ślusarz'), ('beta', 'Beta Łódź'), ('gamma', 'Gamma Lodówki')]:
+            Client.objects.create(slug=slug, name=name)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def autocomplete(self, query):
+        response = self.client.get('/clients/autocomplete/', {'q': query})
+        return [result['text'] for result in response.json()['results']]
+
+    def test_accent_folded_word_prefixes(self):
+        # Keys starting with the first word come before keys where it starts a later word
+        self.assertEqual(self.autocomplete('LODZ'), ['Łódź Ślusarz', 'Beta Łódź'])
+        self.assertEqual(self.autocomplete('lod'), ['Łódź Ślusarz', 'Beta Łódź', 'Gamma Lodówki'])
+        self.assertEqual(self.autocomplete('sl lo'), ['Łódź Ślusarz'])
+        self.assertEqual(self.autocomplete('odz'), [])
+
+    def test_later_words_are_matched_through_the_word_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([client.name for client in filter_by_search_key(Client.objects.all(), 'lod', 20)],
+                             ['Łódź Ślusarz', 'Beta Łódź', 'Gamma Lodówki'])
+        self.assertEqual(len(queries), 2)
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql'].upper()])
+        # Leading matches filling the limit skip the lookup
+        with self.assertNumQueries(1):
+            filter_by_search_key(Client.objects.all(), 'lod', 1)
+
+    def test_words_follow_renames_and_deletes(self):
+        gamma = Client.objects.get(slug='gamma')
+        gamma.name = 'Gamma Kuchnie'
+        gamma.save()
+        self.assertEqual(self.autocomplete('kuch'), ['Gamma Kuchnie'])
+        self.assertEqual(self.autocomplete('lodo'), [])
+        gamma.delete()
+        self.assertFalse(SearchKeyWord.objects.filter(model='clients.client', object_id=gamma.pk).exists())
+
+    def test_results_are_limited(self):
+        with mock.patch('clients.views.ClientAutocomplete.limit', 2):
+            self.assertEqual(len(self.autocomplete('lo')), 2)
+
+
+class ClientStatisticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.eur = Currency.objects.create(code='EUR', name='Euro', default=True)
+        cls.usd = Currency.objects.create(code='USD', name='US Dollar')
+        cls.acme = Client.objects.create(slug='acme', name='Acme')
+        cls.contract = Contract.objects.create(slug='main', client=cls.acme, number='K/1', name='Main',
+                                               start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        cls.item = ContractItem.objects.create(contract=cls.contract, name='Support', value=1000, currency=cls.eur)
+
+    def create_invoice(self, number, value, currency, due_date):
+        return SalesInvoice.objects.create(contract_item=self.item, number=number, date=datetime.date(2024, 1, 1),
+                                           due_date=due_date, value=value, currency=currency)
+
+    def receivables(self, statistics):
+        return {(row.currency_id, row.open_count, row.open_value, row.overdue_count, row.overdue_value)
+                for row in statistics.receivables}
+
+    def test_counters_follow_writes(self):
+        past, future = datetime.date(2024, 1, 31), datetime.date.today() + datetime.timedelta(days=30)
+        first = self.create_invoice('FV/1', 100, self.eur, past)
+        self.create_invoice('FV/2', 50, self.eur, future)
+        self.create_invoice('FV/3', 70, self.usd, future)
+        statistics = self.acme.get_statistics()
+        self.assertEqual((statistics.active_contracts, statistics.contract_items, statistics.invoices), (1, 1, 3))
+        self.assertEqual(self.receivables(statistics), {(self.eur.pk, 2, 150, 1, 100), (self.usd.pk, 1, 70, 0, 0)})
+
+        # Set-based writes recompute after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesInvoice.objects.settle([first.pk], datetime.date(2024, 2, 1))
+            SalesInvoice.objects.delete_tracked(SalesInvoice.objects.filter(currency=self.usd).values_list('pk', flat=True))
+        self.contract.deactivate()
+        statistics = self.acme.get_statistics()
+        self.assertEqual((statistics.active_contracts, statistics.invoices), (0, 2))
+        self.assertEqual(self.receivables(statistics), {(self.eur.pk, 1, 50, 0, 0)})
+
+    def test_writes_apply_deltas(self):
+        for number in range(20):
+            self.create_invoice(f'FV/{number}', 10, self.eur, datetime.date(2024, 1, 31))
+        invoice = SalesInvoice.objects.get(number='FV/0')
+        invoice.value = 25
+        with CaptureQueriesContext(connection) as queries:
+            invoice.save()
+        # No query reads the other invoices of the client
+        self.assertFalse([query for query in queries if 'SUM(' in query['sql'].upper()])
+        invoice.is_paid = True
+        invoice.save()
+        SalesInvoice.objects.get(number='FV/1').delete()
+        counters = self.acme.get_statistics()
+        self.assertEqual(counters.invoices, 19)
+        self.assertEqual(self.receivables(counters), {(self.eur.pk, 18, 180, 18, 180)})
+        self.assertEqual(statistics.reconcile(), (1, 0))
+
+    def test_moved_invoice_leaves_the_old_client(self):
+        invoice = self.create_invoice('FV/1', 100, self.eur, datetime.date(2024, 1, 31))
+        other = Client.objects.create(slug='other', name='Other')
+        contract = Contract.objects.create(slug='other', client=other, number='K/2', name='Other',
+                                           start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        item = ContractItem.objects.create(contract=contract, name='Support', value=1000, currency=self.eur)
+        invoice = SalesInvoice.objects.get(pk=invoice.pk)
+        invoice.contract_item = item
+        invoice.save()
+        self.assertEqual((self.acme.get_statistics().invoices, self.receivables(self.acme.get_statistics())), (0, set()))
+        self.assertEqual(other.get_statistics().invoices, 1)
+        self.assertEqual(self.receivables(other.get_statistics()), {(self.eur.pk, 1, 100, 1, 100)})
+
+    def test_overdue_follows_the_date_without_writes(self):
+        self.create_invoice('FV/1', 100, self.eur, datetime.date(2024, 1, 31))
+        with CaptureQueriesContext(connection) as queries:
+            before = statistics.get([self.acme.pk], datetime.date(2024, 1, 30))[self.acme.pk]
+            after = statistics.get([self.acme.pk], datetime.date(2024, 1, 31))[self.acme.pk]
+        self.assertEqual(len(queries), 4)
+        self.assertTrue(all(query['sql'].upper().startswith('SELECT') for query in queries))
+        self.assertEqual(self.receivables(before), {(self.eur.pk, 1, 100, 0, 0)})
+        self.assertEqual(self.receivables(after), {(self.eur.pk, 1, 100, 1, 100)})
+
+    def test_reconcile_corrects_drift(self):
+        self.create_invoice('FV/1', 100, self.eur, datetime.date(2024, 1, 31))
+        # Writes bypassing the models leave the counters behind
+        SalesInvoice.objects.update(is_paid=True)
+        self.assertEqual(statistics.reconcile(), (1, 1))
+        self.assertEqual(self.receivables(self.acme.get_statistics()), set())
+        self.assertEqual(statistics.reconcile(), (1, 0))
+
+
+class AgingReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        acme = Client.objects.create(slug='acme', name='Acme')
+        contract = Contract.objects.create(slug='main', client=acme, number='K/1', name='Main',
+                                           start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        item = ContractItem.objects.create(contract=contract, name='Support', value=1000, currency=currency)
+        cls.as_of = datetime.date(2024, 6, 30)
+        days = datetime.timedelta
+        invoices = [
+            # (due date, paid date, value)
+            (cls.as_of + days(5), None, 1),
+            (cls.as_of, None, 2),
+            (cls.as_of - days(45), None, 4),
+            (cls.as_of - days(70), cls.as_of + days(1), 8),
+            (cls.as_of - days(120), None, 16),
+            (cls.as_of - days(20), cls.as_of, 32),
+        ]
+        SalesInvoice.objects.bulk_create(
+            SalesInvoice(contract_item=item, number=f'FV/{value}', date=datetime.date(2024, 1, 1), due_date=due_date,
+                         is_paid=paid_date is not None, paid_date=paid_date, value=value, currency=currency)
+            for due_date, paid_date, value in invoices
+        )
+
+    def test_buckets_as_of_date(self):
+        with CaptureQueriesContext(connection) as context:
+            rows = list(aging.report(self.as_of))
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(len(rows), 1)
+        # Due on as_of is overdue; paid after as_of was still outstanding then
+        self.assertEqual([rows[0][field] for field in aging.AMOUNT_FIELDS], [1, 2, 4, 8, 16, 31])
+
+    def test_snapshot_replaces_the_day(self):
+        self.assertEqual(aging.snapshot(self.as_of), 1)
+        self.assertEqual(aging.snapshot(self.as_of), 1)
+        rows, from_snapshot = aging.get_rows(self.as_of)
+        self.assertTrue(from_snapshot)
+        self.assertEqual(rows[0]['total'], 31)
+
+    def test_today_is_computed_live(self):
+        today = datetime.date.today()
+        aging.snapshot(today)
+        invoice = SalesInvoice.objects.get(number='FV/1')
+        invoice.settle()
+        rows, from_snapshot = aging.get_rows(today)
+        self.assertFalse(from_snapshot)
+        # FV/2, FV/4 and FV/16 are unpaid
+        self.assertEqual(rows[0]['total'], 22)
+
+    def test_export(self):
+        user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password')
+        Employee.objects.create(user=user, slug='admin')
+        self.client.force_login(user)
+        response = self.client.get(f'/clients/aging/?date={self.as_of}&export=csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="receivables-aging-2024-06-30.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[0], ['Client', 'Contract', 'Contract name', 'Currency', 'Current', '1-30', '31-60',
+                                   '61-90', '90+', 'Total'])
+        self.assertEqual(rows[1], ['Acme', 'K/1', 'Main', 'EUR', '1', '2', '4', '8', '16', '31'])
@@ -6,6 +6,7 @@ urlpatterns = [
     path('', views.ClientList.as_view(), name='client-list', kwargs={'all': False}),
     path('all/', views.ClientList.as_view(), name='client-list-all', kwargs={'all': True}),
     path('autocomplete/', views.ClientAutocomplete.as_view(), name='client-autocomplete'),
+    path('aging/', views.AgingReport.as_view(), name='aging-report'),
     path('new/', views.ClientCreate.as_view(), name='client-create'),
     path('<slug:slug>/', views.ClientDetail.as_view(), name='client-detail'),
     path('<slug:slug>/edit', views.ClientUpdate.as_view(), name='client-update'),
@@ -28,6 +29,8 @@ urlpatterns = [
     path('<slug:client_slug>/contract/<slug:slug>/invoice', views.SalesInvoiceList.as_view(), name='sales-invoice-list-contract'),
     path('<slug:client_slug>/contract/<slug:slug>/item/<int:pk>/invoices', views.SalesInvoiceList.as_view(), name='sales-invoice-list-contractitem'),
     path('<slug:client_slug>/contract/<slug:slug>/invoice/new', views.SalesInvoiceCreate.as_view(), name='sales-invoice-create'),
+    path('<slug:client_slug>/contract/<slug:slug>/invoice/import', views.SalesInvoiceImport.as_view(), name='sales-invoice-import'),
+    path('<slug:client_slug>/contract/<slug:slug>/invoice/bulk', views.SalesInvoiceBulkAction.as_view(), name='sales-invoice-bulk'),
     path('invoice/<int:pk>', views.SalesInvoiceView.as_view(), name='sales-invoice-view'),
     path('invoice/<int:pk>/edit', views.SalesInvoiceUpdate.as_view(), name='sales-invoice-update'),
     path('invoice/<int:pk>/settle', views.SalesInvoiceSettle.as_view(), name='sales-invoice-settle'),
@@ -1,27 +1,38 @@
+import datetime
 from typing import Any
 from django.db.models.base import Model as Model
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Value
+from django.db.models.functions import Concat
+from django.core.exceptions import PermissionDenied
 from django.http import FileResponse, Http404
-from django.shortcuts import redirect, render
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, View
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, View, FormView
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
 from django.contrib import messages  
 from django.utils.html import format_html
 from dal import autocomplete
 
+from common.autocomplete import SearchKeyAutocomplete
 from common.helpers import Buttons as Btn
-from common.mixins import BreadcrumbsAndButtonsMixin, ObjectToggle, AuditMixin, FileViewMixin
+from common.mixins import BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, ObjectToggle, AuditMixin, FileViewMixin
+from common.models import InvoiceStatuses
+from dicts import fx
 from dicts.models import Currency
 
-from .forms import ClientForm, ContractForm, ContractItemForm, SalesInvoiceForm, SalesInvoiceSettleForm
+from .forms import ClientForm, ContractForm, ContractItemForm, SalesInvoiceForm, SalesInvoiceSettleForm, SalesInvoiceImportForm, SalesInvoiceBulkForm
+from . import aging, statistics as client_statistics
+from .imports import InvalidImportFile, SalesInvoiceImporter, open_files
 from .models import Client, Contract, ContractItem, SalesInvoice
 
 
-class ClientList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView):
+class ClientList(BreadcrumbsAndButtonsMixin, KeysetPaginationMixin, PermissionRequiredMixin, ListView):
     model = Client
     template_name = 'clients/client_list.html'
+    rows_template_name = 'clients/client_list_rows.html'
     context_object_name = 'clients'
     permission_required = 'clients.view_client'
+    sort_fields = {'name': 'name', 'created': 'created_at'}
+    default_sort = 'name'
 
     def setup(self, request, *args, **kwargs):
         super().setup(request, *args, **kwargs)
@@ -35,20 +46,30 @@ class ClientList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView):
             self.top_buttons.append(Btn.Link('Show all', Client.get_list_all_url(), css_class='outline-primary', icon='eye'))
         if self.listing_all:
             self.top_buttons.append(Btn.Link('Only active', Client.get_list_url(), css_class='outline-primary', icon='zoeye-off'))
+        if self.request.user.has_perm('clients.view_salesinvoice'):
+            self.top_buttons.append(Btn.Link('Aging', Client.get_aging_report_url(), css_class='outline-primary', icon='clock'))
         if self.request.user.has_perm('clients.add_client'):
             self.top_buttons.append(Btn.Link('Add client', Client.get_create_url(), css_class='outline-success', icon='plus'))
     
     def get_queryset(self):
         if self.listing_all:
-            return Client.objects.all()
-        return Client.objects.filter(is_active=True)
+            return Client.objects.for_list()
+        return Client.objects.for_list().filter(is_active=True)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        clients = context['clients']
+        statistics = client_statistics.get([client.pk for client in clients])
+        for client in clients:
+            client.statistics = statistics[client.pk]
+        context['clients'] = clients
+        return context
+
+class ClientAutocomplete(SearchKeyAutocomplete):
+    model = Client
 
-class ClientAutocomplete(LoginRequiredMixin, autocomplete.Select2QuerySetView):
     def get_queryset(self):
-        qs = Client.objects.all().filter(is_active=True).order_by('name')  
-        if self.q:
-            qs = qs.filter(Q(name__icontains=self.q))
-        return qs
+        return Client.objects.filter(is_active=True)
 
 class ClientDetail(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, DetailView):
     model = Client
@@ -67,6 +88,18 @@ class ClientDetail(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, DetailVi
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['contracts'] = self.object.contract_set.all()
+        context['statistics'] = statistics = self.object.get_statistics()
+        default_currency = Currency.get_default()
+        if default_currency and statistics.receivables:
+            currencies = Currency.get_by_id()
+            today = datetime.date.today()
+            try:
+                context['receivables_total'] = fx.sum_amounts(
+                    [(row.open_value, currencies[row.currency_id].code, today) for row in statistics.receivables],
+                    default_currency.code)
+                context['receivables_total_currency'] = default_currency.code
+            except fx.MissingRate:
+                pass
         return context
 
 class ClientCreate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, CreateView):
@@ -160,12 +193,25 @@ class ClientActivate(ObjectToggle):
         self.success_url = self.object.get_absolute_url()
         return super().post(request, *args, **kwargs)
     
-class ContractList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView):
+class ContractList(BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, PermissionRequiredMixin, ListView):
     model = Contract
     client = Client()
     template_name = 'clients/contract_list.html'
+    rows_template_name = 'clients/contract_list_rows.html'
     context_object_name = 'contracts'
     permission_required = 'clients.view_contract'
+    sort_fields = {'number': 'number', 'name': 'name', 'start_date': 'start_date', 'end_date': 'end_date'}
+    default_sort = 'number'
+    htmx_target = '#contract-table-container'
+    export_fields = [
+        ('Number', 'number'),
+        ('Name', 'name'),
+        ('Client', 'client__name'),
+        ('Start date', 'start_date'),
+        ('End date', 'end_date'),
+        ('Owner', Concat('owner__user__first_name', Value(' '), 'owner__user__last_name')),
+        ('Active', 'is_active'),
+    ]
 
     def setup(self, request, *args, **kwargs):
         super().setup(request, *args, **kwargs)
@@ -184,11 +230,21 @@ class ContractList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView
                                        target='#contract-table-container', css_class= 'outline-primary', icon='zoom-out'))
         if self.request.user.has_perm('clients.add_contract'):
             self.top_buttons.append(Btn.Link('Add contract', self.client.get_create_contract_url(), css_class='outline-success', icon='plus'))
+        self.top_buttons.extend(self.get_export_buttons())
     
     def get_queryset(self):
         if self.listing_all:
-            return  Contract.objects.filter( client=self.client)
-        return Contract.objects.filter(is_active=True, client=self.client)
+            return  Contract.objects.for_list().filter( client=self.client)
+        return Contract.objects.for_list().filter(is_active=True, client=self.client)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        contracts = context['contracts']
+        financials = Contract.objects.filter(pk__in=[contract.pk for contract in contracts]).get_financials()
+        for contract in contracts:
+            contract.financials = financials.get(contract.pk, {})
+        context['contracts'] = contracts
+        return context
 
 class ContractCreate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, CreateView):
     model = Contract
@@ -234,6 +290,11 @@ class ContractDetail(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, Detail
         self.top_buttons.append(Btn.Link('Back', self.object.client.get_absolute_url(), css_class= 'outline-primary', icon='arrow-left'))
         self.top_buttons.append(Btn.Link('Edit', self.object.get_update_url(), css_class= 'outline-success', icon='edit'))
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['financials'] = self.object.get_financials()
+        return context
+
 class ContractAudit(AuditMixin, PermissionRequiredMixin, DetailView):
     model = Contract
     permission_required = 'clients.view_contract'
@@ -318,11 +379,15 @@ class ContractActivate(ObjectToggle):
         self.success_url = self.object.get_absolute_url()
         return super().post(request, *args, **kwargs)
 
-class ContractItemList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView):
+class ContractItemList(BreadcrumbsAndButtonsMixin, KeysetPaginationMixin, PermissionRequiredMixin, ListView):
     model = ContractItem
     template_name = 'clients/contract_item_list.html'
+    rows_template_name = 'clients/contract_item_list_rows.html'
     context_object_name = 'contract_items'
     permission_required = 'clients.view_contractitem'
+    sort_fields = {'name': 'name', 'value': 'value'}
+    default_sort = 'name'
+    htmx_target = '#contract-item-table-container'
     contract = Contract()
 
     def setup(self, request, *args, **kwargs):
@@ -337,7 +402,7 @@ class ContractItemList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, List
             self.top_buttons.append(Btn.Link('Add contract item', self.contract.get_create_contract_item_url(), css_class= 'outline-success', icon='plus'))
     
     def get_queryset(self):
-        return ContractItem.objects.filter( contract=self.contract).annotate(invoice_count=Count('salesinvoice'))
+        return ContractItem.objects.for_list().filter( contract=self.contract).annotate(invoice_count=Count('salesinvoice'))
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -435,11 +500,28 @@ class ContractItemUpdate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, Up
         messages.success(self.request, format_html("Contract item <strong>{}</strong> has been updated", self.object))
         return redirect(self.object.contract.get_absolute_url())
 
-class SalesInvoiceList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, ListView):
+class SalesInvoiceList(BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, PermissionRequiredMixin, ListView):
     model = SalesInvoice
     template_name = 'clients/sales_invoice_list.html'
+    rows_template_name = 'clients/sales_invoice_list_rows.html'
     context_object_name = 'sales_invoices'
     permission_required = 'clients.view_salesinvoice'
+    sort_fields = {'number': 'number', 'date': 'date', 'due_date': 'due_date', 'value': 'value'}
+    default_sort = 'date'
+    htmx_target = '#contract-invoice-table-container'
+    export_fields = [
+        ('Number', 'number'),
+        ('Date', 'date'),
+        ('Due date', 'due_date'),
+        ('Status', 'annotated_status'),
+        ('Value', 'value'),
+        ('Currency', 'currency__code'),
+        ('Paid date', 'paid_date'),
+        ('Contract number', 'contract_item__contract__number'),
+        ('Contract', 'contract_item__contract__name'),
+        ('Contract item', 'contract_item__name'),
+        ('Client', 'contract_item__contract__client__name'),
+    ]
     contract = Contract()
     contract_item = ContractItem()
 
@@ -465,18 +547,28 @@ class SalesInvoiceList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, List
                                                 target='#contract-invoice-table-container', css_class='outline-primary', icon='arrow-left'))
         if self.request.user.has_perm('clients.add_salesinvoice') and self.contract.is_active: 
             self.top_buttons.append(Btn.Link('Add sales invoice', self.contract.get_create_invoice_url(), css_class='outline-success', icon='plus'))
+            self.top_buttons.append(Btn.Link('Import', self.contract.get_import_invoices_url(), css_class='outline-success', icon='upload'))
+        self.top_buttons.extend(self.get_export_buttons())
     
     def get_queryset(self):
         if self.contract_item:
-            return SalesInvoice.objects.filter(contract_item=self.contract_item)
-        return SalesInvoice.objects.filter(contract_item__contract=self.contract)
+            queryset = SalesInvoice.objects.for_list().filter(contract_item=self.contract_item)
+        else:
+            queryset = SalesInvoice.objects.for_list().filter(contract_item__contract=self.contract)
+        status = self.request.GET.get('status')
+        if status in InvoiceStatuses.values:
+            queryset = queryset.with_status_value(status)
+        return queryset.with_status()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        if self.request.user.has_perm('clients.change_salesinvoice') or self.request.user.has_perm('clients.delete_salesinvoice'):
+            context['bulk_form'] = SalesInvoiceBulkForm(contract=self.contract)
+            context['bulk_url'] = self.contract.get_bulk_invoices_url()
         sales_invoices = context['sales_invoices']
         for sales_invoice in sales_invoices:
             sales_invoice.buttons = []
-            if sales_invoice.status != 'Paid':
+            if sales_invoice.status != InvoiceStatuses.PAID:
                 sales_invoice.buttons.append(Btn.ShowPopup('Settle', sales_invoice.get_settle_url(), css_class='outline-primary', icon='dollar-sign'))
             sales_invoice.buttons.append(Btn.Link('Edit', sales_invoice.get_update_url(), css_class='outline-success', icon='edit'))
             sales_invoice.buttons.append(Btn.ShowPopup('Delete', sales_invoice.get_delete_url(), css_class='outline-danger', icon='trash-2'))
@@ -511,6 +603,54 @@ class SalesInvoiceCreate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, Cr
         messages.success(self.request, format_html("Invoice {} has been added", form.instance))
         return redirect(self.contract.get_absolute_url())
 
+class SalesInvoiceImport(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, FormView):
+    template_name = 'clients/sales_invoice_import.html'
+    form_class = SalesInvoiceImportForm
+    contract = Contract()
+    permission_required = 'clients.add_salesinvoice'
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.contract = get_object_or_404(Contract.objects.select_related('client'), slug=self.kwargs.get('slug'))
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['contract'] = self.contract
+        return kwargs
+
+    def set_breadcrumbs(self):
+        self.breadcrumbs.add(**Client.get_cls_breadcrumb())
+        self.breadcrumbs.add(**self.contract.client.get_breadcrumb())
+        self.breadcrumbs.add(**self.contract.get_breadcrumb())
+        self.breadcrumbs.add('Import invoices')
+
+    def set_top_buttons(self):
+        self.top_buttons.append(Btn.Link('Cancel', self.contract.get_absolute_url(), css_class= 'outline-primary'))
+
+    def form_valid(self, form):
+        dry_run = form.cleaned_data['dry_run']
+        try:
+            importer = SalesInvoiceImporter(current_user=self.request.user.employee, contract=self.contract,
+                                            files=open_files(form.cleaned_data['attachments']))
+            result = importer.run(form.cleaned_data['csv_file'].read(), dry_run=dry_run)
+        except InvalidImportFile as error:
+            form.add_error(None, str(error))
+            return self.form_invalid(form)
+        except UnicodeDecodeError:
+            form.add_error('csv_file', 'The CSV file must be UTF-8 encoded.')
+            return self.form_invalid(form)
+
+        summary = (f"{len(result.created)} invoices {'to import' if dry_run else 'imported'}, "
+                   f"{len(result.skipped)} already imported, {len(result.errors)} errors.")
+        if result.errors:
+            messages.warning(self.request, summary)
+            return self.render_to_response(self.get_context_data(form=form, result=result))
+        if dry_run:
+            messages.info(self.request, summary)
+            return self.render_to_response(self.get_context_data(form=form, result=result))
+        messages.success(self.request, summary)
+        return redirect(self.contract.get_absolute_url())
+
 class SalesInvoiceUpdate(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, UpdateView):
     model = SalesInvoice
     object = SalesInvoice()
@@ -564,6 +704,45 @@ class SalesInvoiceDelete(ObjectToggle):
         self.success_url = self.object.contract_item.contract.get_absolute_url()
         return super().post(request, *args, **kwargs)
 
+class SalesInvoiceBulkAction(PermissionRequiredMixin, View):
+    """
+    Settle, move or delete the invoices selected on the invoice list of a contract. Responds with
+    a short status for HTMX and triggers "invoicesChanged" so the list reloads itself.
+    """
+    permission_required = 'clients.view_salesinvoice'
+    action_permissions = {
+        SalesInvoiceBulkForm.SETTLE: 'clients.change_salesinvoice',
+        SalesInvoiceBulkForm.REASSIGN: 'clients.change_salesinvoice',
+        SalesInvoiceBulkForm.DELETE: 'clients.delete_salesinvoice',
+    }
+
+    def post(self, request, *args, **kwargs):
+        contract = get_object_or_404(Contract, slug=self.kwargs.get('slug'))
+        form = SalesInvoiceBulkForm(request.POST, contract=contract)
+        if not form.is_valid():
+            errors = [error for field_errors in form.errors.values() for error in field_errors]
+            return render(request, 'clients/sales_invoice_bulk_result.html', {'level': 'danger', 'text': ' '.join(errors)})
+        action = form.cleaned_data['action']
+        if not request.user.has_perm(self.action_permissions[action]):
+            raise PermissionDenied
+
+        invoices = SalesInvoice.objects.filter(contract_item__contract=contract)
+        ids = form.cleaned_data['ids']
+        current_user = request.user.employee
+        if action == SalesInvoiceBulkForm.SETTLE:
+            count = invoices.settle(ids, form.cleaned_data['paid_date'], current_user=current_user)
+            text = f"{count} invoices settled."
+        elif action == SalesInvoiceBulkForm.REASSIGN:
+            contract_item = form.cleaned_data['contract_item']
+            count = invoices.reassign(ids, contract_item, current_user=current_user)
+            text = f"{count} invoices moved to {contract_item}."
+        else:
+            count = invoices.delete_tracked(ids)
+            text = f"{count} invoices deleted."
+        response = render(request, 'clients/sales_invoice_bulk_result.html', {'level': 'success', 'text': text})
+        response['HX-Trigger'] = 'invoicesChanged'
+        return response
+
 class SalesInvoiceView(PermissionRequiredMixin, FileViewMixin):
     model = SalesInvoice
     permission_required = 'clients.view_salesinvoice'
@@ -607,3 +786,71 @@ class SalesInvoiceSettle(PermissionRequiredMixin, UpdateView):
         form.save(current_user=self.request.user.employee)
         messages.success(self.request, format_html("Invoice <strong>{}</strong> has been settled", self.object))
         return redirect(self.object.contract_item.contract.get_absolute_url())
+
+class AgingReport(BreadcrumbsAndButtonsMixin, ExportMixin, PermissionRequiredMixin, ListView):
+    """
+    Receivables aging per client, contract and currency on a day picked with "?date=", read from the
+    nightly snapshot of past days when there is one. HTMX requests render the report table only.
+    """
+    template_name = 'clients/aging_report.html'
+    table_template_name = 'clients/aging_report_table.html'
+    permission_required = 'clients.view_salesinvoice'
+    export_filename = 'receivables aging'
+    export_fields = [
+        ('Client', 'client_name'),
+        ('Contract', 'contract_number'),
+        ('Contract name', 'contract_name'),
+        ('Currency', 'currency_code'),
+        *[(label, field) for field, label, first, last in aging.BUCKETS],
+        ('Total', 'total'),
+    ]
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        try:
+            self.as_of = datetime.date.fromisoformat(request.GET.get('date', ''))
+        except ValueError:
+            self.as_of = datetime.date.today()
+
+    def set_breadcrumbs(self):
+        self.breadcrumbs.add(**Client.get_cls_breadcrumb())
+        self.breadcrumbs.add(text='Receivables aging')
+
+    def get_queryset(self):
+        rows, self.from_snapshot = aging.get_rows(self.as_of)
+        return rows
+
+    def get_export_queryset(self):
+        # The rows are grouped already, select only the exported columns
+        return self.get_queryset().values_list(*[field for header, field in self.export_fields])
+
+    def get_export_filename(self, export_format):
+        return f"receivables-aging-{self.as_of:%Y-%m-%d}.{export_format}"
+
+    def get_export_buttons(self):
+        return [Btn.Link(export_format.upper(), f"?date={self.as_of:%Y-%m-%d}&export={export_format}",
+                         'outline-secondary', icon='download')
+                for export_format in self.export_formats]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rows = list(context['object_list'])
+        for row in rows:
+            row['amounts'] = [row[field] for field in aging.AMOUNT_FIELDS]
+        context['rows'] = rows
+        context['totals'] = {code: [totals[field] for field in aging.AMOUNT_FIELDS]
+                             for code, totals in aging.get_totals(rows).items()}
+        context['bucket_labels'] = [label for field, label, first, last in aging.BUCKETS]
+        context['as_of'] = self.as_of
+        context['from_snapshot'] = self.from_snapshot
+        context['export_buttons'] = self.get_export_buttons()
+        if not self.request.headers.get('HX-Request'):
+            context['trend'] = [(as_of, {code: [totals[field] for field in aging.AMOUNT_FIELDS]
+                                         for code, totals in currencies.items()})
+                                for as_of, currencies in aging.get_trend()]
+        return context
+
+    def get_template_names(self):
+        if self.request.headers.get('HX-Request') == 'true':
+            return [self.table_template_name]
+        return [self.template_name]
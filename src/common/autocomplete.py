@@ -0,0 +1,73 @@
+"""
+Autocomplete views matching the indexed search_key column of SearchKeyModel.
+
+Every word typed must start a word of the key. Keys starting with the first word are read with
+an index range scan; when they do not fill the limit, keys where it starts a later word are added,
+found with a range scan of the SearchKeyWord index. Responses are cached for a short time per
+normalized query and invalidated whenever a row of the model is saved.
+"""
+import hashlib
+
+from dal import autocomplete
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.http import JsonResponse
+
+from utils.normalize import normalize
+from . import cache
+from .models import SearchKeyWord
+
+# Sorts after every character a normalized key can contain
+KEY_END = '\uffff'
+
+
+def word_starts_with(word):
+    return Q(search_key__startswith=word) | Q(search_key__contains=' ' + word)
+
+
+def filter_by_search_key(queryset, query, limit):
+    """
+    At most limit rows of queryset whose search_key words start with the words of query, in key order.
+    Rows where the first word starts the key take precedence over rows where it starts a later word.
+    """
+    words = normalize(query).split()
+    if not words:
+        return list(queryset.order_by('search_key')[:limit])
+    first, others = words[0], words[1:]
+    leading = Q(search_key__gte=first, search_key__lt=first + KEY_END)
+    for word in others:
+        queryset = queryset.filter(word_starts_with(word))
+
+    rows = list(queryset.filter(leading).order_by('search_key')[:limit])
+    if len(rows) < limit:
+        later = SearchKeyWord.objects.filter(model=queryset.model._meta.label_lower,
+                                             word__gte=first, word__lt=first + KEY_END)
+        rows += queryset.filter(pk__in=later.values('object_id')).exclude(leading).order_by('search_key')[:limit - len(rows)]
+    return rows
+
+
+class SearchKeyAutocomplete(LoginRequiredMixin, autocomplete.Select2QuerySetView):
+    """
+    Select2 autocomplete over get_queryset() of a SearchKeyModel, without pagination (and its COUNT query).
+    """
+    limit = 20
+
+    def get_cache_timeout(self):
+        return getattr(settings, 'AUTOCOMPLETE_CACHE_TIMEOUT', 30)
+
+    def get_results_for_query(self):
+        rows = filter_by_search_key(self.get_queryset(), self.q, self.limit)
+        return [{
+            'id': self.get_result_value(row),
+            'text': self.get_result_label(row),
+            'selected_text': self.get_selected_result_label(row),
+        } for row in rows]
+
+    def get(self, request, *args, **kwargs):
+        view = f'{type(self).__module__}.{type(self).__name__}'
+        # Digest of the query, cache keys may not contain spaces or non-ASCII characters
+        query = hashlib.md5(normalize(self.q).encode()).hexdigest()
+        results = cache.get_or_set('autocomplete', [view, query], self.get_results_for_query,
+                                   timeout=self.get_cache_timeout(), depends_on=[self.model])
+        return JsonResponse({'results': results, 'pagination': {'more': False}})
@@ -0,0 +1,150 @@
+"""
+Cache helpers on top of the configured Django cache backend.
+
+Keys are namespaced ("workify:<namespace>:<parts>") and can depend on per-model generation
+counters. A model's generation changes whenever one of its rows is saved or deleted
+(TrackableModel does it automatically), so keys built from it never serve stale data and
+nothing has to be deleted explicitly. Writes that bypass save() - queryset.update(),
+bulk_create() - have to call bump_model_generation() themselves.
+"""
+import hashlib
+import threading
+import time
+import weakref
+
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'workify'
+MAX_KEY_LENGTH = 200
+
+
+def make_key(namespace, *parts):
+    key = ':'.join([KEY_PREFIX, namespace, *(str(part) for part in parts)])
+    if len(key) > MAX_KEY_LENGTH:
+        # Memcached-like backends limit key length, long keys are shortened to a digest
+        key = f'{KEY_PREFIX}:{namespace}:{hashlib.md5(key.encode()).hexdigest()}'
+    return key
+
+
+def get_model_namespace(model):
+    # A model class or its 'app_label.ModelName' label, for modules that cannot import the model
+    if isinstance(model, str):
+        return model.lower()
+    return model._meta.label_lower
+
+
+def _generation_key(namespace):
+    return make_key('generation', namespace)
+
+
+def get_generation(namespace):
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock rather than 1, so a counter lost on eviction never repeats an old value
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    key = _generation_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = int(time.time() * 1000)
+        cache.set(key, generation, None)
+        return generation
+
+
+def get_model_generation(model):
+    return get_generation(get_model_namespace(model))
+
+
+def bump_model_generation(model):
+    """
+    Invalidate everything cached for model. Bumped again after the surrounding transaction commits,
+    so a reader that rebuilt its cache from not yet committed data does not keep it.
+    """
+    namespace = get_model_namespace(model)
+    bump_generation(namespace)
+    _expire_generation_caches(namespace)
+    transaction.on_commit(lambda: (bump_generation(namespace), _expire_generation_caches(namespace)))
+
+
+def get_generations(models):
+    return '.'.join(str(get_model_generation(model)) for model in models)
+
+
+def versioned_key(namespace, *parts, depends_on=()):
+    """
+    Key that changes whenever a row of one of the depends_on models is written.
+    """
+    return make_key(namespace, *parts, get_generations(depends_on)) if depends_on else make_key(namespace, *parts)
+
+
+def get_or_set(namespace, parts, default, timeout=None, depends_on=()):
+    """
+    Cached value under the namespaced key, computed by calling default() on a miss.
+    """
+    key = versioned_key(namespace, *parts, depends_on=depends_on)
+    value = cache.get(key)
+    if value is None:
+        value = default()
+        cache.set(key, value, timeout)
+    return value
+
+
+class GenerationCache:
+    """
+    Process-local cache of one value built from the database, rebuilt only when the generation
+    of one of the depends_on models changed. Suited for small, hot structures - dictionaries,
+    trees - that are cheaper to keep as Python objects than to unpickle on every request.
+
+    With recheck_after, the generations are read at most once per that many seconds: writes in
+    this process are seen at once, writes in other processes up to recheck_after seconds later.
+    """
+    def __init__(self, builder, depends_on, recheck_after=0):
+        self.builder = builder
+        self.depends_on = depends_on
+        self.recheck_after = recheck_after
+        self.namespaces = {get_model_namespace(model) for model in depends_on}
+        self._lock = threading.Lock()
+        # (generation, value, monotonic time of the last generation read), replaced as a whole
+        self._state = (None, None, 0)
+        _generation_caches.add(self)
+
+    def get(self):
+        generation, value, checked_at = self._state
+        if generation is not None and time.monotonic() - checked_at < self.recheck_after:
+            return value
+        generation = get_generations(self.depends_on)
+        with self._lock:
+            if self._state[0] != generation:
+                value = self.builder()
+            else:
+                value = self._state[1]
+            self._state = (generation, value, time.monotonic())
+            return value
+
+    def expire(self):
+        """
+        Read the generations again on the next get().
+        """
+        with self._lock:
+            generation, value, checked_at = self._state
+            self._state = (generation, value, 0)
+
+    def clear(self):
+        with self._lock:
+            self._state = (None, None, 0)
+
+
+_generation_caches = weakref.WeakSet()
+
+
+def _expire_generation_caches(namespace):
+    for generation_cache in list(_generation_caches):
+        if namespace in generation_cache.namespaces:
+            generation_cache.expire()
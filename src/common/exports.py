@@ -0,0 +1,174 @@
+"""
+Streaming writers for tabular exports.
+
+Both writers take an iterable of rows and return a generator of byte chunks, so a response
+built on them holds one chunk of rows in memory no matter how long the export is.
+"""
+import csv
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+# Characters not allowed in XML 1.0 documents
+_illegal_xml = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_excel_epoch = datetime.datetime(1899, 12, 30)
+# Text starting with one of these is read as a formula by spreadsheet applications
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class _Buffer:
+    """
+    Write-only file object whose content is taken out after every chunk of rows.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in self.chunks)
+        self.chunks = []
+        return data
+
+
+def csv_value(value):
+    # Quote text that would run as a formula (CSV injection), numbers are left alone
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows, rows_per_chunk=500):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    # Byte order mark, so spreadsheet applications detect UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for number, row in enumerate(rows, start=1):
+        writer.writerow([csv_value(value) for value in row])
+        if number % rows_per_chunk == 0:
+            yield buffer.take()
+    yield buffer.take()
+
+
+def column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+STYLE_DATE = 1
+STYLE_DATETIME = 2
+
+
+def xlsx_cell(reference, value):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        serial = (value - _excel_epoch).total_seconds() / 86400
+        return f'<c r="{reference}" s="{STYLE_DATETIME}"><v>{serial}</v></c>'
+    if isinstance(value, datetime.date):
+        serial = (value - _excel_epoch.date()).days
+        return f'<c r="{reference}" s="{STYLE_DATE}"><v>{serial}</v></c>'
+    text = escape(_illegal_xml.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(number, values):
+    cells = ''.join(xlsx_cell(f'{column_letter(index)}{number}', value) for index, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Cell formats: 0 - general, 1 - date (built-in format 14), 2 - date and time (built-in format 22)
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+def stream_xlsx(header, rows, sheet_name='Export', rows_per_chunk=500):
+    """
+    Write a single-sheet XLSX workbook. The zip archive is written to a non-seekable buffer,
+    so entries use data descriptors and the worksheet is compressed as the rows arrive.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(sheet_name=escape(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+        yield buffer.take()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(XLSX_SHEET_START.encode())
+            sheet.write(xlsx_row(1, header).encode())
+            for number, row in enumerate(rows, start=2):
+                sheet.write(xlsx_row(number, row).encode())
+                if number % rows_per_chunk == 0:
+                    yield buffer.take()
+            sheet.write(XLSX_SHEET_END.encode())
+    yield buffer.take()
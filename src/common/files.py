@@ -0,0 +1,128 @@
+"""
+Helpers for serving stored files: validators, byte ranges and front-end server offload.
+
+Offloading is configured with FILE_OFFLOAD:
+    None                 - Django streams the file (default)
+    'x-sendfile'         - Apache mod_xsendfile / lighttpd, the header carries the file system path
+    'x-accel-redirect'   - nginx, the header carries FILE_OFFLOAD_PREFIX + the name under MEDIA_ROOT; the prefix
+                           must point to an `internal` location aliased to MEDIA_ROOT
+"""
+import datetime
+import hashlib
+import mimetypes
+import re
+import urllib.parse
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import ContentAddressedStorage
+
+X_SENDFILE = 'x-sendfile'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+BLOCK_SIZE = 64 * 1024
+
+_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def guess_content_type(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding or content_type is None:
+        # A gzip-compressed file is served as is, not as its decompressed type
+        return 'application/octet-stream'
+    return content_type
+
+
+def get_modified_time(field_file):
+    try:
+        return field_file.storage.get_modified_time(field_file.name)
+    except (NotImplementedError, OSError):
+        return None
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, end inclusive, or None when the header is not a single
+    byte range. Raises ValueError when the range cannot be satisfied.
+    """
+    match = _range.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, end
+
+
+def if_range_matches(header, etag, last_modified):
+    """
+    If-Range holds either a strong ETag or an HTTP date; the range is only served when it still matches.
+    """
+    if header.startswith('"') or header.startswith('W/'):
+        return etag is not None and header == etag
+    if last_modified is None:
+        return False
+    date = parse_http_date_safe(header)
+    return date is not None and date == int(last_modified.timestamp())
+
+
+def read_range(file, start, end):
+    with file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def get_offload_mode():
+    mode = getattr(settings, 'FILE_OFFLOAD', None)
+    return mode.lower() if mode else None
+
+
+def offload_response(field_file, content_type):
+    """
+    Empty response telling the front-end server to send the file itself, or None when offloading
+    is disabled or the storage is not on the local file system.
+    """
+    mode = get_offload_mode()
+    if mode == X_SENDFILE:
+        try:
+            path = field_file.path
+        except NotImplementedError:
+            return None
+        response = HttpResponse(content_type=content_type)
+        # Percent-encoded, headers cannot carry non-ASCII names; mod_xsendfile and lighttpd decode it
+        response['X-Sendfile'] = urllib.parse.quote(path)
+        return response
+    if mode == X_ACCEL_REDIRECT:
+        prefix = getattr(settings, 'FILE_OFFLOAD_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        name = field_file.name
+        if isinstance(field_file.storage, ContentAddressedStorage):
+            name = field_file.storage.location_name(name)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + urllib.parse.quote(name.lstrip('/'))
+        return response
+    return None
+
+
+def format_last_modified(last_modified):
+    if isinstance(last_modified, datetime.datetime):
+        return http_date(last_modified.timestamp())
+    return None
@@ -0,0 +1,212 @@
+"""
+Square WebP and PNG renditions of avatars and logos, see ImageRenditionsModel.
+
+Renditions are built on a small thread pool after the transaction saving a new image commits, so
+an upload never waits for the resizing; until they are ready pages show the original image.
+Renditions superseded by a new image are deleted unless another row uses the same content: the
+Rendition table counts the rows referring to each file.
+"""
+import collections
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+RENDITION_SIZES = (32, 64, 256)
+RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 85, 'method': 6},
+    'png': {'format': 'PNG', 'optimize': True},
+}
+RENDITION_DIR = 'renditions/'
+
+logger = logging.getLogger('workify.images')
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_rendition_name(content, extension):
+    return f'{RENDITION_DIR}{hashlib.sha256(content).hexdigest()[:20]}.{extension}'
+
+
+def build_renditions(image_file):
+    """
+    Store square renditions of image_file in every size and format, named by their content hash.
+    Returns the description kept in the renditions field of the model.
+    """
+    with image_file.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    sizes = {}
+    for size in RENDITION_SIZES:
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        sizes[str(size)] = {}
+        for extension, options in RENDITION_FORMATS.items():
+            output = BytesIO()
+            resized.save(output, **options)
+            content = output.getvalue()
+            name = get_rendition_name(content, extension)
+            # Same content, same name, so an existing rendition never has to be written again.
+            # Always in the default storage, which RenditionView serves from
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(content))
+            sizes[str(size)][extension] = name
+    return {'source': image_file.name, 'sizes': sizes}
+
+
+def get_rendition_names(renditions):
+    return {name for formats in renditions.get('sizes', {}).values() for name in formats.values()}
+
+
+def add_references(names, count=1):
+    """
+    Add count (negative to release) to the references of names.
+    """
+    Rendition = apps.get_model('common', 'Rendition')
+    for name in names:
+        rendition, created = Rendition.objects.get_or_create(name=name, defaults={'ref_count': max(count, 0)})
+        if not created:
+            Rendition.objects.filter(pk=name).update(ref_count=F('ref_count') + count)
+
+
+def delete_unused_renditions(names):
+    """
+    Delete the references of names that dropped to zero and their files, in the transaction that
+    released them: the rows stay locked until it commits, so a concurrent upload of the same content
+    takes a new reference afterwards and finds the file missing, see update_renditions().
+    """
+    Rendition = apps.get_model('common', 'Rendition')
+    with transaction.atomic():
+        unused = list(Rendition.objects.select_for_update().filter(name__in=names, ref_count__lte=0)
+                      .values_list('name', flat=True))
+        Rendition.objects.filter(name__in=unused).delete()
+        for name in unused:
+            default_storage.delete(name)
+
+
+def get_collected_renditions(collector):
+    """
+    Counter of the rendition names of the rows a deletion Collector is about to delete.
+    """
+    collected = collections.Counter()
+    for model, instances in collector.data.items():
+        if getattr(model, 'rendition_source_field', None):
+            for instance in instances:
+                collected.update(get_rendition_names(instance.renditions))
+    for queryset in collector.fast_deletes:
+        if getattr(queryset.model, 'rendition_source_field', None):
+            for renditions in queryset.values_list('renditions', flat=True):
+                collected.update(get_rendition_names(renditions))
+    return collected
+
+
+def release_renditions(released):
+    """
+    Release the references of a Counter of rendition names and delete the unused ones.
+    """
+    with transaction.atomic():
+        for name, count in released.items():
+            add_references([name], -count)
+        delete_unused_renditions(released)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+                                           thread_name_prefix='image-renditions')
+        return _executor
+
+
+def schedule_renditions(instance):
+    """
+    Update the renditions of instance once the surrounding transaction commits: on the thread pool,
+    or right away with IMAGE_RENDITION_WORKERS = 0.
+    """
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        if not getattr(settings, 'IMAGE_RENDITION_WORKERS', 2):
+            update_renditions(model, pk)
+            return
+        try:
+            get_executor().submit(_run_update, model, pk)
+        except RuntimeError:
+            # The pool is shut down while the process exits, build_image_renditions catches up
+            pass
+
+    transaction.on_commit(submit)
+
+
+def _run_update(model, pk):
+    close_old_connections()
+    try:
+        update_renditions(model, pk)
+    except Exception:
+        logger.exception('Building renditions failed for %s %s', model._meta.label, pk)
+    finally:
+        close_old_connections()
+
+
+def update_renditions(model, pk, force=False):
+    """
+    Build the renditions of the current image of a row when they are outdated, store them and delete
+    the superseded ones. Returns whether the row was updated.
+    """
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return False
+    if force:
+        instance.renditions = {}
+    if not instance.sync_renditions():
+        return False
+    source_field = model.rendition_source_field
+    built = get_rendition_names(instance.renditions)
+    with transaction.atomic():
+        add_references(built)
+        # Only while the image is the one the renditions were built from, a newer upload has its own update
+        row = model._default_manager.filter(pk=pk, **{source_field: instance.renditions.get('source', '')})
+        current = row.select_for_update().values_list('renditions', flat=True).first()
+        updated = current is not None and row.update(renditions=instance.renditions)
+        superseded = get_rendition_names(current or {})
+        add_references(superseded if updated else built, -1)
+        delete_unused_renditions(superseded | built)
+    if updated and not all(default_storage.exists(name) for name in built):
+        # Deleted by a concurrent update between building and referencing them
+        build_renditions(getattr(instance, source_field))
+    return bool(updated)
+
+
+def get_rendition_url(name):
+    return reverse('common:rendition', kwargs={'name': name[len(RENDITION_DIR):]})
+
+
+def get_srcset(renditions, size):
+    """
+    srcset values of every format for an image displayed at size px, with the best fitting PNG as src.
+    Returns None when there are no renditions.
+    """
+    sizes = renditions.get('sizes') if renditions else None
+    if not sizes:
+        return None
+    available = sorted((int(key) for key in sizes if int(key) >= size)) or [max(int(key) for key in sizes)]
+    srcset = {
+        extension: ', '.join(f"{get_rendition_url(sizes[str(width)][extension])} {width / size:g}x" for width in available)
+        for extension in RENDITION_FORMATS
+    }
+    srcset['src'] = get_rendition_url(sizes[str(available[0])]['png'])
+    return srcset
@@ -0,0 +1,173 @@
+import inspect
+import json
+import math
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client as TestClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, URLResolver, get_resolver, resolve, reverse, Resolver404
+
+
+def iter_view_names(patterns, namespace=None):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            nested = ':'.join(filter(None, [namespace, pattern.namespace])) or None
+            yield from iter_view_names(pattern.url_patterns, nested)
+        elif pattern.name:
+            yield ':'.join(filter(None, [namespace, pattern.name])), bool(pattern.pattern.converters)
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ("Request every named URL in workify/urls.py through the test client, report latency percentiles "
+            "and query counts, and compare them with a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Email of the user to log in as, the first superuser by default.")
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--exclude', nargs='*', default=['admin', 'sso'],
+                            help="URL namespaces to skip, admin and sso (login redirects) by default.")
+        parser.add_argument('--save', metavar='PATH', help="Store the results as a JSON baseline.")
+        parser.add_argument('--compare', metavar='PATH', help="Compare the results with a JSON baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative p50 slowdown against the baseline.")
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help="Slowdowns smaller than this are never reported.")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        client = TestClient()
+        client.force_login(user)
+
+        # Views may change data (toggles, settlement), so everything is rolled back afterwards
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+            urls, skipped = self.collect_urls(options['exclude'])
+            results = {view_name: self.measure(client, url, options['repeat'], options['warmup'])
+                       for view_name, url in sorted(urls.items())}
+            transaction.set_rollback(True)
+
+        self.print_results(results)
+        for view_name in skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {view_name}: no sample object to build the URL from."))
+
+        if options['save']:
+            with open(options['save'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['save']}."))
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.compare(results, baseline, options['tolerance'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError(f"{len(regressions)} URL(s) regressed against {options['compare']}.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def get_user(self, email):
+        users = User.objects.filter(email=email) if email else User.objects.filter(is_superuser=True).order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to log in as, pass --user or create a superuser.")
+        return user
+
+    def collect_urls(self, exclude):
+        """
+        Map view names to one URL each. URLs without parameters are reversed directly, the rest are taken from
+        the get_*_url methods of a sample instance of every model in the project apps.
+        """
+        view_names = {}
+        for view_name, has_params in iter_view_names(get_resolver().url_patterns):
+            if view_name.split(':')[0] not in exclude:
+                view_names[view_name] = has_params
+
+        urls = {}
+        for view_name, has_params in view_names.items():
+            if not has_params:
+                urls[view_name] = reverse(view_name)
+        for url in self.iter_sample_urls():
+            try:
+                view_name = resolve(url).view_name
+            except Resolver404:
+                continue
+            if view_name in view_names and view_name not in urls:
+                urls[view_name] = url
+        return urls, sorted(set(view_names) - set(urls))
+
+    def iter_sample_urls(self):
+        for app_config in apps.get_app_configs():
+            if not app_config.path.startswith(str(settings.BASE_DIR)):
+                continue
+            for model in app_config.get_models():
+                instance = model._default_manager.order_by('pk').first()
+                if instance is None:
+                    continue
+                for name, method in inspect.getmembers(instance, inspect.ismethod):
+                    if not (name.startswith('get_') and name.endswith('_url')):
+                        continue
+                    if any(parameter.default is parameter.empty and parameter.kind not in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD)
+                           for parameter in inspect.signature(method).parameters.values()):
+                        continue
+                    try:
+                        yield str(method())
+                    except (NoReverseMatch, AttributeError, ObjectDoesNotExist):
+                        continue
+
+    def measure(self, client, url, repeat, warmup):
+        for _ in range(warmup):
+            client.get(url)
+        timings, queries, status = [], 0, None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(context.captured_queries))
+            status = response.status_code
+        return {
+            'url': url,
+            'status': status,
+            'queries': queries,
+            'p50': round(percentile(timings, 50), 2),
+            'p90': round(percentile(timings, 90), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'max': round(max(timings), 2),
+        }
+
+    def print_results(self, results):
+        self.stdout.write(f"{'view':<45} {'status':>6} {'queries':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+        for view_name, result in results.items():
+            self.stdout.write(f"{view_name:<45} {result['status']:>6} {result['queries']:>7} "
+                              f"{result['p50']:>9.2f} {result['p90']:>9.2f} {result['p99']:>9.2f}")
+
+    def compare(self, results, baseline, tolerance, min_delta_ms):
+        regressions = []
+        for view_name, result in results.items():
+            previous = baseline.get(view_name)
+            if previous is None:
+                continue
+            problems = []
+            if result['queries'] > previous['queries']:
+                problems.append(f"queries {previous['queries']} -> {result['queries']}")
+            slowdown = result['p50'] - previous['p50']
+            if slowdown > min_delta_ms and result['p50'] > previous['p50'] * (1 + tolerance):
+                problems.append(f"p50 {previous['p50']:.2f} ms -> {result['p50']:.2f} ms")
+            if result['status'] != previous['status']:
+                problems.append(f"status {previous['status']} -> {result['status']}")
+            if problems:
+                regressions.append(view_name)
+                self.stdout.write(self.style.ERROR(f"{view_name}: {', '.join(problems)}"))
+        return regressions
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from clients.models import Client
+from common import images
+from employees.models import Employee
+
+
+class Command(BaseCommand):
+    help = "Build the missing or outdated avatar and logo renditions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild every rendition.")
+
+    def handle(self, *args, **options):
+        for model in (Employee, Client):
+            updated = 0
+            queryset = model.objects.exclude(**{model.rendition_source_field: ''})
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                if images.update_renditions(model, pk, force=options['force']):
+                    updated += 1
+            self.stdout.write(self.style.SUCCESS(f"{model._meta.verbose_name_plural}: {updated} updated."))
@@ -0,0 +1,73 @@
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from common.models import Blob
+from common.storage import BLOB_DIR, ContentAddressedStorage, get_blob_storage
+
+
+def get_blob_fields():
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field
+
+
+class Command(BaseCommand):
+    help = ("Delete the content-addressed blobs no file field refers to, "
+            "once they were not uploaded again for the grace period.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=24,
+                            help="Keep unreferenced blobs younger than this many hours, uploads may not be saved yet.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting it.")
+
+    def handle(self, *args, **options):
+        storage = get_blob_storage()
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace'])
+
+        referenced = set()
+        for model, field in get_blob_fields():
+            names = model._default_manager.exclude(**{field.name: ''}).values_list(field.name, flat=True)
+            for name in names.iterator(chunk_size=2000):
+                digest = storage.digest(name)
+                if digest:
+                    referenced.add(digest)
+
+        deleted = freed = 0
+        for blob in Blob.objects.filter(uploaded_at__lt=cutoff).iterator(chunk_size=2000):
+            if blob.digest in referenced:
+                continue
+            if not dry_run:
+                # Only while the content was not uploaded again in the meantime. The row stays locked
+                # until the file is gone, an upload waits for it and stores the file again
+                with transaction.atomic():
+                    if not Blob.objects.filter(pk=blob.digest, uploaded_at=blob.uploaded_at).delete()[0]:
+                        continue
+                    storage.delete_blob(blob.digest)
+            deleted += 1
+            freed += blob.size
+
+        # Files without a Blob row: interrupted uploads and uploads rolled back with their transaction
+        orphans = 0
+        root = os.path.join(storage.location, BLOB_DIR)
+        known = set(Blob.objects.values_list('digest', flat=True).iterator(chunk_size=2000))
+        for directory, subdirectories, file_names in os.walk(root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                if file_name in known or os.path.getmtime(path) > cutoff.timestamp():
+                    continue
+                orphans += 1
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+
+        prefix = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {deleted} unreferenced blobs and {orphans} orphaned files ({freed} bytes)."
+        ))
@@ -0,0 +1,255 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
+
+from budgets.models import Budget
+from clients import statistics
+from clients.models import Client, Contract, ContractItem, SalesInvoice
+from common import cache, search
+from common.models import SearchKeyModel, SearchKeyWord, get_search_key_words
+from dicts import tree as dimension_tree
+from dicts.models import Currency, Dimension
+from employees.models import Employee, EmployeeRate, EmployeeRateTypes
+from projects.models import Project, ProjectBudgetAssignment
+from utils.normalize import make_search_key
+
+FIRST_NAMES = ['Anna', 'Piotr', 'Maria', 'Jan', 'Katarzyna', 'Tomasz', 'Agnieszka', 'Paweł', 'Ewa', 'Michał',
+               'John', 'Emma', 'Oliver', 'Sophie', 'Lucas', 'Mia', 'Noah', 'Laura', 'David', 'Julia']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewski', 'Wójcik', 'Kamiński', 'Lewandowski', 'Zieliński', 'Smith',
+              'Johnson', 'Brown', 'Miller', 'Davis', 'Wilson', 'Taylor', 'Anderson', 'Thomas', 'Moore', 'Clark']
+COMPANY_WORDS = ['Alpha', 'Nova', 'Blue', 'Green', 'Delta', 'Summit', 'Vertex', 'Orbit', 'Pioneer', 'Atlas',
+                 'Bright', 'Nordic', 'Silver', 'Quantum', 'Harbor', 'Union', 'Crest', 'Prime', 'Metro', 'Zenith']
+COMPANY_SUFFIXES = ['Systems', 'Logistics', 'Energy', 'Retail', 'Media', 'Finance', 'Labs', 'Foods', 'Group', 'Health']
+ITEM_NAMES = ['Implementation', 'Support', 'Licences', 'Consulting', 'Maintenance', 'Training', 'Hosting', 'Audit']
+DIMENSIONS = {
+    'Department': ['Development', 'Consulting', 'Operations', 'Sales', 'Support'],
+    'Region': ['North', 'South', 'East', 'West', 'Abroad'],
+    'Product': ['Platform', 'Mobile', 'Analytics', 'Integrations', 'Services'],
+}
+CURRENCIES = [('EUR', 'Euro'), ('USD', 'US Dollar'), ('PLN', 'Polish Zloty')]
+
+
+class Command(BaseCommand):
+    help = "Generate a production-sized set of demo data with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--contracts-per-client', type=int, default=2)
+        parser.add_argument('--items-per-contract', type=int, default=3)
+        parser.add_argument('--invoices-per-item', type=int, default=40)
+        parser.add_argument('--employees', type=int, default=500)
+        parser.add_argument('--rates-per-employee', type=int, default=4)
+        parser.add_argument('--projects', type=int, default=1000)
+        parser.add_argument('--budgets', type=int, default=300)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Every run gets its own slug suffix so it can be repeated on top of existing data
+        self.tag = get_random_string(4, 'abcdefghijklmnopqrstuvwxyz0123456789')
+        self.today = datetime.date.today()
+
+        with transaction.atomic():
+            currencies = self.get_currencies()
+            dimensions = self.create_dimensions()
+            employees = self.create_employees(options['employees'])
+            self.create_rates(employees, currencies, options['rates_per_employee'])
+            clients = self.create_clients(options['clients'])
+            contracts = self.create_contracts(clients, employees, options['contracts_per_client'])
+            items = self.create_contract_items(contracts, currencies, dimensions, options['items_per_contract'])
+            self.create_invoices(items, options['invoices_per_item'])
+            budgets = self.create_budgets(currencies, options['budgets'])
+            self.create_projects(clients, employees, budgets, options['projects'])
+            client_ids = [client.pk for client in clients]
+            for start in range(0, len(client_ids), statistics.BATCH_SIZE):
+                statistics.refresh(client_ids[start:start + statistics.BATCH_SIZE])
+        # bulk_create bypasses save(), which keeps the search index up to date
+        self.stdout.write(f"search documents: {search.rebuild()}")
+        self.stdout.write(self.style.SUCCESS(f"Demo data generated (slug suffix '{self.tag}')."))
+
+    def bulk_create(self, model, objects, keep=True):
+        """
+        Insert objects in batches of batch_size. With keep=False the objects are not collected,
+        which allows feeding large generators without holding every row in memory.
+        """
+        created, batch, total = [], [], 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                total += self._flush(model, batch, created, keep)
+                batch = []
+        if batch:
+            total += self._flush(model, batch, created, keep)
+        cache.bump_model_generation(model)
+        self.stdout.write(f"{model._meta.verbose_name_plural}: {total}")
+        return created
+
+    def _flush(self, model, batch, created, keep):
+        if issubclass(model, SearchKeyModel):
+            # bulk_create bypasses save(), which fills the key
+            for obj in batch:
+                obj.search_key = make_search_key(*obj.get_search_key_parts())
+        inserted = model.objects.bulk_create(batch)
+        if issubclass(model, SearchKeyModel):
+            SearchKeyWord.objects.bulk_create([word for obj in inserted for word in get_search_key_words(obj)])
+        if keep:
+            created.extend(inserted)
+        return len(inserted)
+
+    def random_date(self, days_back):
+        return self.today - datetime.timedelta(days=self.random.randint(0, days_back))
+
+    def get_currencies(self):
+        currencies = []
+        for code, name in CURRENCIES:
+            currency, _ = Currency.objects.get_or_create(code=code, defaults={'name': name})
+            currencies.append(currency)
+        if not Currency.objects.filter(default=True).exists():
+            Currency.objects.filter(pk=currencies[0].pk).update(default=True)
+        return currencies
+
+    def create_dimensions(self):
+        top_level = self.bulk_create(Dimension, (Dimension(name=f'{name} {self.tag}') for name in DIMENSIONS))
+        children = self.bulk_create(Dimension, (
+            Dimension(name=name, parent=parent)
+            for parent, names in zip(top_level, DIMENSIONS.values())
+            for name in names
+        ))
+        leaves = self.bulk_create(Dimension, (
+            Dimension(name=f'{parent.name} {number}', parent=parent)
+            for parent in children
+            for number in range(1, 4)
+        ))
+        Dimension.rebuild_paths()
+        dimension_tree.bump_version()
+        return {top.pk: [leaf for leaf in leaves if leaf.parent.parent_id == top.pk] for top in top_level}
+
+    def create_employees(self, count):
+        password = make_password(None)
+        users = self.bulk_create(User, (
+            User(username=f'{self.tag}.{number}@example.com', email=f'{self.tag}.{number}@example.com',
+                 first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES),
+                 password=password)
+            for number in range(count)
+        ))
+        return self.bulk_create(Employee, (
+            Employee(user=user, slug=slugify(f'{user.first_name} {user.last_name} {self.tag} {number}'))
+            for number, user in enumerate(users)
+        ))
+
+    def create_rates(self, employees, currencies, count):
+        def rates():
+            for employee in employees:
+                currency = self.random.choice(currencies)
+                basic_rate = Decimal(self.random.randrange(50, 150))
+                valid_from = self.today.replace(day=1) - datetime.timedelta(days=365 * count)
+                for number in range(count):
+                    valid_to = valid_from + datetime.timedelta(days=364)
+                    yield EmployeeRate(
+                        employee=employee, currency=currency, valid_from=valid_from,
+                        valid_to=None if number == count - 1 else valid_to,
+                        rate_type=self.random.choice(EmployeeRateTypes.values),
+                        basic_rate=basic_rate, chargable_rate=basic_rate * Decimal('1.5'),
+                    )
+                    valid_from = valid_to + datetime.timedelta(days=1)
+                    basic_rate += self.random.randrange(0, 20)
+        self.bulk_create(EmployeeRate, rates(), keep=False)
+
+    def company_name(self):
+        return f'{self.random.choice(COMPANY_WORDS)} {self.random.choice(COMPANY_SUFFIXES)}'
+
+    def create_clients(self, count):
+        def clients():
+            for number in range(count):
+                name = self.company_name()
+                yield Client(name=name, slug=slugify(f'{name} {self.tag} {number}'), is_active=self.random.random() > 0.1)
+        return self.bulk_create(Client, clients())
+
+    def create_contracts(self, clients, employees, per_client):
+        def contracts():
+            for client in clients:
+                for number in range(per_client):
+                    start_date = self.random_date(3 * 365)
+                    yield Contract(
+                        client=client, slug=f'{client.slug}-{number}', number=f'{client.pk}/{number + 1}',
+                        name=f'{self.random.choice(ITEM_NAMES)} agreement', start_date=start_date,
+                        end_date=start_date + datetime.timedelta(days=self.random.choice([365, 730, 1095])),
+                        owner=self.random.choice(employees), is_active=self.random.random() > 0.2,
+                    )
+        return self.bulk_create(Contract, contracts())
+
+    def create_contract_items(self, contracts, currencies, dimensions, per_contract):
+        items = self.bulk_create(ContractItem, (
+            ContractItem(contract=contract, name=self.random.choice(ITEM_NAMES),
+                         value=Decimal(self.random.randrange(1000, 500000)), currency=self.random.choice(currencies))
+            for contract in contracts
+            for _ in range(per_contract)
+        ))
+        # One leaf of every top-level dimension per item, like the contract item form does
+        through = ContractItem.dimension.through
+        self.bulk_create(through, (
+            through(contractitem_id=item.pk, dimension_id=self.random.choice(leaves).pk)
+            for item in items
+            for leaves in dimensions.values()
+        ), keep=False)
+        return items
+
+    def create_invoices(self, items, per_item):
+        def invoices():
+            for item in items:
+                value = (item.value / per_item).quantize(Decimal('0.01'))
+                for number in range(per_item):
+                    date = self.random_date(3 * 365)
+                    due_date = date + datetime.timedelta(days=self.random.choice([14, 30, 60]))
+                    is_paid = due_date < self.today and self.random.random() > 0.15
+                    yield SalesInvoice(
+                        contract_item=item, number=f'FV/{date.year}/{item.pk}/{number + 1}', date=date,
+                        due_date=due_date, is_paid=is_paid,
+                        paid_date=due_date - datetime.timedelta(days=self.random.randint(0, 10)) if is_paid else None,
+                        value=value, currency_id=item.currency_id, file='SalesInvoice/demo.pdf',
+                    )
+        self.bulk_create(SalesInvoice, invoices(), keep=False)
+
+    def create_budgets(self, currencies, count):
+        return self.bulk_create(Budget, (
+            Budget(name=f'Budget {self.tag} {number}', value=Decimal(self.random.randrange(10000, 1000000)),
+                   currency=self.random.choice(currencies), is_active=self.random.random() > 0.2)
+            for number in range(count)
+        ))
+
+    def create_projects(self, clients, employees, budgets, count):
+        def projects():
+            for number in range(count):
+                name = f'{self.company_name()} {self.tag} {number}'
+                yield Project(name=name, slug=slugify(name), owner=self.random.choice(employees),
+                              client=self.random.choice(clients) if self.random.random() > 0.3 else None,
+                              is_active=self.random.random() > 0.2, is_chargeable=self.random.random() > 0.5)
+        projects = self.bulk_create(Project, projects())
+
+        managers, team_members, assignments = Project.managers.through, Project.team_members.through, []
+        self.bulk_create(managers, (
+            managers(project_id=project.pk, employee_id=employee.pk)
+            for project in projects
+            for employee in self.random.sample(employees, min(2, len(employees)))
+        ), keep=False)
+        self.bulk_create(team_members, (
+            team_members(project_id=project.pk, employee_id=employee.pk)
+            for project in projects
+            for employee in self.random.sample(employees, min(8, len(employees)))
+        ), keep=False)
+        if budgets:
+            for project in projects:
+                start_date = self.random_date(2 * 365)
+                end_date = start_date + datetime.timedelta(days=365) if self.random.random() > 0.5 else None
+                assignments.append(ProjectBudgetAssignment(project=project, budget=self.random.choice(budgets),
+                                                           start_date=start_date, end_date=end_date))
+        self.bulk_create(ProjectBudgetAssignment, assignments, keep=False)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the global search index from every searchable model."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} documents indexed."))
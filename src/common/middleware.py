@@ -0,0 +1,166 @@
+import logging
+import re
+import time
+import warnings
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse
+
+logger = logging.getLogger('workify.queries')
+
+ACTIONS = ('log', 'warn', 'raise')
+
+_whitespace = re.compile(r'\s+')
+_placeholder_list = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_number = re.compile(r'\b\d+\b')
+_string = re.compile(r"'(?:[^']|'')*'")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetWarning(UserWarning):
+    pass
+
+
+def fingerprint(sql):
+    """
+    Reduce a SQL statement to its shape, so the same query issued for different rows is counted together.
+    """
+    sql = _string.sub('?', sql)
+    sql = _number.sub('?', sql)
+    sql = _placeholder_list.sub('(...)', sql)
+    return _whitespace.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper collecting the number, duration and fingerprints of executed queries.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def get_duplicates(self, threshold=1):
+        return {sql: count for sql, count in self.fingerprints.most_common() if count > threshold}
+
+
+class QueryBudgetMiddleware:
+    """
+    Record SQL queries issued while handling a request and report them in the Server-Timing header
+    and on the 'workify.queries' logger.
+
+    Enabled with the QUERY_BUDGET_ACTION setting:
+        'log'   - only report,
+        'warn'  - additionally issue a QueryBudgetWarning when a budget is exceeded,
+        'raise' - raise QueryBudgetExceeded instead (meant for tests).
+    QUERY_BUDGETS maps URL names ('namespace:name') to the maximum number of queries, with
+    the 'default' key used for views not listed. QUERY_BUDGET_DUPLICATES is the number of times
+    one query fingerprint may repeat before the request is reported as an N+1.
+
+    Queries of streaming responses (exports) are recorded while the content is consumed and
+    reported at its end; file downloads are passed through untouched.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.action = getattr(settings, 'QUERY_BUDGET_ACTION', None)
+        if not self.action:
+            raise MiddlewareNotUsed
+        if self.action not in ACTIONS:
+            raise ValueError(f"QUERY_BUDGET_ACTION must be one of {', '.join(ACTIONS)}")
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.duplicates_threshold = getattr(settings, 'QUERY_BUDGET_DUPLICATES', None)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with self.recording(recorder):
+            response = self.get_response(request)
+
+        if response.streaming and not isinstance(response, FileResponse) and not getattr(response, 'is_async', False):
+            # The content is generated after the view returned, and its queries with it: the headers
+            # report the queries made so far, the log and the budget the total once it is consumed
+            self.add_server_timing(response, recorder, recorder.get_duplicates(self.duplicates_threshold or 1))
+            response.streaming_content = self.record_streaming(request, response, response.streaming_content, recorder)
+            return response
+
+        duplicates = recorder.get_duplicates(self.duplicates_threshold or 1)
+        self.add_server_timing(response, recorder, duplicates)
+        self.finish(request, response, recorder, duplicates)
+        return response
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record_streaming(self, request, response, content, recorder):
+        with self.recording(recorder):
+            yield from content
+        self.finish(request, response, recorder, recorder.get_duplicates(self.duplicates_threshold or 1))
+
+    def finish(self, request, response, recorder, duplicates):
+        url_name = self.get_url_name(request)
+        logger.info(
+            'url_name=%s path=%s status=%s queries=%d sql_ms=%.1f duplicates=%d',
+            url_name, request.path, response.status_code, recorder.count, recorder.duration * 1000, len(duplicates),
+            extra={
+                'url_name': url_name,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'sql_ms': round(recorder.duration * 1000, 1),
+                'duplicates': duplicates,
+            },
+        )
+
+        problems = self.check_budget(url_name, recorder, duplicates)
+        if problems:
+            self.report(f"{url_name or request.path}: {'; '.join(problems)}")
+
+    def get_url_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else None
+
+    def get_budget(self, url_name):
+        return self.budgets.get(url_name, self.budgets.get('default'))
+
+    def check_budget(self, url_name, recorder, duplicates):
+        problems = []
+        budget = self.get_budget(url_name)
+        if budget is not None and recorder.count > budget:
+            problems.append(f'{recorder.count} queries exceed the budget of {budget}')
+        if self.duplicates_threshold is not None:
+            for sql, count in duplicates.items():
+                problems.append(f'query repeated {count} times: {sql}')
+        return problems
+
+    def add_server_timing(self, response, recorder, duplicates):
+        metrics = [f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"']
+        if duplicates:
+            metrics.append(f'db-duplicates;desc="{sum(duplicates.values())} duplicated queries"')
+        if response.has_header('Server-Timing'):
+            metrics.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(metrics)
+
+    def report(self, message):
+        logger.warning(message)
+        if self.action == 'warn':
+            warnings.warn(message, QueryBudgetWarning)
+        elif self.action == 'raise':
+            raise QueryBudgetExceeded(message)
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE common_searchdocument_fts USING fts5(title, body, content='common_searchdocument', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER common_searchdocument_ai AFTER INSERT ON common_searchdocument BEGIN "
+    "INSERT INTO common_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER common_searchdocument_ad AFTER DELETE ON common_searchdocument BEGIN "
+    "INSERT INTO common_searchdocument_fts(common_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER common_searchdocument_au AFTER UPDATE ON common_searchdocument BEGIN "
+    "INSERT INTO common_searchdocument_fts(common_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO common_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS common_searchdocument_au",
+    "DROP TRIGGER IF EXISTS common_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS common_searchdocument_ai",
+    "DROP TABLE IF EXISTS common_searchdocument_fts",
+]
+POSTGRESQL_CREATE = [
+    "CREATE INDEX common_searchdocument_fts ON common_searchdocument "
+    "USING GIN (to_tsvector('simple', title || ' ' || body))",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS common_searchdocument_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('url', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='searchdocument_object_unique'),
+        ),
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+SEARCH_KEY_MODELS = ['budgets.Budget', 'clients.Client', 'employees.Employee', 'projects.Project']
+
+
+def fill_words(apps, schema_editor):
+    SearchKeyWord = apps.get_model('common', 'SearchKeyWord')
+    for label in SEARCH_KEY_MODELS:
+        model = apps.get_model(label)
+        words = []
+        for pk, search_key in model.objects.values_list('pk', 'search_key').iterator():
+            words += [SearchKeyWord(model=label.lower(), object_id=pk, word=word)
+                      for word in dict.fromkeys(search_key.split()[1:])]
+            if len(words) >= 500:
+                SearchKeyWord.objects.bulk_create(words)
+                words = []
+        SearchKeyWord.objects.bulk_create(words)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_searchdocument'),
+        ('budgets', '0003_budget_search_key'),
+        ('clients', '0016_client_search_key'),
+        ('employees', '0017_employee_search_key'),
+        ('projects', '0003_project_search_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchKeyWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('word', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'word'], name='searchkeyword_word_idx'),
+                            models.Index(fields=['model', 'object_id'], name='searchkeyword_object_idx')],
+            },
+        ),
+        migrations.RunPython(fill_words, migrations.RunPython.noop),
+    ]
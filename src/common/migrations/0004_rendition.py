@@ -0,0 +1,36 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+RENDITIONS_MODELS = ['clients.Client', 'employees.Employee']
+
+
+def count_references(apps, schema_editor):
+    Rendition = apps.get_model('common', 'Rendition')
+    counts = {}
+    for label in RENDITIONS_MODELS:
+        for renditions in apps.get_model(label).objects.values_list('renditions', flat=True).iterator():
+            names = {name for formats in (renditions or {}).get('sizes', {}).values() for name in formats.values()}
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+    Rendition.objects.bulk_create([Rendition(name=name, ref_count=count) for name, count in counts.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_searchkeyword'),
+        ('clients', '0014_client_renditions'),
+        ('employees', '0015_employee_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('ref_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
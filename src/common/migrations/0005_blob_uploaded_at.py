@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_rendition'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blob',
+            name='ref_count',
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='uploaded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
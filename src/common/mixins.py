@@ -1,13 +1,23 @@
 from typing import Any
+import datetime
+import json
 import urllib.parse
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
 from django.views.generic import DetailView
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib import messages
+from django.utils import timezone
 from django.utils.html import format_html
-from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.text import slugify
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 
 from crispy_forms.helper import FormHelper
+from . import files
+from .exports import stream_csv, stream_xlsx
 from .helpers import  Breadcrumbs, Buttons as Btn
 
 class BreadcrumbsAndButtonsMixin:
@@ -94,18 +104,259 @@ class AuditMixin:
         return context
     
 class FileViewMixin(DetailView):
+    """
+    Download of the object's `file` with its MIME type, a strong ETag and Last-Modified for
+    conditional requests (304), and single byte ranges (206, honouring If-Range) so interrupted
+    downloads resume. With FILE_OFFLOAD set, the front-end server sends the bytes (see common.files).
+    """
+    as_attachment = True
+
+    def get_file(self):
+        return self.object.file
+
+    def get_etag(self, file):
+        """
+        Strong validator of the file content: the SHA-256 of content-addressed files, otherwise
+        derived from the storage name, size and modification time.
+        """
+        digest = getattr(file.storage, 'digest', None)
+        if digest and digest(file.name):
+            return f'"{digest(file.name)}"'
+        return files.make_etag(file.name, file.size, files.get_modified_time(file) or self.object.updated_at)
+
+    def get_last_modified(self, file):
+        return files.get_modified_time(file) or getattr(self.object, 'updated_at', None)
+
+    def get_content_disposition(self, file):
+        filename = file.name.split("/")[-1]
+        ascii_filename = filename.encode('ascii', 'ignore').decode()
+        encoded_filename = urllib.parse.quote(filename)
+        disposition = 'attachment' if self.as_attachment else 'inline'
+        return f'{disposition}; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
+
     def get(self, request, *args, **kwargs):
         try:
             if not hasattr(self, 'object') or self.object is None:
                 self.object = self.get_object()
-            if not self.object.file:
+            file = self.get_file()
+            if not file:
                 raise Http404("File not found")
-            response = FileResponse(self.object.file.open('rb'), content_type='application/octet-stream')
-            filename = self.object.file.name.split("/")[-1]
-            ascii_filename = filename.encode('ascii', 'ignore').decode()
-            encoded_filename = urllib.parse.quote(filename)
-        
-            response['Content-Disposition'] = f'attachment; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
-            return response
+            size = file.size
+            etag = self.get_etag(file)
+            last_modified = self.get_last_modified(file)
+            last_modified_timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified_timestamp)
+            if response is None:
+                response = self.get_file_response(file, size, etag, last_modified)
         except FileNotFoundError:
-            raise Http404("File not found")
\ No newline at end of file
+            raise Http404("File not found")
+
+        if etag:
+            response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = files.format_last_modified(last_modified)
+        # Documents are private; browsers keep them but must revalidate, which is a cheap 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def get_file_response(self, file, size, etag, last_modified):
+        content_type = files.guess_content_type(file.name)
+        response = files.offload_response(file, content_type)
+        if response is None:
+            response = self.get_streaming_response(file, size, content_type, etag, last_modified)
+        response['Content-Disposition'] = self.get_content_disposition(file)
+        return response
+
+    def get_streaming_response(self, file, size, content_type, etag, last_modified):
+        byte_range = None
+        range_header = self.request.headers.get('Range')
+        if_range = self.request.headers.get('If-Range')
+        if range_header and (not if_range or files.if_range_matches(if_range, etag, last_modified)):
+            try:
+                byte_range = files.parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(file.open('rb'), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(files.read_range(file.open('rb'), start, end),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder keeping the microseconds of times, which it cuts to milliseconds: a cursor
+    must repeat the sort key of the last row exactly.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPaginationMixin:
+    """
+    Seek (keyset) pagination and whitelisted server-side sorting for ListViews.
+
+    Rows are ordered by one of `sort_fields` plus the primary key and every page continues after the
+    last row of the previous one, so page latency does not grow with the table. Sort fields must be
+    non-nullable and should be indexed. HTMX "load more" requests render `rows_template_name` only.
+    """
+    page_size = 50
+    sort_fields = {}
+    default_sort = None
+    rows_template_name = None
+    htmx_target = None
+    cursor_salt = 'common.keyset-pagination'
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort') or self.default_sort
+        if sort.lstrip('-') not in self.sort_fields:
+            return self.default_sort
+        return sort
+
+    def get_cursor(self, sort):
+        cursor = self.request.GET.get('after')
+        if not cursor:
+            return None
+        try:
+            cursor = signing.loads(cursor, salt=self.cursor_salt)
+        except signing.BadSignature:
+            return None
+        # A cursor only continues the order it was made for
+        return cursor if cursor.get('s') == sort else None
+
+    def make_cursor(self, row, row_offset, sort):
+        value = json.loads(json.dumps(row.keyset_value, cls=CursorEncoder))
+        return signing.dumps({'s': sort, 'v': value, 'pk': row.pk, 'n': row_offset}, salt=self.cursor_salt)
+
+    def get_page_url(self, **params):
+        query = self.request.GET.copy()
+        for key, value in params.items():
+            query.pop(key, None)
+            if value is not None:
+                query[key] = value
+        return f"{self.request.path}?{query.urlencode()}" if query else self.request.path
+
+    def paginate_keyset(self, queryset):
+        sort = self.get_sort()
+        descending = sort.startswith('-')
+        prefix = '-' if descending else ''
+        queryset = queryset.annotate(keyset_value=F(self.sort_fields[sort.lstrip('-')]))
+        queryset = queryset.order_by(f"{prefix}keyset_value", f"{prefix}pk")
+
+        row_offset = 0
+        cursor = self.get_cursor(sort)
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f"keyset_value__{lookup}": cursor['v']}) |
+                Q(keyset_value=cursor['v'], **{f"pk__{lookup}": cursor['pk']})
+            )
+            row_offset = cursor['n']
+
+        rows = list(queryset[:self.page_size + 1])
+        next_page_url = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            next_page_url = self.get_page_url(after=self.make_cursor(rows[-1], row_offset + len(rows), sort))
+        return rows, row_offset, next_page_url
+
+    def get_sorting(self):
+        sort = self.get_sort()
+        urls = {}
+        for key in self.sort_fields:
+            direction = '-' if sort == key else ''
+            urls[key] = self.get_page_url(sort=f"{direction}{key}", after=None)
+        return {'current': sort, 'urls': urls, 'htmx_target': self.htmx_target}
+
+    def get_context_data(self, **kwargs):
+        rows, row_offset, next_page_url = self.paginate_keyset(self.object_list)
+        context = super().get_context_data(object_list=rows, **kwargs)
+        context['row_offset'] = row_offset
+        context['next_page_url'] = next_page_url
+        context['sorting'] = self.get_sorting()
+        return context
+
+    def is_load_more_request(self):
+        return self.request.headers.get('HX-Request') == 'true' and 'after' in self.request.GET
+
+    def get_template_names(self):
+        if self.rows_template_name and self.is_load_more_request():
+            return [self.rows_template_name]
+        return super().get_template_names()
+
+
+class ExportMixin:
+    """
+    CSV/XLSX export of a ListView, requested with "?export=csv" or "?export=xlsx".
+
+    The export uses get_queryset(), so it honours the same filters as the HTML page, and the
+    current sort order. Rows are read with values_list().iterator() and streamed to the client,
+    so memory use does not depend on the number of rows. `export_fields` is a list of
+    (header, field lookup or expression) pairs.
+    """
+    export_fields = []
+    export_filename = None
+    export_chunk_size = 2000
+    export_formats = {
+        'csv': ('text/csv; charset=utf-8', stream_csv),
+        'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+    }
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('export')
+        if export_format in self.export_formats:
+            return self.export(export_format)
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        queryset = self.get_queryset()
+        names = []
+        expressions = {}
+        for index, (header, field) in enumerate(self.export_fields):
+            if isinstance(field, str):
+                names.append(field)
+            else:
+                names.append(f'export_{index}')
+                expressions[f'export_{index}'] = field
+        if expressions:
+            queryset = queryset.annotate(**expressions)
+
+        if hasattr(self, 'get_sort'):
+            sort = self.get_sort()
+            prefix = '-' if sort.startswith('-') else ''
+            queryset = queryset.order_by(f"{prefix}{self.sort_fields[sort.lstrip('-')]}", f"{prefix}pk")
+        # Joins needed by the HTML rows are useless here, values_list() adds its own
+        return queryset.select_related(None).prefetch_related(None).values_list(*names)
+
+    def get_export_filename(self, export_format):
+        name = self.export_filename or self.model._meta.verbose_name_plural
+        return f"{slugify(name)}-{timezone.localdate():%Y-%m-%d}.{export_format}"
+
+    def export(self, export_format):
+        content_type, writer = self.export_formats[export_format]
+        header = [str(header) for header, field in self.export_fields]
+        rows = self.get_export_queryset().iterator(chunk_size=self.export_chunk_size)
+        response = StreamingHttpResponse(writer(header, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.get_export_filename(export_format)}"'
+        return response
+
+    def get_export_buttons(self):
+        url = self.get_page_url if hasattr(self, 'get_page_url') else None
+        return [
+            Btn.Link(export_format.upper(),
+                     url(export=export_format, after=None) if url else f"?export={export_format}",
+                     'outline-secondary', icon='download')
+            for export_format in self.export_formats
+        ]
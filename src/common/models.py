@@ -1,7 +1,11 @@
 import datetime
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
 # from dicts.models import Currency
 from dicts import models as dicts
+from utils.normalize import make_search_key
+from . import cache, images, search
 # from employees.models import Employee
 
 # Create your models here.
@@ -10,6 +14,11 @@ class Currencies(models.TextChoices):
     EUR = 'EUR', 'Euro'
     PLN = 'PLN', 'Polish Zloty'
 
+class InvoiceStatuses(models.TextChoices):
+    PAID = 'Paid', 'Paid'
+    UNPAID = 'Unpaid', 'Unpaid'
+    OVERDUE = 'Overdue', 'Overdue'
+
 class TrackableModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -20,12 +29,39 @@ class TrackableModel(models.Model):
 
     def save(self, *args, **kwargs):
         current_user = kwargs.pop('current_user', None)
-        if not current_user:
-            return super().save(*args, **kwargs)
-        if not self.pk:
-            self.created_by = current_user
-        self.updated_by = current_user
-        return super().save(*args, **kwargs)
+        if current_user:
+            if not self.pk:
+                self.created_by = current_user
+            self.updated_by = current_user
+        result = super().save(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+        if search.is_searchable(type(self)):
+            search.index_instance(self)
+        search.schedule_dependents(self, using=kwargs.get('using'))
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        search.remember_dependent_values(instance)
+        return instance
+
+    def delete(self, using=None, keep_parents=False):
+        # Model.delete, with the search documents of the collected rows removed in the same transaction
+        if self.pk is None:
+            raise ValueError(f"{self._meta.object_name} object can't be deleted because its {self._meta.pk.attname} attribute is set to None.")
+        using = using or router.db_for_write(type(self), instance=self)
+        collector = Collector(using=using, origin=self)
+        collector.collect([self], keep_parents=keep_parents)
+        with transaction.atomic(using=using):
+            search.remove_collected(collector)
+            remove_collected_search_key_words(collector)
+            renditions = images.get_collected_renditions(collector)
+            result = collector.delete()
+            images.release_renditions(renditions)
+        for model in {*collector.data, *(queryset.model for queryset in collector.fast_deletes)}:
+            cache.bump_model_generation(model)
+        return result
 
     def get_audit_trail(self):
         return {
@@ -38,6 +74,89 @@ class TrackableModel(models.Model):
     def get_mini_audit(self):
         return f'Created {self.created_at.strftime("%d-%m-%Y %H:%M")} by {self.created_by} | Updated {self.updated_at.strftime("%d-%m-%Y %H:%M")} by {self.updated_by}'
     
+class TrackableQuerySet(models.QuerySet):
+    """
+    Set-based writes for TrackableModel rows. They run as one UPDATE/DELETE per chunk of ids instead
+    of a save() per row, so they fill the audit fields and invalidate the model cache themselves.
+    """
+    chunk_size = 500
+
+    def _chunks(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    def update_tracked(self, ids, current_user=None, **values):
+        """
+        Update the rows of this queryset whose pk is in ids, returns the number of updated rows.
+        """
+        values['updated_at'] = timezone.now()
+        if current_user is not None:
+            values['updated_by'] = current_user
+        updated = 0
+        with transaction.atomic(using=self.db):
+            for chunk in self._chunks(ids):
+                updated += self.filter(pk__in=chunk).update(**values)
+                if search.is_searchable(self.model):
+                    search.index_queryset(self.model._default_manager.filter(pk__in=chunk))
+        cache.bump_model_generation(self.model)
+        return updated
+
+    def delete_tracked(self, ids):
+        """
+        Delete the rows of this queryset whose pk is in ids, returns the number of deleted rows.
+        """
+        deleted = 0
+        with transaction.atomic(using=self.db):
+            for chunk in self._chunks(ids):
+                deleted += self.filter(pk__in=chunk).delete()[1].get(self.model._meta.label, 0)
+                if search.is_searchable(self.model):
+                    search.remove_ids(self.model, chunk)
+        cache.bump_model_generation(self.model)
+        return deleted
+
+class InvoiceQuerySet(models.QuerySet):
+    """
+    Status filters evaluated in SQL, backed by the (is_paid, due_date) index of concrete invoice models.
+    An invoice is overdue when it is not paid and its due date is today or earlier.
+    """
+    def with_status(self, as_of=None):
+        as_of = as_of or datetime.date.today()
+        return self.annotate(annotated_status=models.Case(
+            models.When(is_paid=True, then=models.Value(InvoiceStatuses.PAID)),
+            models.When(due_date__gt=as_of, then=models.Value(InvoiceStatuses.UNPAID)),
+            default=models.Value(InvoiceStatuses.OVERDUE),
+            output_field=models.CharField(),
+        ))
+
+    def paid(self):
+        return self.filter(is_paid=True)
+
+    def unpaid(self):
+        """
+        All invoices that are not settled yet, overdue ones included; the UNPAID status is not_due().
+        """
+        return self.filter(is_paid=False)
+
+    unsettled = unpaid
+
+    def overdue(self, as_of=None):
+        return self.filter(is_paid=False, due_date__lte=as_of or datetime.date.today())
+
+    def not_due(self, as_of=None):
+        return self.filter(is_paid=False, due_date__gt=as_of or datetime.date.today())
+
+    def due_between(self, start, end):
+        return self.filter(due_date__gte=start, due_date__lte=end)
+
+    def with_status_value(self, status, as_of=None):
+        filters = {
+            InvoiceStatuses.PAID: self.paid,
+            InvoiceStatuses.UNPAID: lambda: self.not_due(as_of),
+            InvoiceStatuses.OVERDUE: lambda: self.overdue(as_of),
+        }
+        return filters[status]()
+
 class InvoiceModel(models.Model):
     number = models.CharField(max_length=100)
     date = models.DateField()
@@ -46,19 +165,175 @@ class InvoiceModel(models.Model):
     paid_date = models.DateField(null=True, blank=True)
     value = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.ForeignKey(dicts.Currency, on_delete=models.PROTECT)
+
+    objects = InvoiceQuerySet.as_manager()
     
     class Meta:
         abstract = True
 
     @property
     def status(self):
+        # Prefer the status computed by InvoiceQuerySet.with_status() when the row was loaded with it
+        if hasattr(self, 'annotated_status'):
+            return self.annotated_status
         if self.is_paid:
-            return 'Paid'
+            return InvoiceStatuses.PAID
         if self.due_date > datetime.date.today():
-            return 'Unpaid'
-        return 'Overdue'
+            return InvoiceStatuses.UNPAID
+        return InvoiceStatuses.OVERDUE
     
     def settle(self):
         self.is_paid = True
         self.paid_date = datetime.date.today()
-        self.save()
\ No newline at end of file
+        self.annotated_status = InvoiceStatuses.PAID
+        self.save()
+
+
+class SearchKeyModel(models.Model):
+    """
+    Keeps search_key, the normalized and accent-folded text returned by get_search_key_parts(), for
+    indexed prefix matching in autocomplete views (see common.autocomplete).
+    """
+    search_key = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def get_search_key_parts(self):
+        raise NotImplementedError
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._indexed_search_key = instance.__dict__.get('search_key')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.search_key = make_search_key(*self.get_search_key_parts())
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        result = super().save(*args, **kwargs)
+        if update_fields is not None and 'search_key' not in update_fields:
+            return result
+        if adding or self.search_key != getattr(self, '_indexed_search_key', None):
+            if not adding:
+                SearchKeyWord.objects.filter(model=self._meta.label_lower, object_id=self.pk).delete()
+            SearchKeyWord.objects.bulk_create(get_search_key_words(self))
+            self._indexed_search_key = self.search_key
+        return result
+
+
+def get_search_key_words(instance):
+    """
+    SearchKeyWord rows of the words of instance.search_key after the first, which the index on
+    search_key itself covers.
+    """
+    words = dict.fromkeys(instance.search_key.split()[1:])
+    return [SearchKeyWord(model=instance._meta.label_lower, object_id=instance.pk, word=word) for word in words]
+
+
+def remove_collected_search_key_words(collector):
+    """
+    Remove the SearchKeyWord rows of every SearchKeyModel row a deletion Collector is about to delete.
+    """
+    for model, instances in collector.data.items():
+        if issubclass(model, SearchKeyModel):
+            ids = [instance.pk for instance in instances]
+            for start in range(0, len(ids), TrackableQuerySet.chunk_size):
+                SearchKeyWord.objects.filter(model=model._meta.label_lower,
+                                             object_id__in=ids[start:start + TrackableQuerySet.chunk_size]).delete()
+    for queryset in collector.fast_deletes:
+        if issubclass(queryset.model, SearchKeyModel):
+            SearchKeyWord.objects.filter(model=queryset.model._meta.label_lower,
+                                         object_id__in=queryset.values('pk')).delete()
+
+
+class ImageRenditionsModel(models.Model):
+    """
+    Keeps resized WebP and PNG renditions of the image in rendition_source_field up to date, see common.images.
+    """
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    rendition_source_field = None
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        if self.renditions.get('source', '') != (getattr(self, self.rendition_source_field).name or ''):
+            # After the commit, so the image is in the storage and the worker reads the saved row
+            images.schedule_renditions(self)
+        return result
+
+    def sync_renditions(self):
+        image = getattr(self, self.rendition_source_field)
+        if self.renditions.get('source', '') == (image.name or ''):
+            return False
+        self.renditions = images.build_renditions(image) if image else {}
+        return True
+
+    def get_srcset(self, size=32):
+        return images.get_srcset(self.renditions, size)
+
+
+class Rendition(models.Model):
+    """
+    Rendition file of common.images with the number of rows whose renditions refer to it.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    ref_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class Blob(models.Model):
+    """
+    File stored once by common.storage.ContentAddressedStorage, with the time it was last uploaded.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    uploaded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.digest
+
+
+class SearchKeyWord(models.Model):
+    """
+    A word of the search_key of a SearchKeyModel row after the first one, so autocomplete views
+    match later words with an index range scan too, see common.autocomplete.
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    word = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'word'], name='searchkeyword_word_idx'),
+            models.Index(fields=['model', 'object_id'], name='searchkeyword_object_idx'),
+        ]
+
+    def __str__(self):
+        return self.word
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of one object, see common.search. Indexed by the database (FTS5 or tsvector).
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    url = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'], name='searchdocument_object_unique'),
+        ]
+
+    def __str__(self):
+        return self.title
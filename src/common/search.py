@@ -0,0 +1,241 @@
+"""
+Global search over an inverted index.
+
+Every TrackableModel that defines get_search_document() keeps one SearchDocument row (title, body,
+url) up to date when it is saved or deleted. The rows are indexed by the database itself:
+an FTS5 table kept in sync by triggers on SQLite, a GIN tsvector index on PostgreSQL (both created
+by migration common 0002). Other databases fall back to a plain LIKE scan.
+
+Hits are limited to the models the user may view, see `search_permission` on the indexed models.
+Documents that copy text of related rows are refreshed when those change, see `search_dependents`,
+and dropped with the rows a delete cascades to, see `remove_collected`.
+"""
+import re
+
+from django.apps import apps
+from django.db import connection, models, transaction
+
+FTS_TABLE = 'common_searchdocument_fts'
+TSVECTOR = "to_tsvector('simple', title || ' ' || body)"
+DEFAULT_LIMIT = 20
+
+_token = re.compile(r'\w+', re.UNICODE)
+
+
+def get_document_model():
+    return apps.get_model('common', 'SearchDocument')
+
+
+def get_model_label(model):
+    return model._meta.label_lower
+
+
+def is_searchable(model):
+    return hasattr(model, 'get_search_document')
+
+
+def get_searchable_models():
+    return [model for model in apps.get_models() if is_searchable(model)]
+
+
+def index_instance(instance):
+    """
+    Create, update or remove the document of one instance.
+    """
+    SearchDocument = get_document_model()
+    document = instance.get_search_document()
+    label = get_model_label(type(instance))
+    if document is None:
+        SearchDocument.objects.filter(model=label, object_id=instance.pk).delete()
+        return
+    SearchDocument.objects.update_or_create(model=label, object_id=instance.pk, defaults={
+        'title': document['title'][:255],
+        'body': document.get('body', ''),
+        'url': instance.get_absolute_url(),
+    })
+
+
+def index_queryset(queryset, batch_size=500):
+    """
+    Replace the documents of every row of queryset, for writes that bypassed save().
+    """
+    SearchDocument = get_document_model()
+    label = get_model_label(queryset.model)
+    queryset = queryset.select_related(*getattr(queryset.model, 'search_select_related', ()))
+    batch = []
+    ids = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        ids.append(instance.pk)
+        document = instance.get_search_document()
+        if document is not None:
+            batch.append(SearchDocument(model=label, object_id=instance.pk, title=document['title'][:255],
+                                        body=document.get('body', ''), url=instance.get_absolute_url()))
+        if len(ids) >= batch_size:
+            _replace(label, ids, batch)
+            ids, batch = [], []
+    if ids:
+        _replace(label, ids, batch)
+
+
+def index_ids(model, ids, batch_size=500):
+    for start in range(0, len(ids), batch_size):
+        index_queryset(model._default_manager.filter(pk__in=ids[start:start + batch_size]), batch_size)
+
+
+def _replace(label, ids, documents):
+    SearchDocument = get_document_model()
+    SearchDocument.objects.filter(model=label, object_id__in=ids).delete()
+    SearchDocument.objects.bulk_create(documents)
+
+
+def index_dependents(instance):
+    """
+    Re-index the documents that include text of instance. `search_dependents` of its model lists
+    (model label, lookup to the instance) pairs, e.g. ('clients.Contract', 'client').
+    """
+    for label, lookup in getattr(type(instance), 'search_dependents', ()):
+        model = apps.get_model(label)
+        index_queryset(model._default_manager.filter(**{lookup: instance.pk}))
+
+
+def get_dependent_values(instance):
+    """
+    Loaded values of the fields listed in `search_dependent_fields`, the ones the documents of
+    `search_dependents` copy. Deferred fields that were never loaded are left out.
+    """
+    fields = getattr(type(instance), 'search_dependent_fields', ())
+    attnames = [instance._meta.get_field(name).attname for name in fields]
+    return {attname: instance.__dict__[attname] for attname in attnames if attname in instance.__dict__}
+
+
+def remember_dependent_values(instance):
+    if getattr(type(instance), 'search_dependents', None):
+        instance._search_dependent_values = get_dependent_values(instance)
+
+
+def schedule_dependents(instance, using=None):
+    """
+    Re-index the dependents of a saved instance after commit, if it changed a field they copy.
+    """
+    if not getattr(type(instance), 'search_dependents', None):
+        return
+    previous = getattr(instance, '_search_dependent_values', None)
+    current = get_dependent_values(instance)
+    instance._search_dependent_values = current
+    if previous is None or previous == current:
+        # A new row has no dependents yet
+        return
+    transaction.on_commit(lambda: index_dependents(instance), using=using)
+
+
+def remove_instance(instance):
+    remove_ids(type(instance), [instance.pk])
+
+
+def remove_ids(model, ids):
+    get_document_model().objects.filter(model=get_model_label(model), object_id__in=list(ids)).delete()
+
+
+def remove_collected(collector, batch_size=500):
+    """
+    Remove the documents of every row a deletion Collector is about to delete, cascades included, and
+    re-index after commit the rows it sets to NULL, whose documents may copy text of the deleted ones.
+    """
+    SearchDocument = get_document_model()
+    for model, instances in collector.data.items():
+        if is_searchable(model):
+            ids = [instance.pk for instance in instances]
+            for start in range(0, len(ids), batch_size):
+                remove_ids(model, ids[start:start + batch_size])
+    for queryset in collector.fast_deletes:
+        if is_searchable(queryset.model):
+            SearchDocument.objects.filter(model=get_model_label(queryset.model),
+                                          object_id__in=queryset.values('pk')).delete()
+    updated = {}
+    for instances_list in collector.field_updates.values():
+        for instances in instances_list:
+            if isinstance(instances, models.QuerySet):
+                model, ids = instances.model, instances.values_list('pk', flat=True)
+            else:
+                instances = list(instances)
+                if not instances:
+                    continue
+                model, ids = type(instances[0]), [instance.pk for instance in instances]
+            if is_searchable(model):
+                updated.setdefault(model, set()).update(ids)
+    for model, ids in updated.items():
+        transaction.on_commit(lambda model=model, ids=sorted(ids): index_ids(model, ids, batch_size),
+                              using=collector.using)
+
+
+def get_allowed_labels(user):
+    return [get_model_label(model) for model in get_searchable_models()
+            if user.has_perm(model.search_permission)]
+
+
+def get_terms(query):
+    return _token.findall(query.lower())[:8]
+
+
+def search(query, user, limit=DEFAULT_LIMIT):
+    """
+    Best matching documents the user may see. Every word of query must match, the last one as a prefix
+    so results appear while typing.
+    """
+    terms = get_terms(query)
+    labels = get_allowed_labels(user)
+    if not terms or not labels:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_fts5(terms, labels, limit)
+    if connection.vendor == 'postgresql':
+        return _search_tsvector(terms, labels, limit)
+    return _search_like(terms, labels, limit)
+
+
+def _search_fts5(terms, labels, limit):
+    SearchDocument = get_document_model()
+    match = ' '.join(f'"{term}"*' for term in terms)
+    placeholders = ', '.join(['%s'] * len(labels))
+    # bm25() weighs title matches ten times higher than body matches; lower is better
+    return list(SearchDocument.objects.raw(
+        f"SELECT d.id, d.model, d.object_id, d.title, d.url "
+        f"FROM {FTS_TABLE} f JOIN common_searchdocument d ON d.id = f.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND d.model IN ({placeholders}) "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s",
+        [match, *labels, limit],
+    ))
+
+
+def _search_tsvector(terms, labels, limit):
+    SearchDocument = get_document_model()
+    query = ' & '.join(f'{term}:*' for term in terms)
+    placeholders = ', '.join(['%s'] * len(labels))
+    return list(SearchDocument.objects.raw(
+        f"SELECT id, model, object_id, title, url FROM common_searchdocument, to_tsquery('simple', %s) query "
+        f"WHERE {TSVECTOR} @@ query AND model IN ({placeholders}) "
+        f"ORDER BY ts_rank({TSVECTOR}, query) DESC LIMIT %s",
+        [query, *labels, limit],
+    ))
+
+
+def _search_like(terms, labels, limit):
+    SearchDocument = get_document_model()
+    queryset = SearchDocument.objects.filter(model__in=labels)
+    for term in terms:
+        queryset = queryset.filter(title__icontains=term) | queryset.filter(body__icontains=term)
+    return list(queryset.order_by('title')[:limit])
+
+
+def rebuild():
+    """
+    Index every searchable model from scratch, returns the number of documents.
+    """
+    SearchDocument = get_document_model()
+    SearchDocument.objects.all().delete()
+    for model in get_searchable_models():
+        index_queryset(model._default_manager.all())
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return SearchDocument.objects.count()
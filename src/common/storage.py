@@ -0,0 +1,134 @@
+"""
+Content-addressed storage for uploaded documents.
+
+Every file is stored once, as blobs/<ab>/<cd>/<sha256> under MEDIA_ROOT, however many times it is
+uploaded. The name kept in the model field is "<sha256>/<original file name>", so downloads keep
+their file name while identical uploads share one blob. Each upload records its time on the Blob
+row; the gc_blobs command finds the blobs no file field refers to any more and removes them.
+
+Names without a digest prefix, stored before the field used this storage, are served from their
+original location.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.text import get_valid_filename
+
+BLOB_DIR = 'blobs'
+DIGEST_NAME = re.compile(r'^([0-9a-f]{64})/[^/]+$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def digest(self, name):
+        """
+        SHA-256 of the content stored under name, or None for a name stored before content addressing.
+        """
+        match = DIGEST_NAME.match(name or '')
+        return match.group(1) if match else None
+
+    def blob_name(self, digest):
+        return '/'.join([BLOB_DIR, digest[:2], digest[2:4], digest])
+
+    def location_name(self, name):
+        """
+        Name of the file under the storage location: the blob of a digest name, other names as they are.
+        """
+        digest = self.digest(name)
+        return self.blob_name(digest) if digest else name
+
+    def path(self, name):
+        return super().path(self.location_name(name))
+
+    def url(self, name):
+        return super().url(self.location_name(name))
+
+    def get_stored_name(self, digest, name, max_length=None):
+        file_name = get_valid_filename(os.path.basename(name)) or 'file'
+        if max_length is not None:
+            available = max_length - len(digest) - 1
+            if available <= 0:
+                raise SuspiciousFileOperation(f'Storage can not store "{name}" in {max_length} characters.')
+            root, extension = os.path.splitext(file_name)
+            if len(file_name) > available:
+                file_name = root[:max(available - len(extension), 1)] + extension
+                file_name = file_name[:available]
+        return f'{digest}/{file_name}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        blob_dir = os.path.join(self.location, BLOB_DIR)
+        os.makedirs(blob_dir, exist_ok=True)
+        # Hash while copying to a temporary file next to the blobs, then move it in place,
+        # so the upload is read once and never held in memory
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=blob_dir, prefix='.upload-', delete=False) as temporary:
+            try:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                temporary.close()
+                os.remove(temporary.name)
+                raise
+        digest = digest.hexdigest()
+
+        blob_path = super().path(self.blob_name(digest))
+        with transaction.atomic():
+            # Row first: gc_blobs deletes a blob only in the transaction removing its row unchanged since
+            # the last upload, so once the upload is recorded the file either exists and stays, or is gone already
+            record_upload(digest, size)
+            if os.path.exists(blob_path):
+                os.remove(temporary.name)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary.name, self.file_permissions_mode)
+                os.replace(temporary.name, blob_path)
+        return self.get_stored_name(digest, name, max_length)
+
+    def delete(self, name):
+        """
+        Blobs may be shared, the gc_blobs command removes them once no file field refers to them.
+        """
+        if self.digest(name) is None:
+            return super().delete(name)
+
+    def delete_blob(self, digest):
+        super().delete(self.blob_name(digest))
+
+
+def record_upload(digest, size):
+    from .models import Blob
+    # Waits for a gc_blobs transaction deleting the row, then finds nothing to update and creates it again
+    if not Blob.objects.filter(pk=digest).update(uploaded_at=timezone.now()):
+        Blob.objects.get_or_create(digest=digest, defaults={'size': size})
+
+
+_storage = None
+
+
+def get_blob_storage():
+    """
+    Storage of the document fields. A callable, so migrations do not depend on MEDIA_ROOT.
+    """
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
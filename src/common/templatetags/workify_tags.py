@@ -1,17 +1,33 @@
 from collections.abc import Iterable
 from django import template
 from django.urls import reverse_lazy
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
+from dicts.models import Currency, EmployeeDocumentTypes
+
 register = template.Library()
 
 @register.inclusion_tag('templatetags/render_avatar.html')
-def render_avatar(employee):
-    return({'employee': employee})
+def render_avatar(employee, size=32):
+    return({'employee': employee, 'size': size, 'srcset': employee.get_srcset(size) if employee else None})
 
 @register.inclusion_tag('templatetags/render_logo.html')
-def render_logo(client):
-    return({'client': client})
+def render_logo(client, size=32):
+    return({'client': client, 'size': size, 'srcset': client.get_srcset(size) if client else None})
+
+@register.filter
+def currency(currency_id):
+    return Currency.get_by_id().get(currency_id, '')
+
+@register.filter
+def currency_code(currency_id):
+    currency = Currency.get_by_id().get(currency_id)
+    return currency.code if currency else ''
+
+@register.filter
+def document_type(document_type_id):
+    return EmployeeDocumentTypes.get_by_id().get(document_type_id, '')
 
 @register.simple_tag
 def render_breadcrumbs(breadcrumbs):
@@ -36,4 +52,19 @@ def render_sidebar_link(context, title, permission, link, icon = 'arrow-right-ci
         return ""
     url = reverse_lazy(link)
     active = 'active' if request.resolver_match.app_name == link.split(":")[0] else ''
-    return mark_safe(f"<li class='nav-item'><a class='nav-link {active}' aria-current='page' href='{url}'><span data-feather='{icon}'></span>{title}</a></li>")
\ No newline at end of file
+    return mark_safe(f"<li class='nav-item'><a class='nav-link {active}' aria-current='page' href='{url}'><span data-feather='{icon}'></span>{title}</a></li>")
+
+@register.simple_tag(takes_context=True)
+def render_sort_header(context, text, key):
+    sorting = context.get('sorting')
+    if not sorting or key not in sorting['urls']:
+        return text
+    indicator = ''
+    if sorting['current'] == key:
+        indicator = ' ▲'
+    if sorting['current'] == f"-{key}":
+        indicator = ' ▼'
+    url = sorting['urls'][key]
+    if sorting['htmx_target']:
+        return format_html("<a href='#' hx-get='{}' hx-target='{}' hx-swap='innerHTML'>{}{}</a>", url, sorting['htmx_target'], text, indicator)
+    return format_html("<a href='{}'>{}{}</a>", url, text, indicator)
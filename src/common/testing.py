@@ -0,0 +1,66 @@
+import os
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from dicts.models import Currency
+from employees.models import Employee
+
+
+class ListQueryCountMixin:
+    """
+    TestCase mixin asserting that rendering a list view costs the same number of queries
+    no matter how many rows it shows.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password',
+                                                 first_name='Admin', last_name='User')
+        cls.employee = Employee.objects.create(user=cls.user, slug='admin')
+        cls.currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, add_rows, rows=3):
+        """
+        Render url, add more rows with add_rows(count) and render it again; both renders
+        must issue the same number of queries. A first, unmeasured render warms the process caches.
+        """
+        add_rows(rows)
+        self.count_queries(url)
+        before = self.count_queries(url)
+        add_rows(rows)
+        after = self.count_queries(url)
+        self.assertEqual(before, after, f'{url} issues {after - before} more queries after adding {rows} rows')
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the suite with query budgets enforced (unless DJANGO_QUERY_BUDGET_ACTION says otherwise)
+    and image renditions built right after the commit instead of on the thread pool.
+    """
+    def get_test_settings(self):
+        return {
+            'QUERY_BUDGET_ACTION': os.environ.get('DJANGO_QUERY_BUDGET_ACTION', 'raise'),
+            'IMAGE_RENDITION_WORKERS': 0,
+        }
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.settings_override = override_settings(**self.get_test_settings())
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,727 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time
+import urllib.parse
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.views.generic import ListView
+from PIL import Image
+from django.utils import timezone
+from django.utils.http import http_date
+
+from clients.models import Client, Contract, ContractItem, SalesInvoice
+from dicts.models import Currency, EmployeeDocumentTypes
+from employees.models import Employee, EmployeeDocument
+from projects.models import Project
+from . import cache, images, search
+from .exports import stream_csv, stream_xlsx
+from .files import if_range_matches, offload_response, parse_range
+from .mixins import KeysetPaginationMixin
+from .middleware import QueryBudgetExceeded, QueryBudgetMiddleware, QueryBudgetWarning, fingerprint
+from .models import Blob, Rendition, SearchDocument
+from .storage import get_blob_storage
+
+
+def read_csv(chunks):
+    return list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+
+
+class ExportWriterTests(TestCase):
+    def test_csv_starts_with_bom(self):
+        chunks = list(stream_csv(['Name'], [['Acme']]))
+        self.assertTrue(chunks[0].startswith('\ufeff'.encode()))
+        self.assertEqual(read_csv(chunks), [['Name'], ['Acme']])
+
+    def test_csv_quotes_formulas(self):
+        rows = [['=HYPERLINK("http://x")'], ['+1'], ['-1'], ['@SUM(A1)'], ['\tcmd'], ['\rcmd'], [Decimal('-5')], ['a=b']]
+        self.assertEqual([row[0] for row in read_csv(stream_csv(['Value'], rows))[1:]],
+                         ['\'=HYPERLINK("http://x")', "'+1", "'-1", "'@SUM(A1)", "'\tcmd", "'\rcmd", '-5', 'a=b'])
+
+    def test_csv_chunks(self):
+        chunks = list(stream_csv(['Number'], ([number] for number in range(10)), rows_per_chunk=3))
+        # Three full chunks of three rows and the remainder
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(read_csv(chunks)), 11)
+
+    def test_xlsx_cells(self):
+        rows = [['Acme & Co', 12, Decimal('1.50'), True, datetime.date(2024, 1, 1), None]]
+        content = b''.join(stream_xlsx(['Name', 'Count', 'Value', 'Active', 'Date', 'Empty'], rows, rows_per_chunk=1))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIn('xl/styles.xml', archive.namelist())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t xml:space="preserve">Acme &amp; Co</t>', sheet)
+        self.assertIn('<c r="B2"><v>12</v></c>', sheet)
+        self.assertIn('<c r="D2" t="b"><v>1</v></c>', sheet)
+        self.assertIn('<c r="E2" s="1"><v>45292</v></c>', sheet)
+        self.assertNotIn('F2', sheet)
+
+    def test_xlsx_chunks(self):
+        chunks = list(stream_xlsx(['Number'], ([number] for number in range(10)), rows_per_chunk=4))
+        # Fixed parts, the rows in chunks and the central directory
+        self.assertGreater(len(chunks), 3)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIn('<row r="11">', archive.read('xl/worksheets/sheet1.xml').decode())
+
+
+class ExportMixinTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password',
+                                                 first_name='Admin', last_name='User')
+        Employee.objects.create(user=cls.user, slug='admin')
+        former = User.objects.create_user('former@example.com', 'former@example.com', first_name='=Former',
+                                          last_name='Employee', is_active=False)
+        Employee.objects.create(user=former, slug='former')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return read_csv(response.streaming_content)
+
+    def test_export_follows_list_filters(self):
+        self.assertEqual(self.export('/employees/?export=csv'),
+                         [['First name', 'Last name', 'Email', 'Active'], ['Admin', 'User', 'admin@example.com', 'True']])
+        rows = self.export('/employees/all/?export=csv')
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ["'=Former", 'Admin'])
+
+    def test_xlsx_response(self):
+        response = self.client.get('/employees/?export=xlsx')
+        self.assertIn('attachment; filename="employees-', response['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIn('admin@example.com', archive.read('xl/worksheets/sheet1.xml').decode())
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password',
+                                                  first_name='Admin', last_name='User')
+        cls.employee = Employee.objects.create(user=cls.admin, slug='admin')
+        cls.viewer = User.objects.create_user('viewer@example.com', 'viewer@example.com')
+        cls.viewer.user_permissions.add(Permission.objects.get(codename='view_client'))
+        currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        today = datetime.date.today()
+        cls.orion = Client.objects.create(slug='orion', name='Orion')
+        cls.contract = Contract.objects.create(slug='main', client=cls.orion, number='K/1', name='Main',
+                                               start_date=today, end_date=today, owner=cls.employee)
+        item = ContractItem.objects.create(contract=cls.contract, name='Support', value=100, currency=currency)
+        cls.invoice = SalesInvoice.objects.create(contract_item=item, number='FV/1', date=today, due_date=today,
+                                                  value=100, currency=currency, file='SalesInvoice/invoice.pdf')
+        cls.project = Project.objects.create(name='Migration', owner=cls.employee, client=cls.orion)
+
+    def titles(self, query, user=None):
+        return [document.title for document in search.search(query, user or self.admin)]
+
+    def test_index_follows_saves_and_deletes(self):
+        client = Client.objects.create(slug='zephyr', name='Zephyr')
+        self.assertEqual(self.titles('zephyr'), ['Zephyr'])
+        client.name, client.slug = 'Boreas', 'boreas'
+        client.save()
+        self.assertEqual(self.titles('zephyr'), [])
+        self.assertEqual(self.titles('boreas'), ['Boreas'])
+        client.delete()
+        self.assertEqual(self.titles('boreas'), [])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertCountEqual(self.titles('orio'), ['Orion', 'K/1 Main', 'FV/1', 'Migration'])
+        self.assertEqual(self.titles('mig'), ['Migration'])
+        # Every word must match
+        self.assertEqual(self.titles('orio migr'), ['Migration'])
+        self.assertEqual(self.titles('orion xyz'), [])
+
+    def test_title_matches_rank_first(self):
+        # Every document mentions Orion, only the client in its title
+        titles = self.titles('orion')
+        self.assertEqual(titles[0], 'Orion')
+        self.assertCountEqual(titles, ['Orion', 'K/1 Main', 'FV/1', 'Migration'])
+
+    def test_hits_are_limited_to_viewable_models(self):
+        self.assertEqual(self.titles('orion', self.viewer), ['Orion'])
+        self.assertEqual(self.titles('orion', User.objects.create_user('guest@example.com')), [])
+
+    def test_rebuild(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.titles('orion'), [])
+        # The four documents of setUpTestData and the admin employee
+        self.assertEqual(search.rebuild(), 5)
+        self.assertEqual(len(self.titles('orion')), 4)
+
+    def test_client_rename_reindexes_dependents(self):
+        self.orion.name = 'Vega'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orion.save()
+            # The dependents wait for the commit
+            self.assertEqual(self.titles('vega'), ['Vega'])
+        self.assertCountEqual(self.titles('vega'), ['Vega', 'K/1 Main', 'FV/1', 'Migration'])
+        # Only the client itself, through its unchanged slug
+        self.assertEqual(self.titles('orion'), ['Vega'])
+
+    def test_deactivate_leaves_dependents_alone(self):
+        client = Client.objects.get(pk=self.orion.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.deactivate()
+        with mock.patch.object(search, 'index_dependents') as index_dependents:
+            for callback in callbacks:
+                callback()
+        index_dependents.assert_not_called()
+
+    def test_delete_removes_documents_of_cascaded_rows(self):
+        client = Client.objects.create(slug='lyra', name='Lyra')
+        Contract.objects.create(slug='lyra', client=client, number='K/2', name='Lyra Care',
+                                start_date=datetime.date.today(), end_date=datetime.date.today())
+        Project.objects.create(name='Harp', owner=self.employee, client=client)
+        self.assertCountEqual(self.titles('lyra'), ['Lyra', 'K/2 Lyra Care', 'Harp'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.get(pk=client.pk).delete()
+        # The project stays, without the name of its client
+        self.assertEqual(self.titles('lyra'), [])
+        self.assertEqual(self.titles('harp'), ['Harp'])
+
+    def test_user_save_reindexes_employee(self):
+        self.admin.last_name = 'Żółw'
+        self.admin.save()
+        self.assertEqual(self.titles('żółw'), ['Admin Żółw'])
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.search_key, 'zolw admin')
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = get_blob_storage()
+
+    def blob_files(self):
+        return [name for directory, subdirectories, names in os.walk(os.path.join(self.media_root, 'blobs'))
+                for name in names]
+
+    def gc(self, *args):
+        output = io.StringIO()
+        call_command('gc_blobs', *args, stdout=output)
+        return output.getvalue()
+
+    def add_document(self, name):
+        user = User.objects.create_user(f'user{User.objects.count()}@example.com')
+        employee = Employee.objects.create(user=user, slug=f'user-{user.pk}')
+        document_type, created = EmployeeDocumentTypes.objects.get_or_create(code='CONTRACT', defaults={'name': 'Contract'})
+        return EmployeeDocument.objects.create(employee=employee, name='Contract', sign_date=datetime.date.today(),
+                                               file=name, document_type=document_type)
+
+    def expire(self):
+        Blob.objects.update(uploaded_at=timezone.now() - datetime.timedelta(hours=25))
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.storage.save('contract.pdf', ContentFile(b'content'))
+        second = self.storage.save('copy.pdf', ContentFile(b'content'))
+        digest = self.storage.digest(first)
+        self.assertEqual(first, f'{digest}/contract.pdf')
+        self.assertEqual(second, f'{digest}/copy.pdf')
+        self.assertEqual(self.blob_files(), [digest])
+        self.assertEqual(self.storage.path(second), os.path.join(self.media_root, self.storage.blob_name(digest)))
+        self.assertEqual(list(Blob.objects.values_list('digest', flat=True)), [digest])
+
+    def test_delete_leaves_the_blob_to_gc(self):
+        name = self.storage.save('contract.pdf', ContentFile(b'content'))
+        self.add_document(name)
+        self.storage.delete(name)
+        # Another row may share the blob
+        self.assertTrue(self.storage.exists(name))
+
+    def test_gc_keeps_referenced_and_recent_blobs(self):
+        referenced = self.storage.save('contract.pdf', ContentFile(b'referenced'))
+        self.add_document(referenced)
+        draft = self.storage.save('draft.pdf', ContentFile(b'unsaved upload'))
+        # The unreferenced blob is kept for the grace period
+        self.assertIn('Deleted 0 unreferenced blobs and 0 orphaned files (0 bytes).', self.gc())
+        self.expire()
+        self.assertIn('Deleted 1 unreferenced blobs', self.gc())
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertFalse(self.storage.exists(draft))
+
+    def test_gc_deletes_blobs_of_replaced_and_deleted_files(self):
+        replaced = self.storage.save('contract.pdf', ContentFile(b'first version'))
+        document = self.add_document(replaced)
+        deleted = self.storage.save('annex.pdf', ContentFile(b'annex'))
+        self.add_document(deleted).delete()
+        document.file = self.storage.save('contract.pdf', ContentFile(b'second version'))
+        document.save()
+        self.expire()
+        self.assertIn('Deleted 2 unreferenced blobs', self.gc())
+        self.assertEqual(list(Blob.objects.values_list('digest', flat=True)), [self.storage.digest(document.file.name)])
+
+    def test_gc_deletes_unreferenced_blobs_after_grace(self):
+        kept = self.storage.save('contract.pdf', ContentFile(b'referenced'))
+        self.add_document(kept)
+        name = self.storage.save('draft.pdf', ContentFile(b'unsaved upload'))
+        self.expire()
+        orphan = os.path.join(self.media_root, 'blobs', '.upload-interrupted')
+        with open(orphan, 'wb') as file:
+            file.write(b'partial')
+        old = (timezone.now() - datetime.timedelta(hours=25)).timestamp()
+        os.utime(orphan, (old, old))
+
+        self.assertIn('Would delete 1 unreferenced blobs and 1 orphaned files (21 bytes)', self.gc('--dry-run'))
+        self.assertEqual(len(self.blob_files()), 3)
+
+        self.assertIn('Deleted 1 unreferenced blobs and 1 orphaned files (21 bytes)', self.gc())
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(list(Blob.objects.values_list('digest', flat=True)), [self.storage.digest(kept)])
+
+    def test_upload_again_keeps_the_blob(self):
+        name = self.storage.save('draft.pdf', ContentFile(b'content'))
+        self.expire()
+        # Uploaded again, e.g. by a form not saved yet
+        self.storage.save('again.pdf', ContentFile(b'content'))
+        self.assertIn('Deleted 0 unreferenced blobs', self.gc())
+        self.assertTrue(self.storage.exists(name))
+
+    def test_upload_restores_a_collected_blob(self):
+        name = self.storage.save('draft.pdf', ContentFile(b'content'))
+        self.expire()
+        self.gc()
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.storage.save('again.pdf', ContentFile(b'content')), f'{self.storage.digest(name)}/again.pdf')
+        self.assertTrue(self.storage.exists(name))
+        self.assertTrue(Blob.objects.filter(pk=self.storage.digest(name)).exists())
+
+    @override_settings(FILE_OFFLOAD='x-accel-redirect', FILE_OFFLOAD_PREFIX='/protected-media/')
+    def test_offload_sends_the_blob(self):
+        name = self.storage.save('umowa ż.pdf', ContentFile(b'content'))
+        response = offload_response(EmployeeDocument(file=name).file, 'application/pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.storage.blob_name(self.storage.digest(name)))
+        legacy = offload_response(EmployeeDocument(file='EmployeeDocuments/umowa ż.pdf').file, 'application/pdf')
+        self.assertEqual(legacy['X-Accel-Redirect'], '/protected-media/EmployeeDocuments/umowa%20%C5%BC.pdf')
+
+
+def make_queries(count):
+    # The same query shape for different rows, as an N+1 loop issues it
+    for pk in range(count):
+        User.objects.filter(pk=pk).exists()
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise', QUERY_BUDGETS={'default': 3}, QUERY_BUDGET_DUPLICATES=None)
+class QueryBudgetMiddlewareTests(TestCase):
+    def call(self, view):
+        return QueryBudgetMiddleware(view)(RequestFactory().get('/report/'))
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id IN (%s, %s,  %s) AND name = 'x' LIMIT 21"),
+                         "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+
+    def test_within_budget(self):
+        def view(request):
+            make_queries(3)
+            return HttpResponse()
+        response = self.call(view)
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+
+    def test_budget_exceeded(self):
+        def view(request):
+            make_queries(4)
+            return HttpResponse()
+        with self.assertLogs('workify.queries', 'WARNING') as logs:
+            with self.assertRaisesMessage(QueryBudgetExceeded, '/report/: 4 queries exceed the budget of 3'):
+                self.call(view)
+            with override_settings(QUERY_BUDGET_ACTION='warn'), self.assertWarns(QueryBudgetWarning):
+                self.call(view)
+        self.assertEqual(logs.output, ['WARNING:workify.queries:/report/: 4 queries exceed the budget of 3'] * 2)
+
+    @override_settings(QUERY_BUDGETS={}, QUERY_BUDGET_DUPLICATES=2)
+    def test_duplicates(self):
+        def view(request):
+            make_queries(3)
+            return HttpResponse()
+        with self.assertLogs('workify.queries', 'WARNING'):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'query repeated 3 times: SELECT'):
+                self.call(view)
+
+    def test_streaming_content_queries_are_counted(self):
+        def view(request):
+            make_queries(2)
+            return StreamingHttpResponse(make_queries(count) or b'row' for count in [1, 1])
+        response = self.call(view)
+        # Only the queries of the view are known when the headers are sent
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        with self.assertLogs('workify.queries', 'WARNING'):
+            with self.assertRaisesMessage(QueryBudgetExceeded, '4 queries exceed the budget of 3'):
+                b''.join(response.streaming_content)
+
+
+class CacheTests(TestCase):
+    def test_long_keys_are_folded(self):
+        self.assertEqual(cache.make_key('fx', '2024-01-01', 2), 'workify:fx:2024-01-01:2')
+        key = cache.make_key('autocomplete', 'x' * 300)
+        self.assertEqual(len(key), len('workify:autocomplete:') + 32)
+        self.assertEqual(key, cache.make_key('autocomplete', 'x' * 300))
+        self.assertNotEqual(key, cache.make_key('autocomplete', 'x' * 301))
+
+    def test_bump_model_generation_bumps_again_on_commit(self):
+        generation = cache.get_model_generation(Client)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            cache.bump_model_generation(Client)
+            self.assertEqual(cache.get_model_generation(Client), generation + 1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(cache.get_model_generation(Client), generation + 2)
+        # A label and the model class share the counter
+        cache.bump_model_generation('clients.Client')
+        self.assertEqual(cache.get_model_generation(Client), generation + 3)
+
+    def test_versioned_key_changes_on_writes(self):
+        key = cache.versioned_key('clients', 'list', depends_on=[Client])
+        self.assertEqual(cache.versioned_key('clients', 'list', depends_on=[Client]), key)
+        Client.objects.create(slug='acme', name='Acme')
+        self.assertNotEqual(cache.versioned_key('clients', 'list', depends_on=[Client]), key)
+        self.assertEqual(cache.versioned_key('clients', 'list'), 'workify:clients:list')
+
+    def test_get_or_set(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return Client.objects.count()
+
+        self.assertEqual(cache.get_or_set('test', ['count'], build, depends_on=[Client]), 0)
+        self.assertEqual(cache.get_or_set('test', ['count'], build, depends_on=[Client]), 0)
+        self.assertEqual(len(calls), 1)
+        Client.objects.create(slug='acme', name='Acme')
+        self.assertEqual(cache.get_or_set('test', ['count'], build, depends_on=[Client]), 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_generation_cache_rebuilds_after_writes(self):
+        generation_cache = cache.GenerationCache(lambda: list(Client.objects.values_list('name', flat=True)),
+                                                 depends_on=[Client])
+        self.assertEqual(generation_cache.get(), [])
+        Client.objects.create(slug='acme', name='Acme')
+        self.assertEqual(generation_cache.get(), ['Acme'])
+        with self.assertNumQueries(0):
+            generation_cache.get()
+        generation_cache.clear()
+        with self.assertNumQueries(1):
+            generation_cache.get()
+
+    def test_generation_cache_rechecks_other_processes_after_interval(self):
+        generation_cache = cache.GenerationCache(lambda: Client.objects.count(), depends_on=[Client], recheck_after=60)
+        self.assertEqual(generation_cache.get(), 0)
+        Client.objects.bulk_create([Client(slug='acme', name='Acme')])
+        # Another process bumps the shared counter only
+        cache.bump_generation(cache.get_model_namespace(Client))
+        self.assertEqual(generation_cache.get(), 0)
+        with mock.patch('common.cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(generation_cache.get(), 1)
+        # A bump in this process is seen at once
+        Client.objects.bulk_create([Client(slug='beta', name='Beta')])
+        cache.bump_model_generation(Client)
+        self.assertEqual(generation_cache.get(), 2)
+
+
+def make_image(color, size=(300, 200)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, format='PNG')
+    return ContentFile(output.getvalue(), name='logo.png')
+
+
+class ImageRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@example.com', 'user@example.com', 'password')
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_renditions(self):
+        name = default_storage.save('avatar.png', make_image('red'))
+        renditions = images.build_renditions(Employee(avatar=name).avatar)
+        self.assertEqual(renditions['source'], name)
+        self.assertEqual(list(renditions['sizes']), ['32', '64', '256'])
+        names = images.get_rendition_names(renditions)
+        self.assertEqual(len(names), 6)
+        self.assertTrue(all(default_storage.exists(rendition) for rendition in names))
+        with Image.open(default_storage.open(renditions['sizes']['64']['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (64, 64)))
+        # Named by content, building again writes nothing new
+        self.assertEqual(images.build_renditions(Employee(avatar=name).avatar), renditions)
+
+    def test_srcset(self):
+        sizes = {str(size): {'webp': f'renditions/{size}.webp', 'png': f'renditions/{size}.png'} for size in [32, 64, 256]}
+        srcset = images.get_srcset({'sizes': sizes}, 32)
+        self.assertEqual(srcset['webp'], '/renditions/32.webp 1x, /renditions/64.webp 2x, '
+                                         '/renditions/256.webp 8x')
+        self.assertEqual(srcset['src'], '/renditions/32.png')
+        # Larger than every rendition, the largest one is scaled up
+        self.assertEqual(images.get_srcset({'sizes': sizes}, 512)['png'], '/renditions/256.png 0.5x')
+        self.assertIsNone(images.get_srcset({}, 32))
+
+    def test_renditions_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            client = Client.objects.create(slug='acme', name='Acme', logo=make_image('red'))
+        self.assertEqual(Client.objects.get(pk=client.pk).renditions, {})
+        for callback in callbacks:
+            callback()
+        first = Client.objects.get(pk=client.pk).renditions
+        self.assertEqual(first['source'], client.logo.name)
+
+        client.refresh_from_db()
+        client.logo = make_image('blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.save()
+        second = Client.objects.get(pk=client.pk).renditions
+        self.assertEqual(second['source'], client.logo.name)
+        # The renditions of the replaced logo are deleted
+        self.assertFalse(any(default_storage.exists(name) for name in images.get_rendition_names(first)))
+        self.assertTrue(all(default_storage.exists(name) for name in images.get_rendition_names(second)))
+
+    def test_shared_renditions_are_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Client.objects.create(slug='acme', name='Acme', logo=make_image('red'))
+            second = Client.objects.create(slug='beta', name='Beta', logo=make_image('red'))
+        shared = images.get_rendition_names(Client.objects.get(pk=first.pk).renditions)
+        self.assertEqual(set(Rendition.objects.values_list('name', 'ref_count')), {(name, 2) for name in shared})
+
+        first = Client.objects.get(pk=first.pk)
+        first.logo = make_image('blue')
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            first.save()
+        # References are looked up by name, without scanning the rows
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql'].upper()])
+        self.assertTrue(all(default_storage.exists(name) for name in shared))
+        self.assertEqual(set(Rendition.objects.filter(name__in=shared).values_list('ref_count', flat=True)), {1})
+
+        Client.objects.get(pk=second.pk).delete()
+        self.assertFalse(Rendition.objects.filter(name__in=shared).exists())
+        self.assertFalse(any(default_storage.exists(name) for name in shared))
+
+    def test_rendition_view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = Client.objects.create(slug='acme', name='Acme', logo=make_image('red'))
+        client.refresh_from_db()
+        url = client.get_srcset(32)['src']
+        self.client.force_login(self.user)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        etag = response['ETag']
+        response.close()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/renditions/0123456789abcdef0123.png').status_code, 404)
+        self.assertEqual(self.client.get('/renditions/avatar.png').status_code, 404)
+
+
+class ByteRangeTests(TestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 100), (0, 99))
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 19))
+        self.assertEqual(parse_range('bytes=90-500', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-5', 100), (95, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        # Not a single byte range, the whole file is sent
+        for header in ['bytes=0-1,5-6', 'items=0-1', 'bytes=-']:
+            self.assertIsNone(parse_range(header, 100))
+        for header in ['bytes=100-', 'bytes=5-4', 'bytes=-0']:
+            with self.assertRaises(ValueError):
+                parse_range(header, 100)
+
+    def test_if_range_matches(self):
+        modified = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        self.assertTrue(if_range_matches('"abc"', '"abc"', modified))
+        self.assertFalse(if_range_matches('"abd"', '"abc"', modified))
+        self.assertFalse(if_range_matches('W/"abc"', '"abc"', modified))
+        self.assertTrue(if_range_matches(http_date(modified.timestamp()), '"abc"', modified))
+        self.assertFalse(if_range_matches(http_date(modified.timestamp() - 1), '"abc"', modified))
+        self.assertFalse(if_range_matches(http_date(modified.timestamp()), '"abc"', None))
+
+
+class FileViewTests(TestCase):
+    content = b'0123456789' * 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password')
+        currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        client = Client.objects.create(slug='acme', name='Acme')
+        contract = Contract.objects.create(slug='main', client=client, number='K/1', name='Main',
+                                           start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31))
+        cls.item = ContractItem.objects.create(contract=contract, name='Support', value=100, currency=currency)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, FILE_OFFLOAD='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.invoice = SalesInvoice.objects.create(
+            contract_item=self.item, number='FV/1', date=datetime.date(2024, 1, 1), due_date=datetime.date(2024, 1, 31),
+            value=100, currency=self.item.currency, file=ContentFile(self.content, name='faktura ż.pdf'))
+        self.url = self.invoice.get_absolute_url()
+        self.etag = f'"{get_blob_storage().digest(self.invoice.file.name)}"'
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Content-Disposition'],
+                         "attachment; filename=\"faktura_.pdf\"; filename*=UTF-8''faktura_%C5%BC.pdf")
+
+    def test_byte_ranges(self):
+        response = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 10-19/100', '10'))
+
+        response = self.get(Range='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), b'56789')
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_if_range(self):
+        response = self.get(Range='bytes=0-9', If_Range=self.etag)
+        self.assertEqual(response.status_code, 206)
+        # The file changed since the first part was downloaded, the whole new file is sent
+        response = self.get(Range='bytes=0-9', If_Range='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        response = self.get(If_None_Match=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_offload(self):
+        storage = get_blob_storage()
+        with override_settings(FILE_OFFLOAD='x-sendfile'):
+            response = self.get(Range='bytes=0-9')
+        # The front-end server sends the file and handles the range
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Sendfile'], storage.path(self.invoice.file.name))
+        self.assertIn('attachment;', response['Content-Disposition'])
+        with override_settings(FILE_OFFLOAD='x-accel-redirect', FILE_OFFLOAD_PREFIX='/protected/'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + storage.location_name(self.invoice.file.name))
+        self.assertEqual(response['ETag'], self.etag)
+
+
+class ClientPages(KeysetPaginationMixin, ListView):
+    model = Client
+    sort_fields = {'name': 'name', 'created': 'created_at'}
+    default_sort = 'name'
+    page_size = 2
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Three clients share the sort key, the primary key breaks the tie
+        for number, name in enumerate(['Beta', 'Acme', 'Gamma', 'Acme', 'Acme']):
+            Client.objects.create(slug=f'client-{number}', name=name)
+
+    def page(self, url='/clients/', **params):
+        view = ClientPages()
+        view.setup(RequestFactory().get(url, params))
+        return view.paginate_keyset(Client.objects.all())
+
+    def get_cursor(self, url):
+        return urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)['after'][0]
+
+    def walk(self, **params):
+        # The next page URL keeps the other parameters
+        rows, row_offset, url = self.page(**params)
+        offsets = [row_offset]
+        while url:
+            page, row_offset, url = self.page(url)
+            rows += page
+            offsets.append(row_offset)
+        return [client.slug for client in rows], offsets
+
+    def test_pages_continue_from_the_cursor(self):
+        slugs, offsets = self.walk()
+        self.assertEqual(slugs, ['client-1', 'client-3', 'client-4', 'client-0', 'client-2'])
+        self.assertEqual(offsets, [0, 2, 4])
+
+    def test_descending(self):
+        slugs, offsets = self.walk(sort='-name')
+        self.assertEqual(slugs, ['client-2', 'client-0', 'client-4', 'client-3', 'client-1'])
+
+    def test_unknown_sort_falls_back_to_default(self):
+        self.assertEqual(self.walk(sort='-slug')[0], self.walk()[0])
+
+    def test_timestamps_keep_microseconds(self):
+        # All within one millisecond, which DjangoJSONEncoder would round them to
+        start = timezone.now().replace(microsecond=0)
+        for number, microseconds in enumerate([400, 100, 900, 0, 650]):
+            Client.objects.filter(slug=f'client-{number}').update(
+                created_at=start + datetime.timedelta(microseconds=microseconds))
+        self.assertEqual(self.walk(sort='created')[0], ['client-3', 'client-1', 'client-0', 'client-4', 'client-2'])
+        self.assertEqual(self.walk(sort='-created')[0], ['client-2', 'client-4', 'client-0', 'client-1', 'client-3'])
+
+    def test_cursor_of_another_order_restarts(self):
+        rows, row_offset, url = self.page()
+        rows, row_offset, url = self.page(sort='-name', after=self.get_cursor(url))
+        self.assertEqual((rows[0].slug, row_offset), ('client-2', 0))
+
+    def test_tampered_cursor_restarts(self):
+        rows, row_offset, url = self.page()
+        cursor = self.get_cursor(url)
+        rows, row_offset, url = self.page(after=cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'))
+        self.assertEqual((rows[0].slug, row_offset), ('client-1', 0))
+
+
+class GenerateDemoDataTests(TestCase):
+    def test_smoke(self):
+        output = io.StringIO()
+        call_command('generate_demo_data', clients=3, contracts_per_client=1, items_per_contract=2,
+                     invoices_per_item=2, employees=4, rates_per_employee=2, projects=2, budgets=2, seed=1,
+                     stdout=output)
+        self.assertIn('Demo data generated', output.getvalue())
+        self.assertEqual((Client.objects.count(), SalesInvoice.objects.count(), Project.objects.count()), (3, 12, 2))
+        self.assertFalse(Client.objects.filter(search_key='').exists())
+        self.assertFalse(Employee.objects.filter(search_key='').exists())
+        client = Client.objects.first()
+        self.assertEqual(client.get_statistics().invoices, 4)
+        admin = User.objects.create_superuser('admin@example.com', 'admin@example.com', 'password')
+        self.assertIn(client.name, [document.title for document in search.search(client.slug, admin)])
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'common'
+urlpatterns = [
+    path('renditions/<str:name>', views.RenditionView.as_view(), name='rendition'),
+    path('search/', views.SearchView.as_view(), name='search'),
+]
@@ -1,3 +1,55 @@
+import re
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
 from django.shortcuts import render
+from django.views.generic import View
+
+from . import images, search
+from .helpers import Breadcrumbs
+
+RENDITION_NAME = re.compile(r'^[0-9a-f]{20}\.(webp|png)$')
+
+
+class RenditionView(LoginRequiredMixin, View):
+    """
+    Serve image renditions. Their names are content hashes, so browsers may cache them forever.
+    """
+    def get(self, request, name):
+        match = RENDITION_NAME.match(name)
+        if not match or not default_storage.exists(images.RENDITION_DIR + name):
+            raise Http404
+        etag = f'"{name.split(".")[0]}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(default_storage.open(images.RENDITION_DIR + name), content_type=f'image/{match.group(1)}')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+
+class SearchView(LoginRequiredMixin, View):
+    """
+    Global search. HTMX requests from the header search box get the list of hits only.
+    """
+    labels = {
+        'clients.client': 'Client',
+        'clients.contract': 'Contract',
+        'clients.salesinvoice': 'Invoice',
+        'employees.employee': 'Employee',
+        'projects.project': 'Project',
+    }
 
-# Create your views here.
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        hits = search.search(query, request.user) if query else []
+        for hit in hits:
+            hit.label = self.labels.get(hit.model, hit.model)
+        context = {'query': query, 'hits': hits}
+        if request.headers.get('HX-Request') == 'true':
+            return render(request, 'search_results.html', context)
+        context['breadcrumbs'] = Breadcrumbs()
+        context['breadcrumbs'].add('Search')
+        return render(request, 'search.html', context)
@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import Currency, UserGroup, Dimension, EmployeeDocumentTypes
+from .models import Currency, ExchangeRate, UserGroup, Dimension, EmployeeDocumentTypes
+from .tree import BLANK_CHOICE, bump_version, get_dimension_tree
 
 @admin.register(Currency)
 class CurrencyAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'default')
     search_fields = ('code', 'name')
 
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
 @admin.register(EmployeeDocumentTypes)
 class EmployeeDocumentTypesAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'default')
@@ -18,6 +25,16 @@ class UserGroupsAdmin(admin.ModelAdmin):
 
 @admin.register(Dimension)
 class DimensionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'parent')
+    list_display = ('name', 'parent', 'depth')
     search_fields = ('name',)
-    list_filter = ('parent',)
\ No newline at end of file
+    list_filter = ('parent',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'parent':
+            formfield.choices = [BLANK_CHOICE] + get_dimension_tree().get_all_indented_choices()
+        return formfield
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_version()
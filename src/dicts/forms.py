@@ -0,0 +1,46 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class DictChoiceIterator:
+    """
+    Lazy choices, the dictionary is read when the widget renders, not when the form class is built.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from self.field.queryset.model.get_choices()
+
+    def __len__(self):
+        return len(self.field.queryset.model.get_choices()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.queryset.model.get_choices())
+
+
+class DictChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField for BaseDict models, rendered and validated from the in-process dictionary cache
+    instead of querying the table.
+    """
+    def _get_choices(self):
+        return DictChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            return value
+        try:
+            return self.queryset.model.get_by_id()[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
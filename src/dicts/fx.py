@@ -0,0 +1,206 @@
+"""
+Currency conversion with dated exchange rates.
+
+ExchangeRate holds the rate of every currency against FX_BASE_CURRENCY per day, the ECB reference
+rates by default. Conversions load the rates of the date window they need once into a RateTable
+(one query, cached until a rate changes) and convert between any two currencies through the base
+currency, at the latest rate on or before the day: no rates are published on weekends and holidays.
+"""
+import bisect
+import csv
+import datetime
+import io
+import zipfile
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from common import cache
+
+EXCHANGE_RATE_MODEL = 'dicts.ExchangeRate'
+# Days before the window searched for the last published rate
+LOOKBACK_DAYS = 10
+CENT = Decimal('0.01')
+DATE_FORMATS = ['%Y-%m-%d', '%d %B %Y']
+
+
+class MissingRate(LookupError):
+    pass
+
+
+def get_base_currency():
+    return getattr(settings, 'FX_BASE_CURRENCY', 'EUR')
+
+
+def round_amount(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class RateTable:
+    """
+    Rates of a date window by currency code, as parallel sorted lists of dates and rates.
+    """
+    def __init__(self, rows, base):
+        self.base = base
+        self.dates = defaultdict(list)
+        self.rates = defaultdict(list)
+        for code, date, rate in rows:
+            self.dates[code].append(date)
+            self.rates[code].append(rate)
+
+    @classmethod
+    def load(cls, start, end):
+        from .models import ExchangeRate
+        rows = (ExchangeRate.objects
+                .filter(date__gte=start - datetime.timedelta(days=LOOKBACK_DAYS), date__lte=end)
+                .order_by('currency__code', 'date')
+                .values_list('currency__code', 'date', 'rate'))
+        return cls(rows, get_base_currency())
+
+    def rate(self, code, on):
+        """
+        Units of code per one unit of the base currency on the day.
+        """
+        if code == self.base:
+            return Decimal(1)
+        index = bisect.bisect_right(self.dates.get(code, []), on)
+        if not index:
+            raise MissingRate(f"No {code} exchange rate on or before {on}.")
+        return self.rates[code][index - 1]
+
+    def convert(self, amount, from_code, to_code, on):
+        if from_code == to_code:
+            return amount
+        return amount * self.rate(to_code, on) / self.rate(from_code, on)
+
+
+def get_rate_table(start, end=None):
+    end = end or start
+    return cache.get_or_set('fx', [start.isoformat(), end.isoformat()], lambda: RateTable.load(start, end),
+                            depends_on=[EXCHANGE_RATE_MODEL])
+
+
+def convert(amount, from_code, to_code, on=None):
+    on = on or datetime.date.today()
+    return round_amount(get_rate_table(on).convert(Decimal(amount), from_code, to_code, on))
+
+
+def convert_many(items, to_code):
+    """
+    Converted amounts of (amount, currency code, date) items, with one rate window for all of them.
+    Raises MissingRate when a rate is not known.
+    """
+    items = list(items)
+    if not items:
+        return []
+    dates = [on for amount, code, on in items]
+    table = get_rate_table(min(dates), max(dates))
+    return [round_amount(table.convert(Decimal(amount), code, to_code, on)) for amount, code, on in items]
+
+
+def sum_amounts(items, to_code):
+    """
+    Sum of (amount, currency code, date) items in to_code, rounded once at the end.
+    """
+    items = list(items)
+    if not items:
+        return Decimal(0).quantize(CENT)
+    dates = [on for amount, code, on in items]
+    table = get_rate_table(min(dates), max(dates))
+    return round_amount(sum((table.convert(Decimal(amount), code, to_code, on) for amount, code, on in items), Decimal(0)))
+
+
+def total(queryset, to_code, amount_field='value', currency_field='currency__code', date_field=None, on=None):
+    """
+    Sum of amount_field over queryset in to_code, e.g. total(SalesInvoice.objects.unpaid(), 'PLN').
+
+    The database sums the amounts per currency (and per day of date_field), only those sums are
+    converted. Without date_field everything is converted at the rates of `on`, today by default.
+    """
+    on = on or datetime.date.today()
+    group = [currency_field, date_field] if date_field else [currency_field]
+    rows = queryset.order_by().values(*group).annotate(fx_amount=Sum(amount_field))
+    return sum_amounts([(row['fx_amount'], row[currency_field], row[date_field] if date_field else on)
+                        for row in rows if row['fx_amount'] is not None], to_code)
+
+
+def parse_date(value):
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid date "{value}".')
+
+
+def read_rates(file):
+    """
+    (date, currency code, rate) rows of a text file in one of the ECB reference rate layouts - the
+    daily eurofxref.csv or the historical eurofxref-hist.csv, one column per currency and "N/A"
+    where there is no rate - or a plain "date,currency,rate" file.
+    """
+    reader = csv.reader(file)
+    header = [column.strip() for column in next(reader, [])]
+    if [column.lower() for column in header[:3]] == ['date', 'currency', 'rate']:
+        for row in reader:
+            if row and row[0].strip():
+                yield parse_date(row[0]), row[1].strip().upper(), Decimal(row[2].strip())
+        return
+    codes = [code.upper() for code in header[1:]]
+    for row in reader:
+        if not row or not row[0].strip():
+            continue
+        on = parse_date(row[0])
+        for code, value in zip(codes, row[1:]):
+            value = value.strip()
+            if code and value and value.upper() != 'N/A':
+                yield on, code, Decimal(value)
+
+
+def open_rate_file(path):
+    """
+    Text stream of a rate file, or of the CSV inside a zip archive as downloaded from the ECB.
+    """
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        name = next((name for name in archive.namelist() if name.lower().endswith('.csv')), None)
+        if name is None:
+            raise ValueError(f'"{path}" does not contain a CSV file.')
+        return io.TextIOWrapper(archive.open(name), encoding='utf-8-sig')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def import_rates(rows, batch_size=2000):
+    """
+    Store (date, currency code, rate) rows, replacing rates of the same currency and day. Rows of
+    currencies missing from the Currency dictionary are skipped. Returns (stored rows, skipped codes).
+    """
+    from .models import Currency, ExchangeRate
+    currencies = Currency.get_by_code()
+    base = get_base_currency()
+    stored, skipped, batch = 0, set(), []
+
+    def flush():
+        ExchangeRate.objects.bulk_create(batch, update_conflicts=True, unique_fields=['currency', 'date'],
+                                         update_fields=['rate'])
+        batch.clear()
+
+    with transaction.atomic():
+        for on, code, rate in rows:
+            if code == base:
+                continue
+            if code not in currencies:
+                skipped.add(code)
+                continue
+            batch.append(ExchangeRate(currency=currencies[code], date=on, rate=rate))
+            stored += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    cache.bump_model_generation(EXCHANGE_RATE_MODEL)
+    return stored, sorted(skipped)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dicts import fx
+
+
+class Command(BaseCommand):
+    help = ("Import exchange rates from a local file: the ECB eurofxref.csv / eurofxref-hist.csv (or their "
+            "zip archives) or a \"date,currency,rate\" CSV. Rates are against FX_BASE_CURRENCY.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Rate file to import.")
+
+    def handle(self, *args, **options):
+        try:
+            with fx.open_rate_file(options['path']) as file:
+                stored, skipped = fx.import_rates(fx.read_rates(file))
+        except (OSError, ValueError, ArithmeticError) as error:
+            raise CommandError(f"Cannot import {options['path']}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"{stored} exchange rates imported."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped currencies missing from the dictionary: {', '.join(skipped)}"))
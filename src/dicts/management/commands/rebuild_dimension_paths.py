@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from dicts.models import Dimension
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized path, depth and root of every dimension from its parent links."
+
+    def handle(self, *args, **options):
+        changed = Dimension.rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt hierarchy index, {changed} dimension(s) updated."))
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.13 on 2026-10-18 02:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_dimension_paths(apps, schema_editor):
+    Dimension = apps.get_model('dicts', 'Dimension')
+    dimensions = {dimension.pk: dimension for dimension in Dimension.objects.all()}
+    resolved = {}
+
+    def resolve(dimension):
+        if dimension.pk not in resolved:
+            if dimension.parent_id is None:
+                resolved[dimension.pk] = (f"{dimension.pk}/", 0, dimension.pk)
+            else:
+                parent_path, parent_depth, root_id = resolve(dimensions[dimension.parent_id])
+                resolved[dimension.pk] = (f"{parent_path}{dimension.pk}/", parent_depth + 1, root_id)
+        return resolved[dimension.pk]
+
+    for dimension in dimensions.values():
+        dimension.path, dimension.depth, dimension.root_id = resolve(dimension)
+    Dimension.objects.bulk_update(dimensions.values(), ['path', 'depth', 'root'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dicts', '0009_alter_employeedocumenttypes_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dimension',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dimension',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='dimension',
+            name='root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dicts.dimension'),
+        ),
+        migrations.RunPython(backfill_dimension_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dicts', '0010_dimension_path_depth_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='dicts.currency')),
+            ],
+            options={
+                'ordering': ['currency', 'date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('currency', 'date'), name='exchangerate_currency_date_unique'),
+        ),
+    ]
@@ -1,5 +1,37 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Max, Value
+from django.db.models.functions import Concat, Length, Substr
 from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+
+from common import cache
+from . import tree as dimension_tree
+
+_dict_caches = {}
+# Dictionaries change about once a year, other processes may see a change this many seconds late
+DICT_RECHECK_SECONDS = 5
+
+
+def get_dict_cache(model, builder):
+    """
+    Process-local GenerationCache of a whole dictionary table, rebuilt after any write to it.
+    """
+    if model not in _dict_caches:
+        _dict_caches[model] = cache.GenerationCache(builder, depends_on=[model], recheck_after=DICT_RECHECK_SECONDS)
+    return _dict_caches[model]
+
+
+class DictTable:
+    """
+    Rows of a dictionary table with their lookups, built once per generation of the table.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_id = {row.id: row for row in rows}
+        self.by_code = {row.code: row for row in rows}
+        self.default = next((row for row in rows if row.default), None)
+        self.choices = [(row.id, f"{row}") for row in rows]
+
 
 class BaseDict(models.Model):
     code = models.CharField(max_length=3, unique=True)
@@ -11,14 +43,31 @@ class BaseDict(models.Model):
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def get_table(cls):
+        # The whole table is kept in memory, see DictTable
+        return get_dict_cache(cls, lambda: DictTable(list(cls.objects.all()))).get()
+
+    @classmethod
+    def get_all(cls):
+        return cls.get_table().rows
     
     @classmethod
     def get_choices(cls):
-        return [(element.id, f"{element}") for element in cls.objects.all()]
+        return cls.get_table().choices
     
     @classmethod
     def get_default(cls):
-        return cls.objects.filter(default=True).first()
+        return cls.get_table().default
+
+    @classmethod
+    def get_by_id(cls):
+        return cls.get_table().by_id
+
+    @classmethod
+    def get_by_code(cls):
+        return cls.get_table().by_code
     
     def save(self, *args, **kwargs):
         self.code = self.code.upper()
@@ -27,6 +76,12 @@ class BaseDict(models.Model):
             cls = self.__class__
             cls.objects.filter(default=True).update(default=False)
         super().save(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+        return result
 
 class Currency(BaseDict):
     class Meta:
@@ -36,6 +91,32 @@ class Currency(BaseDict):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+class ExchangeRate(models.Model):
+    """
+    Units of currency worth one unit of the FX_BASE_CURRENCY on date, see dicts.fx.
+    """
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='rates')
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+
+    class Meta:
+        ordering = ['currency', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='exchangerate_currency_date_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency.code} {self.date}: {self.rate}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+        return result
+
 class EmployeeDocumentTypes(BaseDict):
     code = models.CharField(max_length=25, unique=True)
     class Meta:
@@ -56,11 +137,29 @@ class UserGroup(models.Model):
     
     @classmethod
     def get_choices(cls):
-        return [(f"{element.group}", f"{element}") for element in cls.objects.all()]
+        return get_dict_cache(cls, lambda: [(f"{element.group}", f"{element}") for element in cls.objects.select_related('group')]).get()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.bump_model_generation(type(self))
+        return result
     
 class Dimension(models.Model):
+    PATH_SEPARATOR = '/'
+    # max_length of path, which limits how deep the tree can grow
+    MAX_PATH_LENGTH = 255
+
     name = models.CharField(max_length=100)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
+    # Materialized path of primary keys from the top-level dimension down to this one, e.g. "1/5/12/".
+    # Kept in sync on save, so ancestors, subtrees and depth never need a recursive walk.
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='+', editable=False)
   
     class Meta:
         verbose_name_plural = 'Dimensions'
@@ -69,13 +168,116 @@ class Dimension(models.Model):
     def __str__(self):
         return self.name
     
-    def get_top_level_dimension(self):
+    def clean(self):
+        if self.parent_id is not None and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError("A dimension cannot be moved below itself or one of its descendants.")
+
+    def save(self, *args, **kwargs):
+        parent = None
+        if self.parent_id is not None:
+            parent = Dimension.objects.only('path', 'depth', 'root').get(pk=self.parent_id)
+            if self.path and parent.path.startswith(self.path):
+                raise ValidationError("A dimension cannot be moved below itself or one of its descendants.")
+        old_path = self.path
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._sync_path(parent, old_path)
+        dimension_tree.bump_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        dimension_tree.bump_version()
+        return result
+
+    def _sync_path(self, parent, old_path):
         """
-        Recursively find the top-level dimension (the one without a parent).
+        Recalculate path, depth and root after a save and, if the dimension was moved,
+        rewrite the paths of its whole subtree with a single UPDATE. Raises ValidationError when
+        a path of the subtree would not fit MAX_PATH_LENGTH.
         """
-        if self.parent is None:
-            # If the current dimension has no parent, it is the top-level dimension
-            return self
+        if parent is None:
+            parent_path, depth, root_id = '', 0, self.pk
         else:
-            # Recursively call the method on the parent
-            return self.parent.get_top_level_dimension()
\ No newline at end of file
+            parent_path, depth, root_id = parent.path, parent.depth + 1, parent.root_id
+        new_path = f"{parent_path}{self.pk}{self.PATH_SEPARATOR}"
+        if new_path == old_path and root_id == self.root_id:
+            return
+
+        longest = len(new_path)
+        if old_path:
+            subtree = Dimension.objects.filter(path__startswith=old_path).aggregate(longest=Max(Length('path')))
+            longest += (subtree['longest'] or len(old_path)) - len(old_path)
+        if longest > self.MAX_PATH_LENGTH:
+            raise ValidationError("The dimension tree would be too deep here, "
+                                  f"paths are limited to {self.MAX_PATH_LENGTH} characters.")
+        Dimension.objects.filter(pk=self.pk).update(path=new_path, depth=depth, root_id=root_id)
+        if old_path:
+            old_depth = old_path.count(self.PATH_SEPARATOR) - 1
+            Dimension.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (depth - old_depth),
+                root_id=root_id,
+            )
+        self.path, self.depth, self.root_id = new_path, depth, root_id
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        Recalculate path, depth and root for every dimension from the parent links.
+        Loads the table once and writes the result with bulk_update.
+        """
+        dimensions = {dimension.pk: dimension for dimension in cls.objects.only('parent', 'path', 'depth', 'root')}
+        resolved = {}
+
+        def resolve(dimension, visiting=()):
+            if dimension.pk in resolved:
+                return resolved[dimension.pk]
+            if dimension.pk in visiting:
+                raise ValidationError(f"Dimension {dimension.pk} is part of a parent cycle.")
+            if dimension.parent_id is None:
+                result = (f"{dimension.pk}{cls.PATH_SEPARATOR}", 0, dimension.pk)
+            else:
+                parent_path, parent_depth, root_id = resolve(dimensions[dimension.parent_id], visiting + (dimension.pk,))
+                result = (f"{parent_path}{dimension.pk}{cls.PATH_SEPARATOR}", parent_depth + 1, root_id)
+            if len(result[0]) > cls.MAX_PATH_LENGTH:
+                raise ValidationError(f"Dimension {dimension.pk} is nested too deep, "
+                                      f"paths are limited to {cls.MAX_PATH_LENGTH} characters.")
+            resolved[dimension.pk] = result
+            return result
+
+        changed = []
+        for dimension in dimensions.values():
+            path, depth, root_id = resolve(dimension)
+            if (dimension.path, dimension.depth, dimension.root_id) != (path, depth, root_id):
+                dimension.path, dimension.depth, dimension.root_id = path, depth, root_id
+                changed.append(dimension)
+        cls.objects.bulk_update(changed, ['path', 'depth', 'root'], batch_size=500)
+        return len(changed)
+
+    def get_top_level_dimension(self):
+        """
+        Return the top-level dimension (the one without a parent) using the stored root, or by walking
+        up the parents of a dimension inserted without save() and not rebuilt yet.
+        """
+        if self.root_id is not None:
+            return self if self.root_id == self.pk else self.root
+        dimension, visited = self, {self.pk}
+        while dimension.parent_id is not None:
+            if dimension.parent_id in visited:
+                raise ValidationError(f"Dimension {dimension.pk} is part of a parent cycle.")
+            visited.add(dimension.parent_id)
+            dimension = dimension.parent
+        return dimension
+
+    def get_ancestors(self):
+        ancestor_ids = [int(pk) for pk in self.path.split(self.PATH_SEPARATOR) if pk][:-1]
+        return Dimension.objects.filter(pk__in=ancestor_ids).order_by('depth')
+
+    def get_descendants(self, include_self=False):
+        if not self.path:
+            # Unsaved, or inserted without save() and not rebuilt yet: an empty prefix would match every row
+            return Dimension.objects.none()
+        descendants = Dimension.objects.filter(path__startswith=self.path)
+        if include_self:
+            return descendants
+        return descendants.exclude(pk=self.pk)
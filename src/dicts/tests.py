@@ -1,3 +1,167 @@
+import datetime
+import io
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django import forms
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from common import cache
+from . import fx
+from .forms import DictChoiceField
+from .models import Currency, Dimension, ExchangeRate
+
+
+class CurrencyConversionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for code in ['EUR', 'USD', 'PLN']:
+            Currency.objects.create(code=code, name=code)
+        history = io.StringIO("Date,USD,JPY,PLN,\n2024-01-05,1.0921,158.23,4.3580,\n2024-01-04,1.0953,N/A,4.3505,\n")
+        cls.imported = fx.import_rates(fx.read_rates(history))
+
+    def test_import_ecb_layouts(self):
+        self.assertEqual(self.imported, (4, ['JPY']))
+        daily = io.StringIO("Date, USD, PLN, \n08 January 2024, 1.0950, 4.3600, \n")
+        fx.import_rates(fx.read_rates(daily))
+        self.assertEqual(ExchangeRate.objects.get(currency__code='PLN', date=datetime.date(2024, 1, 8)).rate, Decimal('4.36'))
+
+    def test_cross_rate_falls_back_to_last_published_day(self):
+        # Saturday uses the rates of Friday, both converted through EUR
+        self.assertEqual(fx.convert(100, 'USD', 'PLN', datetime.date(2024, 1, 6)), Decimal('399.05'))
+        self.assertEqual(fx.convert(100, 'EUR', 'PLN', datetime.date(2024, 1, 4)), Decimal('435.05'))
+        with self.assertRaises(fx.MissingRate):
+            fx.convert(100, 'USD', 'PLN', datetime.date(2023, 12, 1))
+
+    def test_total_converts_grouped_sums(self):
+        amounts = [(100, 'USD', datetime.date(2024, 1, 5)), (100, 'EUR', datetime.date(2024, 1, 4))]
+        self.assertEqual(fx.convert_many(amounts, 'PLN'), [Decimal('399.05'), Decimal('435.05')])
+        self.assertEqual(fx.sum_amounts(amounts, 'PLN'), Decimal('834.10'))
+        total = fx.total(ExchangeRate.objects.filter(currency__code='USD'), 'EUR', amount_field='rate',
+                         date_field='date')
+        self.assertEqual(total, Decimal('2.00'))
+
+
+class CurrencyForm(forms.Form):
+    currency = DictChoiceField(queryset=Currency.objects.all())
+
+
+class DictCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.eur = Currency.objects.create(code='eur', name='Euro', default=True)
+        cls.usd = Currency.objects.create(code='USD', name='US Dollar')
+
+    def test_lookups_are_built_once(self):
+        by_id = Currency.get_by_id()
+        with self.assertNumQueries(0):
+            self.assertIs(Currency.get_by_id(), by_id)
+            self.assertEqual(Currency.get_by_code()['EUR'], self.eur)
+            self.assertEqual(Currency.get_default(), self.eur)
+            self.assertEqual(Currency.get_choices(), [(self.eur.pk, 'Euro (EUR)'), (self.usd.pk, 'US Dollar (USD)')])
+
+    def test_writes_rebuild_the_table(self):
+        Currency.get_all()
+        pln = Currency.objects.create(code='PLN', name='Polish Zloty', default=True)
+        self.assertEqual(Currency.get_default(), pln)
+        self.assertEqual(list(Currency.get_by_code()), ['EUR', 'PLN', 'USD'])
+        pln.delete()
+        self.assertNotIn('PLN', Currency.get_by_code())
+
+    def test_writes_of_other_processes_are_seen_after_recheck(self):
+        Currency.get_all()
+        # Another process renames the currency, only the shared generation changes here
+        Currency.objects.filter(pk=self.usd.pk).update(name='Dollar')
+        cache.bump_generation(cache.get_model_namespace(Currency))
+        self.assertEqual(Currency.get_by_id()[self.usd.pk].name, 'US Dollar')
+        with mock.patch('common.cache.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(Currency.get_by_id()[self.usd.pk].name, 'Dollar')
+
+    def test_choice_field(self):
+        Currency.get_all()
+        with self.assertNumQueries(0):
+            form = CurrencyForm({'currency': str(self.usd.pk)})
+            self.assertIn(f'<option value="{self.usd.pk}" selected>US Dollar (USD)</option>', str(form['currency']))
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['currency'], self.usd)
+        self.assertEqual(len(form.fields['currency'].choices), 3)
+
+    def test_choice_field_rejects_unknown_ids(self):
+        for value in ['0', 'x', '']:
+            form = CurrencyForm({'currency': value})
+            self.assertFalse(form.is_valid())
+            self.assertIn('currency', form.errors)
+
+
+class DimensionTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Dimension.objects.create(name='Department')
+        cls.it = Dimension.objects.create(name='IT', parent=cls.department)
+        cls.development = Dimension.objects.create(name='Development', parent=cls.it)
+        cls.region = Dimension.objects.create(name='Region')
+
+    def tree(self):
+        return {dimension.name: (dimension.path, dimension.depth, dimension.root_id) for dimension in Dimension.objects.all()}
+
+    def test_paths(self):
+        department, it, development = self.department.pk, self.it.pk, self.development.pk
+        self.assertEqual(self.tree()['Development'], (f'{department}/{it}/{development}/', 2, department))
+        self.assertEqual(list(self.development.get_ancestors()), [self.department, self.it])
+        self.assertEqual(set(self.department.get_descendants()), {self.it, self.development})
+        self.assertEqual(self.development.get_top_level_dimension(), self.department)
+
+    def test_moving_a_subtree(self):
+        self.it.parent = self.region
+        self.it.save()
+        region, it, development = self.region.pk, self.it.pk, self.development.pk
+        tree = self.tree()
+        self.assertEqual(tree['IT'], (f'{region}/{it}/', 1, region))
+        self.assertEqual(tree['Development'], (f'{region}/{it}/{development}/', 2, region))
+        self.assertEqual(list(self.department.get_descendants()), [])
+
+        # Back to the top level
+        self.it.parent = None
+        self.it.save()
+        self.assertEqual(self.tree()['Development'], (f'{it}/{development}/', 1, it))
+
+    def test_cycles_are_rejected(self):
+        for parent in [self.development, self.department]:
+            self.department.parent = parent
+            with self.assertRaises(ValidationError):
+                self.department.full_clean()
+            with self.assertRaises(ValidationError):
+                self.department.save()
+        self.assertEqual(Dimension.objects.get(pk=self.department.pk).parent_id, None)
+
+    def test_top_level_without_stored_root(self):
+        Dimension.objects.update(root=None)
+        self.assertEqual(Dimension.objects.get(pk=self.development.pk).get_top_level_dimension(), self.department)
+        self.assertEqual(Dimension.objects.get(pk=self.region.pk).get_top_level_dimension(), self.region)
+
+    def test_paths_must_fit(self):
+        # Below Region, the path of Development grows by the path of Region
+        limit = len(self.development.path) + len(self.region.path) - 1
+        with mock.patch.object(Dimension, 'MAX_PATH_LENGTH', limit):
+            self.department.parent = self.region
+            with self.assertRaises(ValidationError):
+                self.department.save()
+            Dimension.objects.filter(pk=self.department.pk).update(parent=self.region)
+            with self.assertRaises(ValidationError):
+                Dimension.rebuild_paths()
+        self.assertEqual(Dimension.objects.get(pk=self.development.pk).path, self.development.path)
+
+    def test_unsaved_dimension_has_no_descendants(self):
+        self.assertEqual(list(Dimension(name='New').get_descendants(include_self=True)), [])
+
+    def test_rebuild_paths(self):
+        tree = self.tree()
+        Dimension.objects.update(path='', depth=0, root=None)
+        self.assertEqual(Dimension.rebuild_paths(), 4)
+        self.assertEqual(self.tree(), tree)
+        self.assertEqual(Dimension.rebuild_paths(), 0)
+        Dimension.objects.filter(pk=self.department.pk).update(parent=self.development)
+        with self.assertRaises(ValidationError):
+            Dimension.rebuild_paths()
@@ -0,0 +1,69 @@
+from collections import defaultdict, namedtuple
+
+from common import cache
+
+DIMENSION_MODEL = 'dicts.Dimension'
+BLANK_CHOICE = (None, '---------')
+
+DimensionNode = namedtuple('DimensionNode', ['id', 'name', 'parent_id'])
+
+
+class DimensionTree:
+    """
+    In-memory view of the whole Dimension table, built from a single query.
+    """
+    def __init__(self, rows):
+        self.nodes = {row[0]: DimensionNode(*row) for row in rows}
+        self.children = defaultdict(list)
+        for node in self.nodes.values():
+            self.children[node.parent_id].append(node)
+        for siblings in self.children.values():
+            siblings.sort(key=lambda node: node.name)
+
+    @classmethod
+    def load(cls):
+        from .models import Dimension
+        return cls(Dimension.objects.order_by().values_list('id', 'name', 'parent_id'))
+
+    def top_level(self):
+        return list(self.children[None])
+
+    def get_root_id(self, dimension_id):
+        node = self.nodes[dimension_id]
+        while node.parent_id is not None:
+            node = self.nodes[node.parent_id]
+        return node.id
+
+    def walk(self, parent_id=None, level=0):
+        """
+        Yield (node, level) pairs below parent_id in parent-child, name sorted order.
+        """
+        for child in self.children[parent_id]:
+            yield child, level
+            yield from self.walk(child.id, level + 1)
+
+    def get_indented_choices(self, parent_id):
+        """
+        Choices for every descendant of parent_id, indented by level, with a blank choice at the top.
+        """
+        return [BLANK_CHOICE] + [(node.id, f"{'- ' * level}{node.name}") for node, level in self.walk(parent_id)]
+
+    def get_all_indented_choices(self):
+        return [(node.id, f"{'- ' * level}{node.name}") for node, level in self.walk()]
+
+
+def bump_version():
+    """
+    Invalidate the cached tree in every process sharing the cache backend.
+    """
+    cache.bump_model_generation(DIMENSION_MODEL)
+
+
+_tree_cache = cache.GenerationCache(DimensionTree.load, depends_on=[DIMENSION_MODEL])
+
+
+def get_dimension_tree():
+    """
+    Return the process-wide DimensionTree, rebuilding it only when a dimension changed.
+    """
+    return _tree_cache.get()
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EmployeesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'employees'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_save
+        from .models import sync_user_employee
+        post_save.connect(sync_user_employee, sender=User, dispatch_uid='employees.sync_user_employee')
@@ -0,0 +1,100 @@
+"""
+Background refresh of employee avatars from Microsoft Graph.
+
+The SSO callback reads the photo metadata together with the profile and only schedules
+a refresh; the photo itself is downloaded on a small thread pool, so a slow Graph response
+never delays the login redirect.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from sso import graph
+from .models import Employee
+
+logger = logging.getLogger('workify.avatars')
+
+_lock = threading.Lock()
+_executor = None
+_pending = set()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'AVATAR_REFRESH_WORKERS', 2),
+                                           thread_name_prefix='avatar-refresh')
+        return _executor
+
+
+def is_refresh_due(employee):
+    if employee.avatar_checked_at is None:
+        return True
+    interval = timedelta(seconds=getattr(settings, 'AVATAR_REFRESH_INTERVAL', 24 * 60 * 60))
+    return employee.avatar_checked_at + interval <= timezone.now()
+
+
+def is_unchanged(employee, photo_metadata):
+    if photo_metadata is None:
+        return False
+    if not photo_metadata:
+        # No photo in the directory, the current avatar is kept
+        return True
+    etag = photo_metadata.get('@odata.mediaEtag', '')
+    return bool(etag) and etag == employee.avatar_etag and bool(employee.avatar)
+
+
+def schedule_refresh(employee, access_token, photo_metadata=None):
+    """
+    Queue an avatar refresh for employee unless it was checked recently or one is already queued.
+    photo_metadata, when already fetched by the caller, saves the worker a Graph call and skips
+    the refresh entirely for an unchanged photo. Returns the future, or None when nothing was scheduled.
+    """
+    if not is_refresh_due(employee):
+        return None
+    if is_unchanged(employee, photo_metadata):
+        Employee.objects.filter(pk=employee.pk).update(avatar_checked_at=timezone.now())
+        return None
+    with _lock:
+        if employee.pk in _pending:
+            return None
+        _pending.add(employee.pk)
+    try:
+        return get_executor().submit(_run_refresh, employee.pk, access_token, photo_metadata)
+    except RuntimeError:
+        # The pool is shut down while the process exits
+        _pending.discard(employee.pk)
+        return None
+
+
+def _run_refresh(employee_pk, access_token, photo_metadata):
+    close_old_connections()
+    try:
+        refresh_avatar(employee_pk, access_token, photo_metadata)
+    except Exception:
+        logger.exception('Avatar refresh failed for employee %s', employee_pk)
+    finally:
+        with _lock:
+            _pending.discard(employee_pk)
+        close_old_connections()
+
+
+def refresh_avatar(employee_pk, access_token, photo_metadata=None):
+    """
+    Compare the Graph photo ETag with the stored one and download the photo only when it changed.
+    """
+    employee = Employee.objects.get(pk=employee_pk)
+    client = graph.get_client()
+    if photo_metadata is None:
+        photo_metadata = client.get_photo_metadata(access_token)
+    if is_unchanged(employee, photo_metadata):
+        Employee.objects.filter(pk=employee_pk).update(avatar_checked_at=timezone.now())
+        return
+    photo = client.get_photo(access_token)
+    employee.sso_update_avatar(photo, etag=photo_metadata.get('@odata.mediaEtag', ''))
@@ -1,4 +1,3 @@
-from django.db.models import Q
 from django import forms
 from django.utils.html import format_html
 from .models import Employee, EmployeeDocument, EmployeeRate
@@ -9,6 +8,7 @@ from crispy_forms.bootstrap import FormActions
 from django.utils.text import slugify
 
 from dicts import models as dicts
+from dicts.forms import DictChoiceField
 
 class EmployeeBaseForm(forms.Form):
     email = forms.EmailField()
@@ -102,6 +102,7 @@ class EmployeeDocumentForm(forms.ModelForm):
     class Meta:
         model = EmployeeDocument
         fields = ['name', 'sign_date', 'file', 'document_type', 'reference_document', 'comment']
+        field_classes = {'document_type': DictChoiceField}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -146,6 +147,7 @@ class EmployeeRateForm(forms.ModelForm):
     class Meta:
         model = EmployeeRate
         fields = ['rate_type', 'chargable_rate', 'basic_rate', 'currency', 'valid_from', 'valid_to', 'reference_document', 'comment']
+        field_classes = {'currency': DictChoiceField}
         widgets = {
             'valid_from': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
             'valid_to': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
@@ -183,38 +185,15 @@ class EmployeeRateForm(forms.ModelForm):
         cleaned_data = super().clean()
         valid_from = cleaned_data.get("valid_from")
         valid_to = cleaned_data.get("valid_to")
-        if hasattr(self.instance, 'employee'):
-            employee = self.instance.employee
-        if self.initial.get('employee'):
-            employee = self.initial['employee']
-        
+        if valid_from is None:
+            return cleaned_data
+
         # Ensure valid_from is not later than valid_to
         if valid_to and valid_from > valid_to:
             raise forms.ValidationError("The 'valid from' date cannot be later than the 'valid to' date.")
-        
-        # check for overlapping rates for rate with undefined valid to date
-        if valid_to is None:
-            overlapping_rates = EmployeeRate.objects.filter(
-                employee=employee
-            ).exclude(
-                pk=self.instance.pk  # Exclude current instance if updating
-            ).filter(
-                Q(valid_to__isnull=True) |  # Another indefinite rate
-                Q(valid_to__gte=valid_from)  # Overlaps with any rate that starts before or at the same time
-            )
-
-        # Case 2: If `valid_to` has a date
-        if valid_to:
-            overlapping_rates = EmployeeRate.objects.filter(
-                employee=employee
-            ).exclude(
-                pk=self.instance.pk  # Exclude current instance if updating
-            ).filter(
-                Q(valid_from__lte=valid_to) & Q(valid_from__gte=valid_from) |  # Overlaps with existing rate range
-                Q(valid_to__gte=valid_from) & Q(valid_to__lte=valid_to) |  # Overlaps with existing rate range
-                Q(valid_to__isnull=True) & Q(valid_from__lte=valid_to)  # Overlaps with an indefinite rate
-            )
 
+        # One query for both open-ended and closed intervals, the current instance excluded when updating
+        overlapping_rates = EmployeeRate.objects.overlapping(self.employee, valid_from, valid_to).exclude(pk=self.instance.pk)
         if overlapping_rates.exists():
             raise forms.ValidationError("There is an overlap with an existing rate for the selected dates.")
         
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0013_rename_document_file_employeedocument_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='avatar_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='avatar_etag',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
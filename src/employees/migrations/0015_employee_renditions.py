@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0014_employee_avatar_etag_checked_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
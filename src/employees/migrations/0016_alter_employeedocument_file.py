@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:06
+
+import common.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0015_employee_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employeedocument',
+            name='file',
+            field=models.FileField(max_length=255, storage=common.storage.get_blob_storage, upload_to='EmployeeDocuments/'),
+        ),
+    ]
@@ -7,19 +7,32 @@ from django.utils.html import format_html
 from django.shortcuts import redirect
 from django.db import models
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.core.files.base import ContentFile
 from PIL import Image
 from utils.unique_slugify import unique_slugify
-from common.models import TrackableModel
+from common.models import ImageRenditionsModel, SearchKeyModel, TrackableModel
+from common.storage import get_blob_storage
 from dicts import models as dicts
 
 
-class Employee(TrackableModel):    
+class EmployeeQuerySet(models.QuerySet):
+    def for_list(self):
+        return self.select_related('user')
+
+
+class Employee(TrackableModel, ImageRenditionsModel, SearchKeyModel):    
     slug = models.SlugField(max_length=100, unique=True)
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
     tax_id = models.CharField(max_length=20, blank=True, null=True)
     avatar = models.ImageField(upload_to='EmployeeAvatar/', blank=True)
     avatar_checksum = models.CharField(blank=True, max_length=50)
+    avatar_etag = models.CharField(blank=True, max_length=100, editable=False)
+    avatar_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = EmployeeQuerySet.as_manager()
+
+    rendition_source_field = 'avatar'
 
     class Meta:
         permissions = [
@@ -73,20 +86,23 @@ class Employee(TrackableModel):
             return {'text': str(self), 'url': self.get_absolute_url(), 'badge': 'Archived'}
         return {'text': str(self), 'url': self.get_absolute_url()}
 
-    def sso_update_avatar(self, avatar_content):
-        if not avatar_content:
-            return        
-        avatar_content_checksum = hashlib.md5(avatar_content).hexdigest()
-        if self.avatar_checksum != avatar_content_checksum:
-            resized_avatar = Image.open(ContentFile(avatar_content)).resize((256, 256), Image.LANCZOS)
-            avatar_bytes = BytesIO()
-            resized_avatar.save(avatar_bytes, format='PNG')
-            avatar_bytes.seek(0)
-            # Save the BytesIO object to the avatar field
-            self.avatar.save('avatar_' + str(self.user.id) + '.png', ContentFile(avatar_bytes.read()))
-            self.avatar_checksum = avatar_content_checksum
-            self.save()
-        return
+    def sso_update_avatar(self, avatar_content, etag=''):
+        self.avatar_etag = etag
+        self.avatar_checked_at = timezone.now()
+        update_fields = ['avatar_etag', 'avatar_checked_at']
+        if avatar_content:
+            avatar_content_checksum = hashlib.md5(avatar_content).hexdigest()
+            if self.avatar_checksum != avatar_content_checksum:
+                resized_avatar = Image.open(ContentFile(avatar_content)).resize((256, 256), Image.LANCZOS)
+                avatar_bytes = BytesIO()
+                resized_avatar.save(avatar_bytes, format='PNG')
+                avatar_bytes.seek(0)
+                # Save the BytesIO object to the avatar field
+                self.avatar.save('avatar_' + str(self.user_id) + '.png', ContentFile(avatar_bytes.read()), save=False)
+                self.avatar_checksum = avatar_content_checksum
+                update_fields += ['avatar', 'avatar_checksum']
+        # Only the avatar columns, the refresh runs in the background next to regular edits
+        self.save(update_fields=update_fields)
     
     def set_groups(self, groups, current_user):
         self.user.groups.clear()
@@ -124,6 +140,16 @@ class Employee(TrackableModel):
         self.save(current_user=current_user)
         return
 
+    search_permission = 'employees.can_view_employee_list'
+    search_select_related = ('user',)
+
+    def get_search_document(self):
+        return {'title': self.user.get_full_name() or self.user.username, 'body': self.user.email}
+
+    def get_search_key_parts(self):
+        # Last name first, the order of the employee lists
+        return [self.user.last_name, self.user.first_name]
+
     def get_absolute_url(self): return reverse('employees:employee-detail', kwargs={'slug': self.slug})
     def get_update_url(self):   return reverse('employees:employee-update', kwargs={'slug': self.slug})
     def get_deactivate_url(self): return reverse('employees:employee-deactivate', kwargs={'slug': self.slug})
@@ -136,6 +162,24 @@ class Employee(TrackableModel):
     def get_new_rate_url(self): return reverse('employees:employee-rate-create', kwargs={'slug': self.slug})
 
 
+# User fields copied into Employee.search_key and its search document
+USER_SEARCH_FIELDS = {'first_name', 'last_name', 'email', 'username'}
+
+
+def sync_user_employee(sender, instance, update_fields=None, raw=False, **kwargs):
+    """
+    post_save receiver of User: refresh search_key and the search document of the user's employee,
+    the SSO login and the admin save the user on its own.
+    """
+    if raw or (update_fields is not None and not USER_SEARCH_FIELDS.intersection(update_fields)):
+        return
+    employee = Employee.objects.filter(user=instance).first()
+    if employee is None:
+        return
+    employee.user = instance
+    employee.save(update_fields=['search_key'])
+
+
 # class EmployeeDocumentTypes(models.TextChoices):
 #     CONTRACT = 'contract', 'Contract'
 #     AMENDMENT = 'amendment', 'Amendment'
@@ -146,7 +190,7 @@ class EmployeeDocument(TrackableModel):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     sign_date = models.DateField()
-    file = models.FileField(upload_to='EmployeeDocuments/')
+    file = models.FileField(upload_to='EmployeeDocuments/', max_length=255, storage=get_blob_storage)
     document_type = models.ForeignKey(dicts.EmployeeDocumentTypes, on_delete=models.PROTECT)
     # document_type = models.CharField(max_length=20, choices=EmployeeDocumentTypes.choices)
     reference_document = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True)
@@ -191,11 +235,25 @@ class BaseEmployeeRate(TrackableModel):
     def get_update_url(self):   return reverse('employees:employee-rate-update', kwargs={'slug': self.employee.slug, 'pk': self.pk})
     def get_delete_url(self):   return reverse('employees:employee-rate-delete', kwargs={'slug': self.employee.slug, 'pk': self.pk})
 
+class EmployeeRateQuerySet(models.QuerySet):
+    def overlapping(self, employee, valid_from, valid_to=None):
+        """
+        Rates of employee whose interval shares at least one day with valid_from - valid_to,
+        an open end (valid_to None) lasting forever.
+        """
+        rates = self.filter(employee=employee).filter(models.Q(valid_to__isnull=True) | models.Q(valid_to__gte=valid_from))
+        if valid_to is not None:
+            rates = rates.filter(valid_from__lte=valid_to)
+        return rates
+
+
 class EmployeeRate(BaseEmployeeRate):
     rate_type = models.CharField(max_length=20, choices=EmployeeRateTypes.choices)
     chargable_rate = models.DecimalField(max_digits=10, decimal_places=2)
     basic_rate = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = EmployeeRateQuerySet.as_manager()
+
     def __str__(self):
         if self.chargable_rate == self.basic_rate:
             rate = f"{self.chargable_rate} {self.currency}"   
@@ -0,0 +1,78 @@
+"""
+Effective employee rates by date.
+
+A RateResolver loads the rate intervals of a set of employees with one query and answers "the rate
+of employee X on day D" by bisecting the sorted interval starts, O(log n) per lookup. Rate intervals
+of one employee do not overlap (EmployeeRateForm rejects overlaps). Resolvers are cached per set of
+employees until an EmployeeRate is written.
+"""
+import bisect
+import hashlib
+from collections import defaultdict, namedtuple
+
+from common import cache
+
+EMPLOYEE_RATE_MODEL = 'employees.EmployeeRate'
+
+RateInterval = namedtuple('RateInterval', ['id', 'employee_id', 'rate_type', 'chargable_rate', 'basic_rate',
+                                           'currency_id', 'valid_from', 'valid_to'])
+
+
+class RateResolver:
+    """
+    Rate intervals by employee id, as parallel lists sorted by valid_from.
+    """
+    def __init__(self, rows):
+        self.starts = defaultdict(list)
+        self.intervals = defaultdict(list)
+        for row in rows:
+            interval = RateInterval(*row)
+            self.starts[interval.employee_id].append(interval.valid_from)
+            self.intervals[interval.employee_id].append(interval)
+
+    @classmethod
+    def load(cls, employee_ids=None):
+        from .models import EmployeeRate
+        rates = EmployeeRate.objects.all()
+        if employee_ids is not None:
+            rates = rates.filter(employee_id__in=employee_ids)
+        return cls(rates.order_by('employee_id', 'valid_from').values_list(*RateInterval._fields))
+
+    def get(self, employee_id, on):
+        """
+        RateInterval of employee_id valid on the day, or None.
+        """
+        index = bisect.bisect_right(self.starts.get(employee_id, []), on)
+        if not index:
+            return None
+        interval = self.intervals[employee_id][index - 1]
+        if interval.valid_to is not None and interval.valid_to < on:
+            return None
+        return interval
+
+    def get_many(self, pairs):
+        """
+        RateInterval (or None) of every (employee id, day) pair, in order.
+        """
+        return [self.get(employee_id, on) for employee_id, on in pairs]
+
+
+def get_rate_resolver(employee_ids=None):
+    """
+    RateResolver of the employees, of every employee when employee_ids is None.
+    """
+    if employee_ids is None:
+        key = 'all'
+    else:
+        employee_ids = sorted(set(employee_ids))
+        key = hashlib.md5(','.join(map(str, employee_ids)).encode()).hexdigest()
+    return cache.get_or_set('employee-rates', [key], lambda: RateResolver.load(employee_ids),
+                            depends_on=[EMPLOYEE_RATE_MODEL])
+
+
+def resolve(pairs):
+    """
+    RateInterval (or None) of every (employee id, day) pair, loading the rates of those employees once.
+    """
+    pairs = list(pairs)
+    return get_rate_resolver(employee_id for employee_id, on in pairs).get_many(pairs)
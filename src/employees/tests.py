@@ -1,3 +1,56 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from common.testing import ListQueryCountMixin
+from dicts.models import Currency
+from . import rates
+from .models import Employee, EmployeeRate
+
+
+class ListQueryCountTests(ListQueryCountMixin, TestCase):
+    def add_employees(self, count):
+        for _ in range(count):
+            number = User.objects.count()
+            user = User.objects.create_user(f'user{number}@example.com', f'user{number}@example.com',
+                                            first_name='Test', last_name=f'User {number}')
+            Employee.objects.create(user=user, slug=f'user-{number}')
+
+    def test_employee_list(self):
+        self.assertConstantQueries(Employee.list_active_employees_url(), self.add_employees)
+
+
+class EmployeeRateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code='EUR', name='Euro', default=True)
+        user = User.objects.create_user('user@example.com', 'user@example.com', first_name='Test', last_name='User')
+        cls.employee = Employee.objects.create(user=user, slug='user')
+        for valid_from, valid_to, rate in [(date(2024, 1, 1), date(2024, 3, 31), 100),
+                                           (date(2024, 5, 1), None, 120)]:
+            EmployeeRate.objects.create(employee=cls.employee, currency=cls.currency, rate_type='hourly',
+                                        valid_from=valid_from, valid_to=valid_to, chargable_rate=rate, basic_rate=rate)
+
+    def test_batch_lookup_uses_one_query(self):
+        days = [date(2023, 12, 31), date(2024, 1, 1), date(2024, 3, 31), date(2024, 4, 15), date(2030, 1, 1)]
+        with CaptureQueriesContext(connection) as context:
+            intervals = rates.resolve([(self.employee.pk, day) for day in days])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual([interval and interval.chargable_rate for interval in intervals], [None, 100, 100, None, 120])
+
+    def test_resolver_is_invalidated_by_writes(self):
+        rates.get_rate_resolver([self.employee.pk])
+        EmployeeRate.objects.create(employee=self.employee, currency=self.currency, rate_type='hourly',
+                                    valid_from=date(2024, 4, 1), valid_to=date(2024, 4, 30), chargable_rate=110, basic_rate=110)
+        self.assertEqual(rates.get_rate_resolver([self.employee.pk]).get(self.employee.pk, date(2024, 4, 15)).chargable_rate, 110)
 
-# Create your tests here.
+    def test_overlapping(self):
+        overlapping = EmployeeRate.objects.overlapping
+        self.assertFalse(overlapping(self.employee, date(2024, 4, 1), date(2024, 4, 30)).exists())
+        # A new interval inside an existing one overlaps as well
+        self.assertTrue(overlapping(self.employee, date(2024, 2, 1), date(2024, 2, 29)).exists())
+        self.assertTrue(overlapping(self.employee, date(2024, 4, 1), None).exists())
+        self.assertEqual(overlapping(self.employee, date(2023, 1, 1), date(2023, 12, 31)).count(), 0)
@@ -13,14 +13,24 @@ from employees.models import Employee, EmployeeDocument, EmployeeRate
 from employees.permissions import employee_detail_permission
 from employees.forms import EmployeeCreateForm, EmployeeUpdateForm, EmployeeDocumentForm, EmployeeRateForm
 from employees.mixins import EmployeeStatusMixin
-from common.mixins import BreadcrumbsAndButtonsMixin, ObjectToggle, FileViewMixin
+from common.mixins import BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, ObjectToggle, FileViewMixin
 # from common.helpers import Breadcrumbs, Button
+from common.autocomplete import SearchKeyAutocomplete
 from common.helpers import Buttons as Btn
 
-class EmployeeList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.ListView):
+class EmployeeList(BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, PermissionRequiredMixin, generic.ListView):
     permission_required = 'employees.can_view_employee_list'
     model = Employee
     context_object_name = 'employees'
+    rows_template_name = 'employees/employee_list_rows.html'
+    sort_fields = {'name': 'user__last_name', 'email': 'user__email'}
+    default_sort = 'name'
+    export_fields = [
+        ('First name', 'user__first_name'),
+        ('Last name', 'user__last_name'),
+        ('Email', 'user__email'),
+        ('Active', 'user__is_active'),
+    ]
 
     def set_breadcrumbs(self):
         self.breadcrumbs.add(**Employee.get_cls_breadcrumb())
@@ -33,18 +43,18 @@ class EmployeeList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.
             self.top_buttons.append(Btn.Link('Only active', Employee.list_active_employees_url(), css_class= 'outline-primary', icon='eye-off'))
         if self.request.user.has_perm('employees.add_employee'):
             self.top_buttons.append(Btn.Link('Add employee', Employee.get_create_url(), css_class= 'outline-success', icon='plus'))
+        self.top_buttons.extend(self.get_export_buttons())
 
     def get_queryset(self):
         if self.kwargs.get('all', False) and self.request.user.has_perm('employees.can_view_archived_employees'):
-            return self.model.objects.all()
-        return self.model.objects.filter(user__is_active=True)
+            return self.model.objects.for_list()
+        return self.model.objects.for_list().filter(user__is_active=True)
+
+class EmployeeAutocomplete(SearchKeyAutocomplete):
+    model = Employee
 
-class EmployeeAutocomplete(LoginRequiredMixin, autocomplete.Select2QuerySetView):
     def get_queryset(self):
-        qs = Employee.objects.all().filter(user__is_active=True).order_by('user__last_name')
-        if self.q:
-            qs = qs.filter(models.Q(user__first_name__icontains=self.q) | models.Q(user__last_name__icontains=self.q))
-        return qs
+        return Employee.objects.filter(user__is_active=True).select_related('user')
 
 class EmployeeDetail(BreadcrumbsAndButtonsMixin, UserPassesTestMixin, generic.DetailView):
     model = Employee
@@ -5,13 +5,20 @@ from django.urls import reverse, reverse_lazy
 from django.utils.text import slugify
 
 from utils.unique_slugify import unique_slugify
-from common.models import TrackableModel  
+from common.models import SearchKeyModel, TrackableModel
 
 from employees.models import Employee  
 from clients.models import Client  
 from budgets.models import Budget
 
-class Project(TrackableModel):
+class ProjectQuerySet(models.QuerySet):
+    def for_list(self):
+        return (self
+                .select_related('owner__user', 'client')
+                .prefetch_related('managers__user', 'team_members__user'))
+
+
+class Project(TrackableModel, SearchKeyModel):
     name = models.CharField(max_length=255, unique=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
@@ -24,6 +31,8 @@ class Project(TrackableModel):
     url = models.URLField(blank=True, null=True)
     client = models.ForeignKey(Client, on_delete=models.SET_NULL, null=True, blank=True, related_name='projects')  # Optional
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
 
@@ -36,6 +45,15 @@ class Project(TrackableModel):
     def __str__(self):
         return self.name
     
+    search_permission = 'projects.view_project'
+    search_select_related = ('client',)
+
+    def get_search_document(self):
+        return {'title': self.name, 'body': self.client.name if self.client else ''}
+
+    def get_search_key_parts(self):
+        return [self.name]
+
     def get_absolute_url(self): return reverse("projects:project-detail", kwargs={"slug": self.slug})
     def get_update_url(self): return reverse("projects:project-update", kwargs={"slug": self.slug})
     def get_deactivate_url(self): return reverse("projects:project-deactivate", kwargs={"slug": self.slug})
@@ -1,3 +1,23 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from clients.models import Client
+from common.testing import ListQueryCountMixin
+from employees.models import Employee
+from .models import Project
+
+
+class ListQueryCountTests(ListQueryCountMixin, TestCase):
+    def add_projects(self, count):
+        for _ in range(count):
+            number = Project.objects.count()
+            user = User.objects.create_user(f'manager{number}@example.com', f'manager{number}@example.com',
+                                            first_name='Project', last_name=f'Manager {number}')
+            manager = Employee.objects.create(user=user, slug=f'manager-{number}')
+            client = Client.objects.create(slug=f'client-{number}', name=f'Client {number}')
+            project = Project.objects.create(name=f'Project {number}', owner=manager, client=client)
+            project.managers.add(manager)
+            project.team_members.add(self.employee)
+
+    def test_project_list(self):
+        self.assertConstantQueries(Project.list_active_projects_url(), self.add_projects)
@@ -5,6 +5,7 @@ app_name = 'projects'
 urlpatterns = [
     path('', views.ProjectList.as_view(), name='project-list', kwargs={'all': False}),
     path('all/', views.ProjectList.as_view(), name='project-list-all', kwargs={'all': True}),
+    path('autocomplete/', views.ProjectAutocomplete.as_view(), name='project-autocomplete'),
     path('new/', views.ProjectCreate.as_view(), name='project-create'),
     path('<slug:slug>/', views.ProjectDetail.as_view(), name='project-detail'),
     path('<slug:slug>/edit', views.ProjectUpdate.as_view(), name='project-update'),
@@ -7,19 +7,33 @@ from django.utils.html import format_html
 from django.utils import timezone
 from django.shortcuts import get_object_or_404, redirect, render
 from django.db import models
+from django.db.models.functions import Concat
 from django.contrib import messages
 from dal import autocomplete
 
 from .models import Project, ProjectBudgetAssignment
 from .forms import ProjectForm, ProjectBudgetAssignmentForm
-from common.mixins import BreadcrumbsAndButtonsMixin
+from common.autocomplete import SearchKeyAutocomplete
+from common.mixins import BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin
 
 from common.helpers import Buttons as Btn
 
 
-class ProjectList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.ListView):
+class ProjectList(BreadcrumbsAndButtonsMixin, ExportMixin, KeysetPaginationMixin, PermissionRequiredMixin, generic.ListView):
     permission_required = 'projects.view_project'
     model = Project
+    rows_template_name = 'projects/project_list_rows.html'
+    sort_fields = {'name': 'name'}
+    default_sort = 'name'
+    export_fields = [
+        ('Name', 'name'),
+        ('Client', 'client__name'),
+        ('Owner', Concat('owner__user__first_name', models.Value(' '), 'owner__user__last_name')),
+        ('Active', 'is_active'),
+        ('Public', 'is_public'),
+        ('Chargeable', 'is_chargeable'),
+        ('URL', 'url'),
+    ]
     # context_object_name = 'projects'
 
     def set_breadcrumbs(self):
@@ -33,13 +47,14 @@ class ProjectList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.L
             self.top_buttons.append(Btn.Link('Only active', Project.list_active_projects_url(), css_class= 'outline-primary', icon='eye-off'))
         if self.request.user.has_perm('projects.add_project'):
             self.top_buttons.append(Btn.Link('Add project', Project.get_create_url(), css_class= 'outline-success', icon='plus'))
+        self.top_buttons.extend(self.get_export_buttons())
 
     def get_queryset(self):
 
         # TODO - depending on the permissions, show all or only public projects and projects current user is assigned to
         if self.kwargs.get('all', False):
-            return self.model.objects.all()
-        return self.model.objects.filter(is_active=True)
+            return self.model.objects.for_list()
+        return self.model.objects.for_list().filter(is_active=True)
     
     
     def get_context_data(self, **kwargs):
@@ -55,6 +70,12 @@ class ProjectList(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, generic.L
         context['projects'] = projects
         return context
 
+class ProjectAutocomplete(SearchKeyAutocomplete):
+    model = Project
+
+    def get_queryset(self):
+        return Project.objects.filter(is_active=True)
+
 class ProjectEditBaseView(BreadcrumbsAndButtonsMixin, PermissionRequiredMixin, SuccessMessageMixin):
     model = Project
     form_class = ProjectForm
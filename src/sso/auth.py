@@ -0,0 +1,59 @@
+"""
+Process-wide MSAL application.
+
+Building a ConfidentialClientApplication runs authority and OpenID discovery over HTTP,
+so the application is created once per process and its discovery responses are kept in
+a shared http_cache. Tokens are not kept: sign-in uses the access token once, to read the
+profile and photo from Microsoft Graph, so the shared application must not collect them.
+"""
+import threading
+
+import msal
+import requests
+from django.conf import settings
+
+SCOPE = ['User.Read']
+
+_lock = threading.Lock()
+_app = None
+http_cache = {}
+# Any object with requests-like get() and post(), tests replace it with a stub
+http_client = requests.Session()
+
+
+class DiscardingTokenCache(msal.TokenCache):
+    """
+    Token cache of the shared application, which drops the tokens of every user signing in.
+    """
+    def add(self, event, **kwargs):
+        pass
+
+
+def _build_app():
+    return msal.ConfidentialClientApplication(
+        settings.MSAL_CLIENT_ID, settings.MSAL_CLIENT_SECRET, settings.MSAL_AUTHORITY,
+        token_cache=DiscardingTokenCache(), http_client=http_client, http_cache=http_cache,
+    )
+
+
+def get_msal_app():
+    global _app
+    with _lock:
+        if _app is None:
+            _app = _build_app()
+        return _app
+
+
+def reset_msal_app():
+    global _app
+    with _lock:
+        _app = None
+        http_cache.clear()
+
+
+def get_authorization_request_url(state, redirect_uri):
+    return get_msal_app().get_authorization_request_url(SCOPE, state=state, redirect_uri=redirect_uri)
+
+
+def acquire_token_by_authorization_code(code, redirect_uri):
+    return get_msal_app().acquire_token_by_authorization_code(code, SCOPE, redirect_uri)
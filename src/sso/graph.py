@@ -0,0 +1,97 @@
+"""
+Small Microsoft Graph client shared by the whole process.
+
+One requests.Session keeps TLS connections to Graph open between logins, every call has
+connect and read timeouts, and idempotent calls are retried a bounded number of times
+with exponential backoff.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_client = None
+
+
+class GraphClient:
+    def __init__(self, base_url=None, timeout=(3.05, 10), retries=3, backoff_factor=0.5, pool_size=10):
+        self.base_url = (base_url or settings.GRAPH_BASE_URL).rstrip('/')
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            # A read timeout means Graph hangs, retrying it would only multiply the wait
+            read=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='graph')
+
+    def get(self, path, access_token, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        headers = {'Authorization': 'Bearer ' + access_token, **kwargs.pop('headers', {})}
+        return self.session.get(self.base_url + path, headers=headers, **kwargs)
+
+    def get_profile(self, access_token):
+        response = self.get('/me', access_token)
+        response.raise_for_status()
+        return response.json()
+
+    def get_photo_metadata(self, access_token):
+        """
+        Photo metadata including '@odata.mediaEtag', or an empty dict when the user has no photo.
+        """
+        response = self.get('/me/photo', access_token)
+        if response.status_code == requests.codes.not_found:
+            return {}
+        response.raise_for_status()
+        return response.json()
+
+    def get_photo(self, access_token):
+        response = self.get('/me/photo/$value', access_token)
+        if response.status_code == requests.codes.not_found:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def get_profile_and_photo_metadata(self, access_token):
+        """
+        Fetch the profile and the photo metadata at the same time. The profile is required, so its
+        errors propagate; photo metadata is only an optimisation and is None when it could not be read.
+        """
+        photo_future = self.executor.submit(self.get_photo_metadata, access_token)
+        profile = self.get_profile(access_token)
+        try:
+            photo_metadata = photo_future.result()
+        except requests.RequestException:
+            photo_metadata = None
+        return profile, photo_metadata
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = GraphClient()
+        return _client
+
+
+def set_client(client):
+    """
+    Replace the shared client, e.g. with one pointing to a local fake server in tests.
+    """
+    global _client
+    with _lock:
+        _client = client
@@ -1,3 +1,224 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import msal
+import requests
+
+from django.test import TestCase, override_settings
+
+from . import auth, graph
+
+AUTHORITY = 'https://login.stub.test/tenant-id'
+CLIENT_ID = 'client-id'
+
+
+class StubResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+def encode_segment(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b'=').decode()
+
+
+class StubAuthority:
+    """
+    Answers MSAL's discovery and token requests without leaving the process.
+    """
+    def __init__(self):
+        self.requests = []
+        self.token_number = 0
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.requests.append(('GET', url))
+        if urlsplit(url).path.endswith('/common/discovery/instance'):
+            return StubResponse({
+                'tenant_discovery_endpoint': f'{AUTHORITY}/v2.0/.well-known/openid-configuration',
+                'metadata': [{'preferred_network': 'login.stub.test', 'aliases': ['login.stub.test']}],
+            })
+        if url.endswith('/.well-known/openid-configuration'):
+            return StubResponse({
+                'authorization_endpoint': f'{AUTHORITY}/oauth2/v2.0/authorize',
+                'token_endpoint': f'{AUTHORITY}/oauth2/v2.0/token',
+                'issuer': f'{AUTHORITY}/v2.0',
+            })
+        return StubResponse({'error': 'not_found'}, status_code=404)
+
+    def post(self, url, params=None, data=None, headers=None, **kwargs):
+        self.requests.append(('POST', url))
+        self.token_number += 1
+        now = int(time.time())
+        id_token = '.'.join([
+            encode_segment({'alg': 'none', 'typ': 'JWT'}),
+            encode_segment({'iss': f'{AUTHORITY}/v2.0', 'aud': CLIENT_ID, 'sub': 'subject', 'oid': 'object-id',
+                            'tid': 'tenant-id', 'preferred_username': 'user@example.com', 'iat': now, 'exp': now + 3600}),
+            '',
+        ])
+        return StubResponse({
+            'token_type': 'Bearer',
+            'scope': ' '.join(auth.SCOPE),
+            'expires_in': 3600,
+            'access_token': f'access-token-{self.token_number}',
+            'refresh_token': 'refresh-token',
+            'id_token': id_token,
+            'client_info': encode_segment({'uid': 'object-id', 'utid': 'tenant-id'}),
+        })
+
+    def count(self, method, suffix):
+        return sum(1 for request_method, url in self.requests if request_method == method and url.endswith(suffix))
+
+
+@override_settings(MSAL_AUTHORITY=AUTHORITY, MSAL_CLIENT_ID=CLIENT_ID)
+class MsalAppTests(TestCase):
+    def setUp(self):
+        self.authority = StubAuthority()
+        patcher = mock.patch.object(auth, 'http_client', self.authority)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth.reset_msal_app()
+        self.addCleanup(auth.reset_msal_app)
+
+    def test_app_is_shared_and_discovery_runs_once(self):
+        self.assertIs(auth.get_msal_app(), auth.get_msal_app())
+        auth.get_authorization_request_url('state', 'http://testserver/account/callback/')
+        auth.acquire_token_by_authorization_code('code', 'http://testserver/account/callback/')
+        auth.acquire_token_by_authorization_code('code', 'http://testserver/account/callback/')
+        self.assertEqual(self.authority.count('GET', '/.well-known/openid-configuration'), 1)
+
+    def test_authorization_url_points_to_configured_authority(self):
+        url = auth.get_authorization_request_url('state', 'http://testserver/account/callback/')
+        self.assertTrue(url.startswith(f'{AUTHORITY}/oauth2/v2.0/authorize'))
+        self.assertIn('state=state', url)
+
+    def test_tokens_are_not_kept(self):
+        token = auth.acquire_token_by_authorization_code('code', 'http://testserver/account/callback/')
+        self.assertEqual(token['access_token'], 'access-token-1')
+        self.assertEqual(token['id_token_claims']['preferred_username'], 'user@example.com')
+        self.assertEqual(auth.get_msal_app().get_accounts(), [])
+        self.assertEqual(auth.get_msal_app().token_cache.find(msal.TokenCache.CredentialType.REFRESH_TOKEN), [])
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    photo = b'\x89PNG fake photo'
+
+    def do_GET(self):
+        server = self.server
+        server.paths.append(self.path)
+        if self.headers.get('Authorization') != 'Bearer token':
+            return self.send_json({'error': 'unauthorized'}, status=401)
+        if self.path == '/me':
+            time.sleep(server.delay)
+            return self.send_json({'userPrincipalName': 'user@example.com', 'givenName': 'Jane', 'surname': 'Doe'})
+        if self.path == '/me/photo':
+            time.sleep(server.delay)
+            if not server.has_photo:
+                return self.send_json({'error': 'not_found'}, status=404)
+            return self.send_json({'@odata.mediaEtag': 'W/"etag-1"', 'width': 96, 'height': 96})
+        if self.path == '/me/photo/$value':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(self.photo)))
+            self.end_headers()
+            self.wfile.write(self.photo)
+            return
+        if self.path == '/flaky':
+            server.flaky_failures -= 1
+            if server.flaky_failures >= 0:
+                return self.send_json({'error': 'unavailable'}, status=503)
+            return self.send_json({'ok': True})
+        if self.path == '/slow':
+            time.sleep(1)
+            return self.send_json({'ok': True})
+        return self.send_json({'error': 'not_found'}, status=404)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out waiting for a delayed response and closed the connection
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GraphClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGraphHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.paths = []
+        self.server.delay = 0
+        self.server.has_photo = True
+        self.server.flaky_failures = 0
+        self.client = graph.GraphClient(base_url=self.base_url, timeout=(1, 0.5), retries=2, backoff_factor=0)
+
+    def test_profile_and_photo_metadata_are_fetched_concurrently(self):
+        self.server.delay = 0.3
+        start = time.perf_counter()
+        profile, photo_metadata = self.client.get_profile_and_photo_metadata('token')
+        elapsed = time.perf_counter() - start
+        self.assertEqual(profile['givenName'], 'Jane')
+        self.assertEqual(photo_metadata['@odata.mediaEtag'], 'W/"etag-1"')
+        self.assertLess(elapsed, 0.55)
+
+    def test_missing_photo(self):
+        self.server.has_photo = False
+        self.assertEqual(self.client.get_photo_metadata('token'), {})
+
+    def test_photo_content(self):
+        self.assertEqual(self.client.get_photo('token'), FakeGraphHandler.photo)
+
+    def test_server_errors_are_retried(self):
+        self.server.flaky_failures = 2
+        response = self.client.get('/flaky', 'token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.paths.count('/flaky'), 3)
+
+    def test_retries_are_bounded(self):
+        self.server.flaky_failures = 10
+        response = self.client.get('/flaky', 'token')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.paths.count('/flaky'), 3)
+
+    def test_hung_call_times_out(self):
+        start = time.perf_counter()
+        with self.assertRaises(requests.RequestException):
+            self.client.get('/slow', 'token')
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(self.server.paths.count('/slow'), 1)
+
+    def test_failed_photo_metadata_does_not_block_login(self):
+        with mock.patch.object(self.client, 'get_photo_metadata', side_effect=requests.ConnectionError):
+            profile, photo_metadata = self.client.get_profile_and_photo_metadata('token')
+        self.assertEqual(profile['givenName'], 'Jane')
+        self.assertIsNone(photo_metadata)
@@ -1,5 +1,4 @@
 import uuid
-import msal
 import requests
 from django.shortcuts import render, redirect
 from django.urls.base import reverse
@@ -7,19 +6,15 @@ from django.contrib.auth.models import User
 from django.contrib.auth import login, logout 
 from django.contrib import messages
 from django.conf import settings
+from employees import avatars
+from . import auth, graph
 
-AUTHORITY = "https://login.microsoftonline.com/" + settings.MSAL_TENANT_ID
 ENDPOINT = 'https://graph.microsoft.com/v1.0/users'
-SCOPE = ['User.Read'] 
-SESSION_TYPE = "filesystem"  # So the token cache will be stored in a server-side session
 
 REDIRECT_AFTER_LOGIN = 'clients:list'
 REDIRECT_LOGIN = 'sso:login'
 CALLBACK_URL = 'sso:callback'
 
-def _build_msal_app(cache=None):
-    return msal.ConfidentialClientApplication(settings.MSAL_CLIENT_ID, settings.MSAL_CLIENT_SECRET, AUTHORITY, token_cache=cache)
-
 def login_page(request):
     if request.user.is_authenticated:
         login_next = request.session.get('login_next')
@@ -35,8 +30,7 @@ def login_page(request):
 
 def sso_redirect(request):
     request.session['state'] = str(uuid.uuid4())
-    auth_url = _build_msal_app().get_authorization_request_url(
-        SCOPE,  
+    auth_url = auth.get_authorization_request_url(
         state=request.session['state'],
         redirect_uri=request.build_absolute_uri(reverse(CALLBACK_URL)))
     return redirect(auth_url)
@@ -46,7 +40,7 @@ def sso_callback(request):
         messages.info(request, "Please, try again." )
         return redirect (REDIRECT_LOGIN)
     
-    token = _build_msal_app().acquire_token_by_authorization_code(request.GET['code'], SCOPE, request.build_absolute_uri(reverse(CALLBACK_URL)))
+    token = auth.acquire_token_by_authorization_code(request.GET['code'], request.build_absolute_uri(reverse(CALLBACK_URL)))
     
     if "error" in token:
         messages.error(request, token['error'] + ": " + token['error_description'])
@@ -54,8 +48,11 @@ def sso_callback(request):
     if not token:
         return redirect (REDIRECT_LOGIN)
     
-    headers = {'Authorization': 'Bearer ' + token['access_token']}
-    graph_data = requests.get('https://graph.microsoft.com/v1.0/me/', headers=headers,).json()
+    try:
+        graph_data, photo_metadata = graph.get_client().get_profile_and_photo_metadata(token['access_token'])
+    except requests.RequestException:
+        messages.error(request, "Could not read your profile from Microsoft, please try again.")
+        return redirect (REDIRECT_LOGIN)
     try:
         user = User.objects.get(username=graph_data['userPrincipalName'])
     except User.DoesNotExist:
@@ -71,9 +68,7 @@ def sso_callback(request):
         user.last_name = graph_data['surname']
         user.save()
     messages.success(request, "You've been logged in")
-    avatar_request = requests.get('https://graph.microsoft.com/v1.0/me/photo/$value', headers=headers,)
-    if avatar_request.status_code == requests.codes.ok:
-        user.employee.sso_update_avatar(avatar_request.content)
+    avatars.schedule_refresh(user.employee, token['access_token'], photo_metadata)
     return redirect (REDIRECT_LOGIN)
 
 def sso_logout(request):
@@ -82,4 +77,4 @@ def sso_logout(request):
     if request.method == 'POST':        
         logout(request)
         messages.success(request, "You've been logged out." )
-        return redirect(AUTHORITY + "/oauth2/v2.0/logout" + "?post_logout_redirect_uri=" + request.build_absolute_uri(reverse(REDIRECT_LOGIN)))
\ No newline at end of file
+        return redirect(settings.MSAL_AUTHORITY + "/oauth2/v2.0/logout" + "?post_logout_redirect_uri=" + request.build_absolute_uri(reverse(REDIRECT_LOGIN)))
\ No newline at end of file
@@ -0,0 +1,22 @@
+import re
+import unicodedata
+
+# Letters NFKD does not decompose into a base letter and a combining mark
+_special_letters = str.maketrans({
+    'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd', 'ø': 'o', 'Ø': 'o', 'æ': 'ae', 'Æ': 'ae',
+    'œ': 'oe', 'Œ': 'oe', 'ı': 'i', 'þ': 'th', 'Þ': 'th', 'ð': 'd', 'Ð': 'd',
+})
+_separators = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """
+    Lower-case ASCII words of text separated by single spaces, accents removed: "Łódź Sp. z o.o." -> "lodz sp z o o".
+    """
+    text = unicodedata.normalize('NFKD', str(text or '').translate(_special_letters))
+    text = ''.join(character for character in text if not unicodedata.combining(character)).casefold()
+    return _separators.sub(' ', text).strip()
+
+
+def make_search_key(*parts, max_length=255):
+    return normalize(' '.join(str(part) for part in parts if part))[:max_length].rstrip()
@@ -24,6 +24,8 @@ MSAL_TENANT_ID = os.environ.get('MSAL_TENANT_ID')
 
 if (not SECRET_KEY or not MSAL_CLIENT_SECRET or not MSAL_CLIENT_ID or not MSAL_TENANT_ID):
     raise ValueError("Environment variables not set")
+MSAL_AUTHORITY = os.environ.get('MSAL_AUTHORITY', "https://login.microsoftonline.com/" + MSAL_TENANT_ID)
+GRAPH_BASE_URL = os.environ.get('GRAPH_BASE_URL', 'https://graph.microsoft.com/v1.0')
     
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -65,6 +67,7 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'common.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,8 +77,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per request SQL query reporting, disabled unless an action is set: 'log', 'warn' or 'raise'
+# (the default in tests, see common.testing.TestRunner)
+QUERY_BUDGET_ACTION = os.environ.get('DJANGO_QUERY_BUDGET_ACTION', '')
+# Maximum number of queries per URL name, 'default' applies to views not listed
+QUERY_BUDGETS = {
+    'default': 30,
+}
+# How many times one query may repeat within a request before it is reported as an N+1
+QUERY_BUDGET_DUPLICATES = 5
+
+TEST_RUNNER = 'common.testing.TestRunner'
+
 ROOT_URLCONF = 'workify.urls'
 
+# Avatars are refreshed from Microsoft Graph in the background, at most once per interval (seconds)
+AVATAR_REFRESH_INTERVAL = 24 * 60 * 60
+AVATAR_REFRESH_WORKERS = 2
+# Threads building avatar and logo renditions after uploads; 0 builds them right after the commit
+IMAGE_RENDITION_WORKERS = 2
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -106,6 +127,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# 'locmem' for development, 'file' or 'redis' (requires the redis package) when several processes serve the app
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'workify'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR.parent, 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/0'),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', CACHE_DEFAULT_LOCATION),
+        'TIMEOUT': int(os.environ.get('DJANGO_CACHE_TIMEOUT', 300)),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -146,6 +187,17 @@ STATIC_ROOT = os.path.join(BASE_DIR.parent, 'staticfiles')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR.parent, 'media')
 
+# Let the front-end server send downloaded files: '' (Django streams them), 'x-sendfile' or 'x-accel-redirect'.
+# For nginx, FILE_OFFLOAD_PREFIX must be an internal location aliased to MEDIA_ROOT.
+FILE_OFFLOAD = os.environ.get('DJANGO_FILE_OFFLOAD', '')
+FILE_OFFLOAD_PREFIX = os.environ.get('DJANGO_FILE_OFFLOAD_PREFIX', '/protected-media/')
+
+# Currency of the exchange rate table: rates are units of a currency per one unit of it (the ECB publishes EUR rates).
+FX_BASE_CURRENCY = os.environ.get('DJANGO_FX_BASE_CURRENCY', 'EUR')
+
+# Seconds autocomplete results are cached for an identical query; saving a row invalidates them earlier.
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -158,4 +210,20 @@ LOGIN_URL = "sso:login"
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
     messages.ERROR: 'danger',
-}
\ No newline at end of file
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'workify': {
+            'handlers': ['console'],
+            'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
@@ -26,5 +26,6 @@ urlpatterns = [
     path('projects/', include('projects.urls')),
     path('account/', include('sso.urls')),
     path('budgets/', include('budgets.urls')),
+    path('', include('common.urls')),
 ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file